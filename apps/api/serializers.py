@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from apps.characters.models import Player, Enemy
-from apps.battles.models import Battle
-from apps.world.models import Location, Quest
+from apps.battles.models import Battle, BattleParticipant, Raid
+from apps.battles.raids import get_hp_reader
+from apps.battles.roster import load_battle_rosters
+from apps.world.models import Location, PlayerQuest, Quest, QuestObjectiveProgress
 from apps.lessons.models import Lesson, Challenge
 
 
@@ -30,19 +32,68 @@ class EnemySerializer(serializers.ModelSerializer):
         ]
 
 
+class BattleParticipantSerializer(serializers.ModelSerializer):
+    """Serializer for BattleParticipant with its resolved character"""
+    name = serializers.CharField(source='character.name', read_only=True, default=None)
+    level = serializers.IntegerField(source='character.level', read_only=True, default=None)
+    current_hp = serializers.IntegerField(source='character.current_hp', read_only=True, default=None)
+    max_hp = serializers.IntegerField(source='character.max_hp', read_only=True, default=None)
+    current_mp = serializers.IntegerField(source='character.current_mp', read_only=True, default=None)
+    max_mp = serializers.IntegerField(source='character.max_mp', read_only=True, default=None)
+    
+    class Meta:
+        model = BattleParticipant
+        fields = [
+            'id', 'character_type', 'character_id', 'position', 'is_active',
+            'name', 'level', 'current_hp', 'max_hp', 'current_mp', 'max_mp',
+            'status_effects'
+        ]
+
+
+class BattleListSerializer(serializers.ListSerializer):
+    """Resolve every battle's roster in one query per character type"""
+    
+    def to_representation(self, data):
+        battles = load_battle_rosters(data.all() if hasattr(data, 'all') else data)
+        return super().to_representation(battles)
+
+
 class BattleSerializer(serializers.ModelSerializer):
     """Serializer for Battle model"""
     player = PlayerSerializer(read_only=True)
-    enemy = EnemySerializer(read_only=True)
+    participants = BattleParticipantSerializer(many=True, read_only=True)
     
     class Meta:
         model = Battle
+        list_serializer_class = BattleListSerializer
         fields = [
-            'id', 'player', 'enemy', 'player_hp', 'player_mp',
-            'enemy_hp', 'turn_count', 'is_complete', 'player_won',
-            'xp_reward', 'gold_reward', 'created_at'
+            'id', 'player', 'battle_type', 'location', 'is_active',
+            'current_turn', 'participants', 'victory',
+            'experience_gained', 'gold_gained', 'created_at'
         ]
         read_only_fields = ['created_at']
+    
+    def to_representation(self, instance):
+        # Batched already when serialized through BattleListSerializer
+        if not getattr(self.parent, 'many', False):
+            load_battle_rosters([instance])
+        return super().to_representation(instance)
+
+
+class RaidSerializer(serializers.ModelSerializer):
+    """Serializer for Raid model; hp is the aggregated (at most a second stale) shard total"""
+    enemy_name = serializers.CharField(source='enemy.name', read_only=True)
+    hp = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Raid
+        fields = [
+            'id', 'enemy', 'enemy_name', 'location', 'max_hp', 'hp',
+            'is_active', 'defeated_at', 'defeated_by', 'created_at'
+        ]
+    
+    def get_hp(self, obj):
+        return get_hp_reader().hp(obj.pk) if obj.is_active else 0
 
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -68,6 +119,22 @@ class QuestSerializer(serializers.ModelSerializer):
         ]
 
 
+class QuestObjectiveProgressSerializer(serializers.ModelSerializer):
+    """Serializer for a player's progress on one quest objective"""
+    class Meta:
+        model = QuestObjectiveProgress
+        fields = ['position', 'event_type', 'target', 'progress', 'required', 'completed']
+
+
+class PlayerQuestSerializer(serializers.ModelSerializer):
+    """Serializer for a quest a player has accepted"""
+    objectives = QuestObjectiveProgressSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = PlayerQuest
+        fields = ['id', 'quest', 'status', 'accepted_at', 'completed_at', 'objectives']
+
+
 class ChallengeSerializer(serializers.ModelSerializer):
     """Serializer for Challenge model"""
     class Meta:
@@ -1,17 +1,32 @@
+import math
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
 
-from apps.characters.models import Player, Enemy
-from apps.battles.models import Battle
+from apps.characters.models import Player
+from apps.characters.combatants import get_enemy_template
+from apps.battles.matchmaking import get_matchmaker
+from apps.battles.models import Battle, BattleParticipant, Raid
+from apps.battles.raids import raid_attack
+from apps.battles.roster import find_player_battle
+from apps.core.cache import cache_view
+from apps.core.routers import ReplicaReadsMixin
+from apps.core.sharding import get_from_any_shard, player_shards
 from apps.world.models import Location, Quest
+from apps.world.encounters import draw_encounter
+from apps.world.graph import graph_for_location
+from apps.world.spatial import get_spatial_index
+from apps.world.quests import accept_quest
 from apps.lessons.models import Lesson, Challenge
 
 from .serializers import (
-    PlayerSerializer, EnemySerializer, BattleSerializer,
-    LocationSerializer, QuestSerializer, LessonSerializer
+    PlayerSerializer, EnemySerializer, BattleSerializer, RaidSerializer,
+    LocationSerializer, QuestSerializer, LessonSerializer, PlayerQuestSerializer
 )
 
 
@@ -38,28 +53,90 @@ class BattleViewSet(viewsets.ModelViewSet):
     serializer_class = BattleSerializer
     permission_classes = [IsAuthenticated]
     
+    def _player_id(self):
+        return Player.objects.filter(user=self.request.user).values_list('pk', flat=True).first()
+    
     def get_queryset(self):
-        return Battle.objects.filter(player__user=self.request.user)
+        player_id = self._player_id()
+        if player_id is None:
+            return Battle.objects.none()
+        # Users live on the catalog database, so the player's user is fetched separately
+        return Battle.objects.filter(Battle.involving(player_id)).select_related('player').prefetch_related('player__user').order_by('-created_at')
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            pk = str(self.kwargs.get('pk', ''))
+            player_id = self._player_id()
+            if not player_shards() or not pk.isdigit() or player_id is None:
+                raise
+        # PvP battles on the opponent's shard
+        battle = find_player_battle(int(pk), player_id)
+        if battle is None:
+            raise Http404
+        self.check_object_permissions(self.request, battle)
+        return battle
     
     @action(detail=False, methods=['post'])
     def start_battle(self, request):
-        """Start a new battle with a random enemy"""
+        """Start a new battle with an enemy drawn from the location's encounter table"""
         player = get_object_or_404(Player, user=request.user)
-        enemy = Enemy.objects.filter(is_active=True).order_by('?').first()
+        location_id = request.data.get('location_id') or player.current_location_id
+        try:
+            location_id = int(location_id) if location_id else None
+        except (TypeError, ValueError):
+            return Response({'error': 'location_id must be a location id'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        enemy_id = None
+        if location_id:
+            story_flags = [flag for flag, value in player.story_flags.items() if value]
+            enemy_id = draw_encounter(location_id, player.level, story_flags)
         
-        if not enemy:
+        enemy = get_enemy_template(enemy_id) if enemy_id is not None else None
+        if enemy is None:
             return Response({'error': 'No enemies available'}, status=status.HTTP_400_BAD_REQUEST)
         
         battle = Battle.objects.create(
             player=player,
-            enemy=enemy,
-            player_hp=player.current_hp,
-            player_mp=player.current_mp,
-            enemy_hp=enemy.max_hp
+            battle_type='random',
+            location_id=location_id
         )
+        BattleParticipant.objects.bulk_create([
+            BattleParticipant(battle=battle, character_type='player', character_id=player.pk, position=0),
+            BattleParticipant(
+                battle=battle, character_type='enemy', character_id=enemy.id, position=1,
+                current_hp=enemy.max_hp, current_mp=enemy.max_mp
+            ),
+        ])
         
         return Response(BattleSerializer(battle).data, status=status.HTTP_201_CREATED)
     
+    @action(detail=False, methods=['get', 'post', 'delete'])
+    def matchmaking(self, request):
+        """Join (POST), poll (GET) or leave (DELETE) the PvP queue"""
+        player = get_object_or_404(Player, user=request.user)
+        matchmaker = get_matchmaker()
+        
+        if request.method == 'DELETE':
+            return Response({'queued': False, 'left': matchmaker.leave(player.pk)})
+        
+        if request.method == 'POST':
+            battle = matchmaker.join(player)
+        else:
+            battle_id = matchmaker.poll(player.pk)
+            # PvP battles live on the shard of the player who was queued first
+            battle = get_from_any_shard(Battle, battle_id) if battle_id is not None else None
+        
+        if battle is not None:
+            return Response(BattleSerializer(battle).data, status=status.HTTP_201_CREATED)
+        return Response({'queued': matchmaker.is_queued(player.pk)}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'], url_path='matchmaking/metrics', permission_classes=[IsAdminUser])
+    def matchmaking_metrics(self, request):
+        """Queue depth and time-to-match for this worker's matchmaker (staff only)"""
+        return Response(get_matchmaker().metrics())
+    
     @action(detail=True, methods=['post'])
     def player_action(self, request, pk=None):
         """Execute a player action in battle"""
@@ -120,23 +197,129 @@ class BattleViewSet(viewsets.ModelViewSet):
         })
 
 
-class LocationViewSet(viewsets.ReadOnlyModelViewSet):
+class RaidViewSet(viewsets.ReadOnlyModelViewSet):
+    """API endpoints for co-op raids"""
+    serializer_class = RaidSerializer
+    permission_classes = [IsAuthenticated]
+    queryset = Raid.objects.select_related('enemy').order_by('-created_at')
+    
+    @action(detail=True, methods=['post'])
+    def attack(self, request, pk=None):
+        """Hit the raid boss once"""
+        raid = self.get_object()
+        if not raid.is_active:
+            return Response({'error': 'Raid is over'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        player = get_object_or_404(Player, user=request.user)
+        hit = raid_attack(raid, player)
+        return Response({
+            'damage': hit.damage,
+            'hp': hit.hp,
+            'defeated': hit.defeated,
+            'killing_blow': hit.killing_blow,
+        })
+
+
+@method_decorator(cache_view(tags=['world.location']), name='list')
+@method_decorator(cache_view(tags=['world.location']), name='retrieve')
+class LocationViewSet(ReplicaReadsMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoints for world locations"""
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticated]
     queryset = Location.objects.all()
+    
+    def _graph(self, location_id):
+        try:
+            location_id = int(location_id)
+        except ValueError:
+            raise Http404("No location found")
+        graph = graph_for_location(location_id)
+        if graph is None or location_id not in graph:
+            raise Http404("No location found")
+        return graph
+    
+    @action(detail=True, methods=['get'])
+    def neighbors(self, request, pk=None):
+        """Directly connected locations and their distances (from the in-memory world graph)"""
+        graph = self._graph(pk)
+        return Response({
+            'location': int(pk),
+            'neighbors': [{'id': location_id, 'distance': distance} for location_id, distance in graph.neighbors(int(pk))],
+        })
+    
+    def _spatial_query(self, index, kinds=None):
+        """Entries of a spatial index in ?x0=&y0=&x1=&y1= (viewport) or ?x=&y=&r= (radius)"""
+        params = self.request.query_params
+        names = ('x', 'y', 'r') if 'r' in params else ('x0', 'y0', 'x1', 'y1')
+        try:
+            values = [float(params[name]) for name in names]
+            # float() accepts 'inf' and 'nan', which the grid cannot place in a cell
+            if not all(math.isfinite(value) for value in values) or ('r' in params and values[2] < 0):
+                raise ValueError
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Give a viewport (x0, y0, x1, y1) or a point and radius (x, y, r)'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        entries = index.query_radius(*values, kinds) if 'r' in params else index.query_rect(*values, kinds)
+        return Response({'count': len(entries), 'results': entries})
+    
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """Locations and visible item spawns of ?world=<id> inside a viewport or radius"""
+        try:
+            world_id = int(request.query_params['world'])
+        except (KeyError, ValueError):
+            return Response({'error': 'world must be a world id'}, status=status.HTTP_400_BAD_REQUEST)
+        index = get_spatial_index('world', world_id)
+        if index is None:
+            raise Http404("No world found")
+        kinds = request.query_params.get('kinds')
+        return self._spatial_query(index, kinds.split(',') if kinds else None)
+    
+    @action(detail=True, methods=['get'])
+    def entities(self, request, pk=None):
+        """NPC spawns inside a viewport or radius of this location's scene"""
+        index = get_spatial_index('location', int(pk)) if str(pk).isdigit() else None
+        if index is None:
+            raise Http404("No location found")
+        return self._spatial_query(index)
+    
+    @action(detail=True, methods=['get'])
+    def path(self, request, pk=None):
+        """Shortest travel path to ?to=<location id>, for fast travel"""
+        try:
+            target = int(request.query_params['to'])
+        except (KeyError, ValueError):
+            return Response({'error': 'to must be a location id'}, status=status.HTTP_400_BAD_REQUEST)
+        graph = self._graph(pk)
+        distance, path = graph.shortest_path(int(pk), target)
+        if not path:
+            return Response({'error': 'No route between these locations'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'distance': distance, 'path': path})
 
 
-class QuestViewSet(viewsets.ReadOnlyModelViewSet):
+@method_decorator(cache_view(tags=['world.quest', 'world.location']), name='list')
+@method_decorator(cache_view(tags=['world.quest', 'world.location']), name='retrieve')
+class QuestViewSet(ReplicaReadsMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoints for quests"""
     serializer_class = QuestSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         return Quest.objects.all()
+    
+    @action(detail=True, methods=['post'])
+    def accept(self, request, pk=None):
+        """Accept a quest; its objectives are tracked from game events from now on"""
+        player = get_object_or_404(Player, user=request.user)
+        player_quest = accept_quest(player, self.get_object())
+        return Response(PlayerQuestSerializer(player_quest).data, status=status.HTTP_201_CREATED)
 
 
-class LessonViewSet(viewsets.ReadOnlyModelViewSet):
+@method_decorator(cache_view(tags=['lessons.lesson', 'lessons.challenge']), name='list')
+@method_decorator(cache_view(tags=['lessons.lesson', 'lessons.challenge']), name='retrieve')
+class LessonViewSet(ReplicaReadsMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoints for Python lessons"""
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated]
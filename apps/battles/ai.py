@@ -0,0 +1,184 @@
+"""
+Table-driven enemy AI
+
+Enemy.skill_weights ({"attack": 0.8, "defend": 0.2, ...}) is compiled
+once into a cumulative distribution, Enemy.ai_type picks a strategy from
+the registry, and each strategy picks targets with a named policy.
+Decisions for every enemy in an encounter are made in one pass over a
+shared view of the targets, so a five-enemy turn does the same setup
+work as a one-enemy turn.
+"""
+import random
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache
+from itertools import accumulate
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+DEFAULT_WEIGHTS = {'attack': 1.0}
+LOW_HP_RATIO = 0.3
+
+# Enemy skills (any skill_weights entry other than attack/defend)
+SKILL_MP_COST = 5
+SKILL_POWER = 1.5
+
+# What an enemy AI sees of a potential target
+TargetView = namedtuple('TargetView', ['participant_id', 'current_hp', 'max_hp', 'threat'])
+
+
+class ActionDistribution:
+    """Cumulative distribution over an enemy's weighted actions"""
+    
+    __slots__ = ('actions', 'cumulative', 'total')
+    
+    def __init__(self, actions: Sequence[str], weights: Sequence[float]):
+        self.actions = tuple(actions)
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+    
+    def sample(self, rng=random) -> str:
+        index = bisect_right(self.cumulative, rng.random() * self.total)
+        return self.actions[min(index, len(self.actions) - 1)]
+
+
+@lru_cache(maxsize=1024)
+def _compile(items: Tuple[Tuple[str, float], ...]) -> ActionDistribution:
+    actions = [name for name, weight in items if weight > 0]
+    weights = [weight for name, weight in items if weight > 0]
+    return ActionDistribution(actions, weights)
+
+
+def compile_skill_weights(skill_weights: Optional[Dict[str, float]]) -> ActionDistribution:
+    """Compiled (and memoized) distribution for a skill_weights mapping"""
+    items = tuple(sorted(
+        (str(name), float(weight))
+        for name, weight in (skill_weights or {}).items()
+        if isinstance(weight, (int, float)) and weight > 0
+    ))
+    return _compile(items or tuple(DEFAULT_WEIGHTS.items()))
+
+
+# Target policies: (targets, rng) -> TargetView
+
+def lowest_hp(targets: List[TargetView], rng=random) -> TargetView:
+    return min(targets, key=lambda t: (t.current_hp, t.participant_id))
+
+
+def highest_threat(targets: List[TargetView], rng=random) -> TargetView:
+    return max(targets, key=lambda t: (t.threat, -t.participant_id))
+
+
+def random_target(targets: List[TargetView], rng=random) -> TargetView:
+    return targets[int(rng.random() * len(targets))]
+
+
+TARGET_POLICIES: Dict[str, Callable] = {
+    'lowest_hp': lowest_hp,
+    'highest_threat': highest_threat,
+    'random': random_target,
+}
+
+# Policies whose pick only depends on the targets, so one pick serves every enemy in a pass
+SHARED_POLICIES = {'lowest_hp', 'highest_threat'}
+
+
+def pick_target(policy: str, targets: List[TargetView], rng=random, picks: Optional[Dict] = None) -> TargetView:
+    if picks is not None and policy in picks:
+        return picks[policy]
+    target = TARGET_POLICIES[policy](targets, rng)
+    if picks is not None and policy in SHARED_POLICIES:
+        picks[policy] = target
+    return target
+
+
+# Strategies
+
+AI_STRATEGIES: Dict[str, 'AIStrategy'] = {}
+
+
+def register_strategy(name: str):
+    """Class decorator adding a strategy to the registry under an ai_type"""
+    def decorator(cls):
+        AI_STRATEGIES[name] = cls()
+        return cls
+    return decorator
+
+
+class AIStrategy:
+    """Base strategy: sample an action, then pick a target by policy"""
+    target_policy = 'random'
+    
+    def choose_action(self, enemy, distribution: ActionDistribution, rng) -> str:
+        return distribution.sample(rng)
+    
+    def decide(self, enemy, targets: List[TargetView], rng=random, picks: Optional[Dict] = None) -> Dict:
+        action = self.choose_action(enemy, compile_skill_weights(enemy.skill_weights), rng)
+        if action == 'defend' or not targets:
+            return {'action': action}
+        target = pick_target(self.target_policy, targets, rng, picks)
+        return {'action': action, 'target': target.participant_id}
+
+
+@register_strategy('aggressive')
+class AggressiveStrategy(AIStrategy):
+    """Finish off the weakest target"""
+    target_policy = 'lowest_hp'
+
+
+@register_strategy('balanced')
+class BalancedStrategy(AIStrategy):
+    """Go after whoever hits hardest"""
+    target_policy = 'highest_threat'
+
+
+@register_strategy('defensive')
+class DefensiveStrategy(AIStrategy):
+    """Guard when badly hurt, otherwise pressure the biggest threat"""
+    target_policy = 'highest_threat'
+    
+    def choose_action(self, enemy, distribution, rng):
+        if enemy.current_hp < enemy.max_hp * LOW_HP_RATIO:
+            return 'defend'
+        return distribution.sample(rng)
+
+
+@register_strategy('random')
+class RandomStrategy(AIStrategy):
+    target_policy = 'random'
+
+
+DEFAULT_STRATEGY = 'aggressive'
+
+
+def get_strategy(ai_type: Optional[str]) -> AIStrategy:
+    return AI_STRATEGIES.get(ai_type) or AI_STRATEGIES[DEFAULT_STRATEGY]
+
+
+def target_view(participant_id: int, character, current_hp: Optional[int] = None) -> TargetView:
+    """Build the AI's view of a character"""
+    return TargetView(
+        participant_id=participant_id,
+        current_hp=character.current_hp if current_hp is None else current_hp,
+        max_hp=character.max_hp,
+        threat=max(character.attack, character.magic_attack),
+    )
+
+
+def decide_enemy_actions(enemies: Sequence[Tuple[object, object]], targets: List[TargetView], rng=random) -> Dict:
+    """
+    Decide every enemy's action in one pass
+    
+    Args:
+        enemies: (key, enemy) pairs; enemy needs ai_type, skill_weights,
+            current_hp and max_hp (EnemyCombatant or Enemy)
+        targets: views of the living opponents, shared by all enemies
+    
+    Returns:
+        {key: {'action': ..., 'target': participant_id}}
+    """
+    picks = {}
+    return {
+        key: get_strategy(enemy.ai_type).decide(enemy, targets, rng, picks)
+        for key, enemy in enemies
+    }
@@ -93,75 +93,7 @@ def execute_python_code(request):
     try:
         data = json.loads(request.body)
         code = data.get('code', '')
-        
-        # Validate code first
-        is_safe, message = CodeValidator.is_safe(code)
-        if not is_safe:
-            return JsonResponse({
-                'success': False,
-                'output': message,
-                'error': message,
-                'damage': 0
-            })
-        
-        # Set up string buffers to capture output
-        stdout_buffer = io.StringIO()
-        stderr_buffer = io.StringIO()
-        
-        # Create a restricted environment
-        restricted_globals = {
-            '__builtins__': SAFE_BUILTINS,
-            '__name__': '__main__',
-            '__doc__': None,
-            '__package__': None,
-        }
-        
-        # Execute the code with output redirection
-        try:
-            with redirect_stdout(stdout_buffer), redirect_stderr(stderr_buffer):
-                exec(code, restricted_globals, {})
-            
-            stdout_output = stdout_buffer.getvalue()
-            stderr_output = stderr_buffer.getvalue()
-            
-            # Calculate damage based on actual execution
-            damage = calculate_damage_from_execution(code, stdout_output, stderr_output)
-            
-            return JsonResponse({
-                'success': True,
-                'output': stdout_output,
-                'error': stderr_output,
-                'damage': damage
-            })
-            
-        except SyntaxError as e:
-            return JsonResponse({
-                'success': False,
-                'output': '',
-                'error': f"SyntaxError: {str(e)} on line {e.lineno}",
-                'damage': 0
-            })
-        except NameError as e:
-            return JsonResponse({
-                'success': False,
-                'output': '',
-                'error': f"NameError: {str(e)}",
-                'damage': 0
-            })
-        except TypeError as e:
-            return JsonResponse({
-                'success': False,
-                'output': '',
-                'error': f"TypeError: {str(e)}",
-                'damage': 0
-            })
-        except Exception as e:
-            return JsonResponse({
-                'success': False,
-                'output': '',
-                'error': f"{type(e).__name__}: {str(e)}",
-                'damage': 0
-            })
+        return JsonResponse(run_player_code(code))
             
     except json.JSONDecodeError:
         return JsonResponse({
@@ -179,6 +111,78 @@ def execute_python_code(request):
         }, status=500)
 
 
+def run_player_code(code):
+    """Validate and execute player code; shared by the HTTP endpoint and the battle socket"""
+    # Validate code first
+    is_safe, message = CodeValidator.is_safe(code)
+    if not is_safe:
+        return {
+            'success': False,
+            'output': message,
+            'error': message,
+            'damage': 0
+        }
+    
+    # Set up string buffers to capture output
+    stdout_buffer = io.StringIO()
+    stderr_buffer = io.StringIO()
+    
+    # Create a restricted environment
+    restricted_globals = {
+        '__builtins__': SAFE_BUILTINS,
+        '__name__': '__main__',
+        '__doc__': None,
+        '__package__': None,
+    }
+    
+    # Execute the code with output redirection
+    try:
+        with redirect_stdout(stdout_buffer), redirect_stderr(stderr_buffer):
+            exec(code, restricted_globals, {})
+        
+        stdout_output = stdout_buffer.getvalue()
+        stderr_output = stderr_buffer.getvalue()
+        
+        # Calculate damage based on actual execution
+        damage = calculate_damage_from_execution(code, stdout_output, stderr_output)
+        
+        return {
+            'success': True,
+            'output': stdout_output,
+            'error': stderr_output,
+            'damage': damage
+        }
+        
+    except SyntaxError as e:
+        return {
+            'success': False,
+            'output': '',
+            'error': f"SyntaxError: {str(e)} on line {e.lineno}",
+            'damage': 0
+        }
+    except NameError as e:
+        return {
+            'success': False,
+            'output': '',
+            'error': f"NameError: {str(e)}",
+            'damage': 0
+        }
+    except TypeError as e:
+        return {
+            'success': False,
+            'output': '',
+            'error': f"TypeError: {str(e)}",
+            'damage': 0
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'output': '',
+            'error': f"{type(e).__name__}: {str(e)}",
+            'damage': 0
+        }
+
+
 def calculate_damage_from_execution(code, stdout, stderr):
     """Calculate damage based on actual code execution"""
     damage = 0
@@ -0,0 +1,99 @@
+"""
+Archival of finished battles
+
+A completed battle's turns are packed into a single zlib-compressed,
+versioned blob (BattleArchive) and the hot battle_turns rows are deleted.
+The payload is columnar: one list of field names followed by one list of
+values per turn, so repeated keys are not stored per row.
+"""
+import json
+import zlib
+from typing import Dict, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Battle, BattleArchive, BattleTurn
+
+
+ARCHIVE_FORMAT_VERSION = 1
+
+TURN_FIELDS = [
+    'id', 'turn_number', 'actor_id', 'action_type', 'action_data',
+    'code_submitted', 'code_output', 'code_errors', 'execution_successful',
+    'damage_dealt', 'healing_done', 'created_at',
+]
+
+
+class ArchiveError(Exception):
+    """Raised when a battle can't be archived or an archive can't be read"""
+
+
+def encode_turns(turns: List[Dict]) -> bytes:
+    """Pack turn dicts (TURN_FIELDS plus 'target_ids') into a compressed payload"""
+    fields = TURN_FIELDS + ['target_ids']
+    document = {
+        'v': ARCHIVE_FORMAT_VERSION,
+        'fields': fields,
+        'turns': [[turn[field] for field in fields] for turn in turns],
+    }
+    raw = json.dumps(document, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'), 9)
+
+
+def _decode_v1(document: Dict) -> List[Dict]:
+    fields = document['fields']
+    return [dict(zip(fields, values)) for values in document['turns']]
+
+
+DECODERS = {
+    1: _decode_v1,
+}
+
+
+def decode_turns(payload: bytes) -> List[Dict]:
+    """Unpack a payload written by any supported format version"""
+    document = json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+    decoder = DECODERS.get(document.get('v'))
+    if decoder is None:
+        raise ArchiveError(f"Unsupported battle archive version: {document.get('v')}")
+    return decoder(document)
+
+
+def _hot_turns(battle: Battle) -> List[Dict]:
+    """Read a battle's turns and target links as dicts (two queries)"""
+    db = battle._state.db
+    turns = list(BattleTurn.objects.using(db).filter(battle=battle).order_by('turn_number').values(*TURN_FIELDS))
+    targets = {}
+    links = BattleTurn.targets.through.objects.using(db).filter(battleturn__battle=battle).order_by('id')
+    for turn_id, participant_id in links.values_list('battleturn_id', 'battleparticipant_id'):
+        targets.setdefault(turn_id, []).append(participant_id)
+    for turn in turns:
+        turn['target_ids'] = targets.get(turn['id'], [])
+    return turns
+
+
+def archive_battle(battle: Battle) -> BattleArchive:
+    """Pack a finished battle's turns into one archive row and delete the hot rows"""
+    if battle.is_active:
+        raise ArchiveError(f"Battle {battle.pk} is still active")
+    
+    db = battle._state.db
+    with transaction.atomic(using=db):
+        turns = _hot_turns(battle)
+        archive = BattleArchive.objects.using(db).create(
+            battle=battle,
+            format_version=ARCHIVE_FORMAT_VERSION,
+            turn_count=len(turns),
+            payload=encode_turns(turns),
+        )
+        BattleTurn.objects.using(db).filter(battle=battle).delete()
+    return archive
+
+
+def load_battle_history(battle: Battle) -> List[Dict]:
+    """Turn history for replays: decoded from the archive if present, otherwise the hot rows"""
+    archive = BattleArchive.objects.using(battle._state.db).filter(battle=battle).first()
+    if archive is not None:
+        return decode_turns(archive.payload)
+    return _hot_turns(battle)
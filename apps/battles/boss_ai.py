@@ -0,0 +1,202 @@
+"""
+Time-budgeted lookahead search for boss battles
+
+Bosses plan with an iterative-deepening expectimax over a compact,
+immutable model of the battle (tuples of numbers, no ORM objects):
+
+- max node:     the boss picks attack/skill/defend and a target
+- chance node:  the boss's hit either crits (CRIT_CHANCE) or not
+- response:     every standing opponent hits the boss for expected damage,
+                then damage-over-time effects tick
+
+A transposition table caches evaluated (state, depth) pairs and the
+search stops at a hard per-decision time budget, returning the best move
+of the deepest completed iteration. Statistics for the last searches are
+kept in RECENT_STATS for tuning.
+"""
+import logging
+import time
+from collections import deque, namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from .ai import SKILL_MP_COST, SKILL_POWER
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 0.020  # Seconds per decision
+MAX_DEPTH = 12
+CRIT_CHANCE = 0.1
+WIN_SCORE = 1000.0
+TABLE_LIMIT = 200000
+
+# side: 0 = the boss's opponents, 1 = the boss's side
+Unit = namedtuple('Unit', [
+    'pid', 'side', 'hp', 'max_hp', 'mp',
+    'attack', 'defense', 'magic_attack', 'magic_defense',
+    'dot', 'stunned', 'guard',
+])
+
+SearchStats = namedtuple('SearchStats', ['nodes', 'depth', 'elapsed', 'nodes_per_second', 'table_hits'])
+
+RECENT_STATS = deque(maxlen=100)
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def _damage(attacker: Unit, defender: Unit, power: float = 1.0, magical: bool = False) -> int:
+    """Expected (variance-free) damage using GameEngine's formula"""
+    if magical:
+        damage = max(1, int(attacker.magic_attack * power - defender.magic_defense / 2))
+    else:
+        damage = max(1, int(attacker.attack * power - defender.defense / 2))
+    return max(1, damage // 2) if defender.guard else damage
+
+
+def _replace(units: Tuple[Unit, ...], index: int, **changes) -> Tuple[Unit, ...]:
+    return units[:index] + (units[index]._replace(**changes),) + units[index + 1:]
+
+
+class BossSearch:
+    """Expectimax planner for one boss decision"""
+    
+    def __init__(self, budget: float = DEFAULT_BUDGET, max_depth: int = MAX_DEPTH):
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table: Dict = {}
+        self.nodes = 0
+        self.table_hits = 0
+        self.deadline = 0.0
+    
+    # Model
+    
+    def actions(self, units: Tuple[Unit, ...], boss: int, allowed) -> List[Tuple[str, Optional[int]]]:
+        me = units[boss]
+        targets = [i for i, u in enumerate(units) if u.side != me.side and u.hp > 0]
+        moves = []
+        if 'attack' in allowed:
+            moves.extend(('attack', i) for i in targets)
+        if 'skill' in allowed and me.mp >= SKILL_MP_COST:
+            moves.extend(('skill', i) for i in targets)
+        if 'defend' in allowed:
+            moves.append(('defend', None))
+        return moves or [('attack', i) for i in targets]
+    
+    def apply(self, units, boss, move, crit: bool):
+        """Boss move, then the opponents' expected response and end-of-round ticks"""
+        action, target = move
+        units = _replace(units, boss, guard=False)
+        me = units[boss]
+        
+        if action == 'defend':
+            units = _replace(units, boss, guard=True)
+        else:
+            magical = action == 'skill'
+            damage = _damage(me, units[target], SKILL_POWER if magical else 1.0, magical)
+            if crit:
+                damage *= 2
+            units = _replace(units, target, hp=max(0, units[target].hp - damage))
+            if magical:
+                units = _replace(units, boss, mp=me.mp - SKILL_MP_COST)
+        
+        # Opponents answer with expected damage
+        for i, unit in enumerate(units):
+            if unit.side != units[boss].side and unit.hp > 0 and not unit.stunned and units[boss].hp > 0:
+                hit = _damage(unit, units[boss]) * (1 + CRIT_CHANCE)
+                units = _replace(units, boss, hp=max(0, units[boss].hp - int(hit)))
+        
+        # Damage over time
+        for i, unit in enumerate(units):
+            if unit.dot and unit.hp > 0:
+                units = _replace(units, i, hp=max(0, unit.hp - unit.dot))
+        return units
+    
+    def evaluate(self, units, boss) -> float:
+        side = units[boss].side
+        mine = [u for u in units if u.side == side]
+        theirs = [u for u in units if u.side != side]
+        if all(u.hp <= 0 for u in theirs):
+            return WIN_SCORE
+        if all(u.hp <= 0 for u in mine):
+            return -WIN_SCORE
+        own = sum(u.hp / u.max_hp for u in mine) / len(mine)
+        foe = sum(u.hp / u.max_hp for u in theirs) / len(theirs)
+        # Downed opponents are worth more than chip damage spread around
+        downed = sum(1 for u in theirs if u.hp <= 0) / len(theirs)
+        return own - foe + downed
+    
+    # Search
+    
+    def value(self, units, boss, depth, allowed) -> float:
+        self.nodes += 1
+        if self.nodes & 63 == 0 and time.perf_counter() > self.deadline:
+            raise _OutOfTime()
+        
+        score = self.evaluate(units, boss)
+        if depth == 0 or abs(score) == WIN_SCORE:
+            return score
+        
+        key = (units, depth)
+        cached = self.table.get(key)
+        if cached is not None:
+            self.table_hits += 1
+            return cached
+        
+        best = -float('inf')
+        for move in self.actions(units, boss, allowed):
+            best = max(best, self.expected(units, boss, move, depth, allowed))
+        
+        if len(self.table) < TABLE_LIMIT:
+            self.table[key] = best
+        return best
+    
+    def expected(self, units, boss, move, depth, allowed) -> float:
+        if move[0] == 'defend':
+            return self.value(self.apply(units, boss, move, False), boss, depth - 1, allowed)
+        return (
+            CRIT_CHANCE * self.value(self.apply(units, boss, move, True), boss, depth - 1, allowed)
+            + (1 - CRIT_CHANCE) * self.value(self.apply(units, boss, move, False), boss, depth - 1, allowed)
+        )
+    
+    def plan(self, units: Tuple[Unit, ...], boss: int, allowed=('attack', 'skill', 'defend')) -> Tuple[Tuple[str, Optional[int]], SearchStats]:
+        """Best move for units[boss] within the time budget"""
+        start = time.perf_counter()
+        self.deadline = start + self.budget
+        moves = self.actions(units, boss, allowed)
+        best_move, depth_reached = moves[0], 0
+        
+        try:
+            for depth in range(1, self.max_depth + 1):
+                scored = [(self.expected(units, boss, move, depth, allowed), move) for move in moves]
+                best_score, best_move = max(scored, key=lambda item: item[0])
+                depth_reached = depth
+                if abs(best_score) == WIN_SCORE:
+                    break
+                # Search the previous best first next iteration
+                moves.sort(key=lambda move: move != best_move)
+        except _OutOfTime:
+            pass
+        
+        elapsed = time.perf_counter() - start
+        stats = SearchStats(
+            nodes=self.nodes,
+            depth=depth_reached,
+            elapsed=elapsed,
+            nodes_per_second=self.nodes / elapsed if elapsed else 0.0,
+            table_hits=self.table_hits,
+        )
+        RECENT_STATS.append(stats)
+        logger.debug("Boss search: %s", stats)
+        return best_move, stats
+
+
+def plan_boss_action(units: Tuple[Unit, ...], boss: int, allowed=('attack', 'skill', 'defend'),
+                     budget: float = DEFAULT_BUDGET) -> Dict:
+    """Decision dict in the same shape as apps.battles.ai strategies"""
+    (action, target), stats = BossSearch(budget).plan(units, boss, allowed)
+    decision = {'action': action, 'search': stats._asdict()}
+    if target is not None:
+        decision['target'] = units[target].pid
+    return decision
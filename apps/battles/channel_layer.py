@@ -0,0 +1,81 @@
+"""
+Minimal channel layer for fanning battle messages out to sockets
+
+Each connected socket owns a channel (a bounded asyncio queue) and joins
+the group for its battle. The in-memory implementation is enough for a
+single node and for tests; a shared implementation only needs the same
+five coroutines.
+"""
+import asyncio
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, Set
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class ChannelFull(Exception):
+    """Raised when a channel's queue is at capacity"""
+
+
+class InMemoryChannelLayer:
+    """Process-local channel layer"""
+
+    def __init__(self, capacity: int = 100, **options):
+        self.capacity = capacity
+        self._channels: Dict[str, asyncio.Queue] = {}
+        self._groups: Dict[str, Set[str]] = defaultdict(set)
+
+    def new_channel(self, prefix: str = 'battle') -> str:
+        name = f'{prefix}.{uuid.uuid4().hex}'
+        self._channels[name] = asyncio.Queue(maxsize=self.capacity)
+        return name
+
+    async def send(self, channel: str, message: dict):
+        queue = self._channels.get(channel)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel: str) -> dict:
+        return await self._channels[channel].get()
+
+    async def group_add(self, group: str, channel: str):
+        self._groups[group].add(channel)
+
+    async def group_discard(self, group: str, channel: str):
+        members = self._groups.get(group)
+        if members is not None:
+            members.discard(channel)
+            if not members:
+                del self._groups[group]
+        self._channels.pop(channel, None)
+
+    async def group_send(self, group: str, message: dict):
+        for channel in list(self._groups.get(group, ())):
+            try:
+                await self.send(channel, message)
+            except ChannelFull:
+                # A stalled client must not block the rest of the group
+                pass
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    """Process-wide layer configured by settings.BATTLE_CHANNEL_LAYER"""
+    global _layer
+    if _layer is None:
+        with _layer_lock:
+            if _layer is None:
+                config = getattr(settings, 'BATTLE_CHANNEL_LAYER', {})
+                layer_class = import_string(config.get('BACKEND', 'apps.battles.channel_layer.InMemoryChannelLayer'))
+                _layer = layer_class(**config.get('OPTIONS', {}))
+    return _layer
@@ -0,0 +1,169 @@
+"""
+Per-battle WebSocket endpoint: ws://<host>/ws/battles/<battle_id>/
+
+Authentication (session cookie, user and their place in the battle)
+happens once during the handshake; afterwards every action is a small
+JSON frame handled by BattleRunner (see apps.battles.runner for the message format).
+Results are broadcast to the battle's group, so every socket open on the
+same battle (e.g. a second tab) stays in sync.
+"""
+import asyncio
+import json
+import re
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.request import validate_host
+
+from apps.characters.models import Player
+from apps.core.sharding import activate_shard, player_shard, player_shards, shard_for_user
+
+from .channel_layer import get_channel_layer
+from .roster import find_player_battle
+from .runner import BattleRunner
+
+
+BATTLE_PATH = re.compile(r'^/ws/battles/(?P<battle_id>\d+)/$')
+
+# Application close codes
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+# Replies that only go back to the socket that asked
+PRIVATE_MESSAGES = {'err', 'pong'}
+
+# Expected type of each message field BattleRunner reads (bool is an int, so it is excluded below)
+MESSAGE_FIELDS = {'t': str, 'tgt': int, 'c': str, 's': int}
+
+
+def _headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _cookies(header):
+    cookies = {}
+    for part in header.split(';'):
+        name, _, value = part.strip().partition('=')
+        if name:
+            cookies[name] = value
+    return cookies
+
+
+def _valid_fields(payload):
+    """Whether the message has an action and correctly typed fields (absent or null optional fields are fine)"""
+    if not isinstance(payload.get('t'), str):
+        return False
+    for name, expected in MESSAGE_FIELDS.items():
+        value = payload.get(name)
+        if value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            return False
+    return True
+
+
+def _origin_allowed(headers):
+    """Reject cross-site handshakes; the socket authenticates with the session cookie"""
+    origin = headers.get('origin')
+    if not origin:
+        return True
+    host = urlsplit(origin).hostname or ''
+    allowed = settings.ALLOWED_HOSTS or (['localhost', '127.0.0.1', '[::1]'] if settings.DEBUG else [])
+    return validate_host(host, allowed)
+
+
+def _load_battle(session_key, battle_id):
+    """Resolve the session user and an active battle they fight in, as (battle, player_id), or None"""
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    if not user.is_authenticated:
+        return None
+    entry = shard_for_user(user.pk) if player_shards() else None
+    with player_shard(entry[0] if entry else None):
+        player_id = Player.objects.filter(user=user).values_list('pk', flat=True).first()
+        battle = find_player_battle(battle_id, player_id, is_active=True) if player_id is not None else None
+    return (battle, player_id) if battle is not None else None
+
+
+class BattleSocket:
+    """ASGI application serving battle WebSockets"""
+
+    def __init__(self, channel_layer=None):
+        self.channel_layer = channel_layer
+
+    async def __call__(self, scope, receive, send):
+        match = BATTLE_PATH.match(scope['path'])
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if match is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+            return
+
+        headers = _headers(scope)
+        session_key = _cookies(headers.get('cookie', '')).get(settings.SESSION_COOKIE_NAME)
+        loaded = None
+        if _origin_allowed(headers):
+            loaded = await sync_to_async(_load_battle)(session_key, int(match['battle_id']))
+        if loaded is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+            return
+        battle, player_id = loaded
+
+        # Everything this connection runs (in this task and its sync_to_async calls) uses the battle's shard
+        activate_shard(battle._state.db)
+        await send({'type': 'websocket.accept'})
+        await self.serve(battle, receive, send, player_id)
+
+    async def serve(self, battle, receive, send, player_id=None):
+        layer = self.channel_layer or get_channel_layer()
+        group = f'battle-{battle.pk}'
+        channel = layer.new_channel()
+        await layer.group_add(group, channel)
+        runner = await sync_to_async(BattleRunner)(battle, player_id=player_id)
+
+        client = asyncio.ensure_future(receive())
+        broadcast = asyncio.ensure_future(layer.receive(channel))
+        try:
+            for initial in await sync_to_async(runner.handle)({'t': 'state'}):
+                await self._send(send, initial)
+
+            while True:
+                done, _ = await asyncio.wait({client, broadcast}, return_when=asyncio.FIRST_COMPLETED)
+
+                if broadcast in done:
+                    await self._send(send, broadcast.result())
+                    broadcast = asyncio.ensure_future(layer.receive(channel))
+
+                if client in done:
+                    message = client.result()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    client = asyncio.ensure_future(receive())
+                    for reply in await self._dispatch(runner, message):
+                        if reply['t'] in PRIVATE_MESSAGES:
+                            await self._send(send, reply)
+                        else:
+                            await layer.group_send(group, reply)
+        finally:
+            client.cancel()
+            broadcast.cancel()
+            await layer.group_discard(group, channel)
+
+    async def _dispatch(self, runner, message):
+        try:
+            payload = json.loads(message.get('text') or '{}')
+        except ValueError:
+            return [{'t': 'err', 'm': 'Invalid message'}]
+        if not isinstance(payload, dict) or not _valid_fields(payload):
+            return [{'t': 'err', 'm': 'Invalid message'}]
+        if payload.get('t') == 'ping':
+            return [{'t': 'pong'}]
+        return await sync_to_async(runner.handle)(payload)
+
+    async def _send(self, send, payload):
+        await send({'type': 'websocket.send', 'text': json.dumps(payload, separators=(',', ':'))})
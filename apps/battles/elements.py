@@ -0,0 +1,90 @@
+"""
+Element affinity matrix for weakness/resistance lookups
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from apps.characters.models import Enemy
+from apps.core.game_engine import GameEngine
+
+from .models import ElementType
+
+
+WEAKNESS_MULTIPLIER = 2.0
+RESISTANCE_MULTIPLIER = 0.5
+NEUTRAL_MULTIPLIER = 1.0
+
+
+class ElementAffinityMatrix:
+    """
+    Precomputed (element, enemy) -> damage multiplier table
+
+    Built from ElementType and the Enemy.weak_to / Enemy.resistant_to
+    through tables in three queries. Only non-neutral pairs are stored,
+    so a missing key means a neutral hit.
+    """
+    
+    def __init__(self, element_ids: Iterable[int], affinities: Dict[Tuple[int, int], float]):
+        self.element_ids = frozenset(element_ids)
+        self.affinities = affinities
+    
+    @classmethod
+    def build(cls) -> 'ElementAffinityMatrix':
+        """Load the matrix from the database"""
+        element_ids = ElementType.objects.values_list('id', flat=True)
+        affinities = {}
+        
+        weak_rows = Enemy.weak_to.through.objects.values_list('elementtype_id', 'enemy_id')
+        for element_id, enemy_id in weak_rows:
+            affinities[(element_id, enemy_id)] = WEAKNESS_MULTIPLIER
+        
+        # An element listed as both weakness and resistance cancels out
+        resist_rows = Enemy.resistant_to.through.objects.values_list('elementtype_id', 'enemy_id')
+        for element_id, enemy_id in resist_rows:
+            key = (element_id, enemy_id)
+            affinities[key] = affinities.get(key, NEUTRAL_MULTIPLIER) * RESISTANCE_MULTIPLIER
+        
+        return cls(element_ids, affinities)
+    
+    def multiplier(self, element_id: Optional[int], enemy_id: Optional[int]) -> float:
+        """Damage multiplier for a skill element hitting an enemy"""
+        if element_id is None or enemy_id is None:
+            return NEUTRAL_MULTIPLIER
+        return self.affinities.get((element_id, enemy_id), NEUTRAL_MULTIPLIER)
+    
+    def multipliers(self, element_id: Optional[int], enemy_ids: Iterable[Optional[int]]) -> List[float]:
+        """Damage multipliers for one element against many enemies"""
+        if element_id is None:
+            return [NEUTRAL_MULTIPLIER for _ in enemy_ids]
+        get = self.affinities.get
+        return [get((element_id, enemy_id), NEUTRAL_MULTIPLIER) for enemy_id in enemy_ids]
+
+
+_matrix: Optional[ElementAffinityMatrix] = None
+_matrix_lock = threading.Lock()
+
+
+def get_affinity_matrix() -> ElementAffinityMatrix:
+    """Return the process-wide matrix, building it on first use"""
+    global _matrix
+    matrix = _matrix
+    if matrix is None:
+        with _matrix_lock:
+            if _matrix is None:
+                _matrix = ElementAffinityMatrix.build()
+            matrix = _matrix
+    return matrix
+
+
+def invalidate_affinity_matrix(**kwargs):
+    """Drop the cached matrix; the next lookup rebuilds it"""
+    global _matrix
+    with _matrix_lock:
+        _matrix = None
+
+
+def element_multiplier(element, enemy) -> float:
+    """Multiplier for an ElementType (or id) hitting an Enemy, EnemyTemplate, EnemyCombatant (or enemy id)"""
+    element_id = getattr(element, 'pk', element)
+    enemy_id = enemy if isinstance(enemy, int) else GameEngine._affinity_id(enemy)
+    return get_affinity_matrix().multiplier(element_id, enemy_id)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.battles.archive import archive_battle
+from apps.battles.models import Battle
+from apps.core.sharding import CATALOG_DATABASE, player_shards
+
+
+class Command(BaseCommand):
+    help = "Pack the turns of finished battles into compressed archive rows"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=1, help="Only archive battles finished this many days ago")
+        parser.add_argument('--limit', type=int, default=500, help="Maximum battles to archive in one run")
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        archived = 0
+        for alias in [CATALOG_DATABASE] + player_shards():
+            battles = Battle.objects.using(alias).filter(
+                is_active=False,
+                updated_at__lt=cutoff,
+                archive__isnull=True,
+            ).order_by('updated_at')[:options['limit'] - archived]
+            
+            for battle in battles:
+                archive_battle(battle)
+                archived += 1
+            if archived >= options['limit']:
+                break
+        
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} battle(s)"))
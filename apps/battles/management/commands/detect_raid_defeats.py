@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.battles.raids import detect_defeats
+
+
+class Command(BaseCommand):
+    help = "Close active raids whose boss HP has run out without a hit noticing"
+    
+    def handle(self, *args, **options):
+        defeated = detect_defeats()
+        for raid in defeated:
+            self.stdout.write(f"Closed raid {raid.pk}")
+        self.stdout.write(self.style.SUCCESS(f"Closed {len(defeated)} raid(s)"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.battles.sessions import get_session_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Flush buffered battle session state to the database. Needs a backend shared between processes "
+        "(SQLiteSessionBackend); web workers flush process-local sessions themselves"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Flush every stored session (crash recovery), not just those past the flush interval",
+        )
+    
+    def handle(self, *args, **options):
+        store = get_session_store()
+        if not getattr(store.backend, 'shared', True):
+            raise CommandError(
+                "Battle sessions live in each web worker's memory and are flushed there; set "
+                "BATTLE_SESSION_BACKEND=apps.battles.sessions.SQLiteSessionBackend to flush or recover them here"
+            )
+        if options['all']:
+            count = store.recover()
+        else:
+            count = store.flush_due()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {count} battle session(s)"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.battles.raids import DEFAULT_SHARDS, start_raid
+from apps.characters.models import Enemy
+from apps.world.models import Location
+
+
+class Command(BaseCommand):
+    help = "Open a co-op raid on an enemy template"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('enemy', type=int, help="Enemy id to raid")
+        parser.add_argument('--location', type=int, help="Location id the raid takes place at")
+        parser.add_argument('--hp', type=int, help="Boss HP (defaults to the enemy's max HP)")
+        parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help="Rows to split the boss HP across")
+    
+    def handle(self, *args, **options):
+        if options['shards'] < 1:
+            raise CommandError("--shards must be at least 1")
+        if options['hp'] is not None and options['hp'] < 1:
+            raise CommandError("--hp must be at least 1")
+        
+        try:
+            enemy = Enemy.objects.get(pk=options['enemy'])
+        except Enemy.DoesNotExist:
+            raise CommandError(f"No enemy with id {options['enemy']}")
+        
+        location = None
+        if options['location'] is not None:
+            try:
+                location = Location.objects.get(pk=options['location'])
+            except Location.DoesNotExist:
+                raise CommandError(f"No location with id {options['location']}")
+        
+        raid = start_raid(enemy, shards=options['shards'], location=location, max_hp=options['hp'])
+        self.stdout.write(self.style.SUCCESS(f"Started raid {raid.pk} on {enemy.name} ({raid.max_hp} HP)"))
@@ -0,0 +1,284 @@
+"""
+Rating-bucketed PvP matchmaking
+
+Queued players are indexed by rating bucket: a sorted list of occupied
+bucket keys (searched with bisect) and, per bucket, the waiting players
+in arrival order. A join looks for the oldest acceptable opponent in the
+nearest buckets first, so matching costs O(log b) for b occupied buckets
+plus the few buckets inside the rating window.
+
+The acceptable rating difference starts at BASE_WINDOW and widens with
+the time a player has waited, up to MAX_WINDOW. Waiting players are swept
+again (with their wider windows) whenever the queue is touched and the
+sweep interval has elapsed, so nobody has to rejoin to get matched.
+
+Matched pairs are handed off into a new 'pvp' Battle. Queue depth (total
+and per bucket) and time-to-match figures are available from metrics().
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque, namedtuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from apps.core.sharding import player_db
+
+from .models import Battle, BattleParticipant
+
+
+BASE_WINDOW = 1  # Rating points (levels)
+WIDEN_PER_SECOND = 0.1
+MAX_WINDOW = 10
+SWEEP_INTERVAL = 1.0  # Seconds
+
+QueueEntry = namedtuple('QueueEntry', ['player_id', 'rating', 'enqueued_at'])
+
+
+def player_rating(player) -> int:
+    """Matchmaking rating for a player (their level)"""
+    return player.level
+
+
+class LocalMatchmakingBackend:
+    """Process-local queue index, also used by the tests"""
+    
+    def __init__(self, bucket_size: int = 1, **options):
+        self.bucket_size = bucket_size
+        self._keys: List[int] = []
+        self._buckets: Dict[int, OrderedDict] = {}
+        self._entries: Dict[int, QueueEntry] = {}
+    
+    def bucket(self, rating: int) -> int:
+        return rating // self.bucket_size
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, player_id):
+        return player_id in self._entries
+    
+    def add(self, entry: QueueEntry):
+        key = self.bucket(entry.rating)
+        if key not in self._buckets:
+            insort(self._keys, key)
+            self._buckets[key] = OrderedDict()
+        self._buckets[key][entry.player_id] = entry
+        self._entries[entry.player_id] = entry
+    
+    def remove(self, player_id: int) -> Optional[QueueEntry]:
+        entry = self._entries.pop(player_id, None)
+        if entry is None:
+            return None
+        key = self.bucket(entry.rating)
+        bucket = self._buckets[key]
+        del bucket[player_id]
+        if not bucket:
+            del self._buckets[key]
+            del self._keys[bisect_left(self._keys, key)]
+        return entry
+    
+    def entries(self) -> List[QueueEntry]:
+        """Everyone waiting, longest wait first"""
+        return sorted(self._entries.values(), key=lambda entry: entry.enqueued_at)
+    
+    def nearby(self, rating: int, distance: float) -> Iterator[QueueEntry]:
+        """Entries within distance of rating, nearest buckets first and oldest first within a bucket"""
+        home = self.bucket(rating)
+        reach = int(distance // self.bucket_size) + 1
+        right = bisect_left(self._keys, home)
+        left = right - 1
+        while True:
+            # Step to whichever neighbouring bucket is closer to home
+            candidates = []
+            if left >= 0 and home - self._keys[left] <= reach:
+                candidates.append((home - self._keys[left], left))
+            if right < len(self._keys) and self._keys[right] - home <= reach:
+                candidates.append((self._keys[right] - home, right))
+            if not candidates:
+                return
+            _, index = min(candidates)
+            key = self._keys[index]
+            if index == left:
+                left -= 1
+            else:
+                right += 1
+            for entry in list(self._buckets.get(key, {}).values()):
+                if abs(entry.rating - rating) <= distance:
+                    yield entry
+    
+    def depth_by_bucket(self) -> Dict[int, int]:
+        return {key * self.bucket_size: len(self._buckets[key]) for key in self._keys}
+
+
+class Matchmaker:
+    """Thread-safe matchmaking service in front of a queue backend"""
+    
+    def __init__(self, backend=None, base_window: float = BASE_WINDOW, widen_per_second: float = WIDEN_PER_SECOND,
+                 max_window: float = MAX_WINDOW, sweep_interval: float = SWEEP_INTERVAL, clock=time.monotonic):
+        self.backend = backend or LocalMatchmakingBackend()
+        self.base_window = base_window
+        self.widen_per_second = widen_per_second
+        self.max_window = max_window
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._matched: Dict[int, int] = {}  # player_id -> battle_id, until the player collects it
+        self._wait_times = deque(maxlen=1000)
+        self.matches = 0
+    
+    def window(self, entry: QueueEntry, now: float) -> float:
+        """Acceptable rating difference after the entry's wait so far"""
+        return min(self.max_window, self.base_window + (now - entry.enqueued_at) * self.widen_per_second)
+    
+    def _pair(self, entry: QueueEntry, now: float) -> Optional[QueueEntry]:
+        """Best waiting opponent for entry; either player's window may accept the pairing"""
+        for candidate in self.backend.nearby(entry.rating, self.max_window):
+            if candidate.player_id == entry.player_id:
+                continue
+            if abs(candidate.rating - entry.rating) <= max(self.window(entry, now), self.window(candidate, now)):
+                return candidate
+        return None
+    
+    def _take(self, first: QueueEntry, second: QueueEntry, now: float) -> Tuple[QueueEntry, QueueEntry]:
+        self.backend.remove(first.player_id)
+        self.backend.remove(second.player_id)
+        self._wait_times.append(now - first.enqueued_at)
+        self._wait_times.append(now - second.enqueued_at)
+        self.matches += 1
+        return first, second
+    
+    def _sweep(self, now: float) -> List[Tuple[QueueEntry, QueueEntry]]:
+        pairs = []
+        for entry in self.backend.entries():
+            if entry.player_id not in self.backend:
+                continue
+            opponent = self._pair(entry, now)
+            if opponent is not None:
+                pairs.append(self._take(entry, opponent, now))
+        self._last_sweep = now
+        return pairs
+    
+    def _hand_off(self, pairs) -> List[Battle]:
+        battles = []
+        for first, second in pairs:
+            battle = create_pvp_battle(first.player_id, second.player_id)
+            with self._lock:
+                self._matched[first.player_id] = battle.pk
+                self._matched[second.player_id] = battle.pk
+            battles.append(battle)
+        return battles
+    
+    def join(self, player, rating: Optional[int] = None) -> Optional[Battle]:
+        """Queue a player; returns the new battle if they were matched straight away"""
+        now = self.clock()
+        entry = QueueEntry(player.pk, player_rating(player) if rating is None else rating, now)
+        with self._lock:
+            self._matched.pop(player.pk, None)
+            self.backend.remove(player.pk)
+            opponent = self._pair(entry, now)
+            if opponent is None:
+                self.backend.add(entry)
+                pairs = self._sweep(now) if now - self._last_sweep >= self.sweep_interval else []
+            else:
+                pairs = [self._take(opponent, entry, now)]
+        
+        match = None
+        for (first, second), battle in zip(pairs, self._hand_off(pairs)):
+            if player.pk in (first.player_id, second.player_id):
+                match = battle
+        if match is not None:
+            with self._lock:
+                self._matched.pop(player.pk, None)
+        return match
+    
+    def leave(self, player_id: int) -> bool:
+        with self._lock:
+            return self.backend.remove(player_id) is not None
+    
+    def poll(self, player_id: int) -> Optional[int]:
+        """Battle id a queued player was matched into (collected once), running a due sweep first"""
+        self.tick()
+        with self._lock:
+            return self._matched.pop(player_id, None)
+    
+    def tick(self, force: bool = False) -> List[Battle]:
+        """Re-match waiting players with their widened windows"""
+        now = self.clock()
+        with self._lock:
+            if not force and now - self._last_sweep < self.sweep_interval:
+                return []
+            pairs = self._sweep(now)
+        return self._hand_off(pairs)
+    
+    def is_queued(self, player_id: int) -> bool:
+        with self._lock:
+            return player_id in self.backend
+    
+    def metrics(self) -> Dict:
+        """Queue depth and time-to-match figures"""
+        now = self.clock()
+        with self._lock:
+            entries = self.backend.entries()
+            waits = sorted(self._wait_times)
+            depth_by_bucket = self.backend.depth_by_bucket()
+        
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else None
+        
+        return {
+            'queue_depth': len(entries),
+            'depth_by_bucket': depth_by_bucket,
+            'longest_wait': now - entries[0].enqueued_at if entries else 0.0,
+            'matches': self.matches,
+            'time_to_match': {
+                'samples': len(waits),
+                'mean': sum(waits) / len(waits) if waits else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': waits[-1] if waits else None,
+            },
+        }
+
+
+def create_pvp_battle(first_player_id: int, second_player_id: int) -> Battle:
+    """
+    Create a pvp battle with both players as participants (on the first player's shard)
+    
+    The first player owns the battle; the second is the opposing side (see
+    BattleRunner.side) and can open it as a participant.
+    """
+    using = player_db(first_player_id)
+    with transaction.atomic(using=using):
+        battle = Battle.objects.using(using).create(player_id=first_player_id, battle_type='pvp')
+        BattleParticipant.objects.using(using).bulk_create([
+            BattleParticipant(battle=battle, character_type='player', character_id=first_player_id, position=0),
+            BattleParticipant(battle=battle, character_type='player', character_id=second_player_id, position=1),
+        ])
+    return battle
+
+
+_matchmaker = None
+_matchmaker_lock = threading.Lock()
+
+
+def get_matchmaker() -> Matchmaker:
+    """Process-wide matchmaker configured by settings.PVP_MATCHMAKING"""
+    global _matchmaker
+    if _matchmaker is None:
+        with _matchmaker_lock:
+            if _matchmaker is None:
+                config = getattr(settings, 'PVP_MATCHMAKING', {})
+                backend_class = import_string(config.get('BACKEND', 'apps.battles.matchmaking.LocalMatchmakingBackend'))
+                _matchmaker = Matchmaker(
+                    backend=backend_class(**config.get('OPTIONS', {})),
+                    base_window=config.get('BASE_WINDOW', BASE_WINDOW),
+                    widen_per_second=config.get('WIDEN_PER_SECOND', WIDEN_PER_SECOND),
+                    max_window=config.get('MAX_WINDOW', MAX_WINDOW),
+                    sweep_interval=config.get('SWEEP_INTERVAL', SWEEP_INTERVAL),
+                )
+    return _matchmaker
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BattleArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format_version', models.PositiveSmallIntegerField()),
+                ('turn_count', models.IntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('battle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='battles.battle')),
+            ],
+            options={
+                'db_table': 'battle_archives',
+            },
+        ),
+    ]
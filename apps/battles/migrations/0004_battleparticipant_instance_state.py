@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0003_battlearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battleparticipant',
+            name='current_hp',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='battleparticipant',
+            name='current_mp',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0004_battleparticipant_instance_state'),
+        ('characters', '0003_alter_player_user'),
+        ('world', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Raid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('max_hp', models.IntegerField()),
+                ('shard_count', models.PositiveSmallIntegerField(default=16)),
+                ('is_active', models.BooleanField(default=True)),
+                ('defeated_at', models.DateTimeField(blank=True, null=True)),
+                ('defeated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='raid_kills', to='characters.player')),
+                ('enemy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='raids', to='characters.enemy')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='raids', to='world.location')),
+            ],
+            options={
+                'db_table': 'raids',
+            },
+        ),
+        migrations.CreateModel(
+            name='RaidHPShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('hp', models.IntegerField()),
+                ('raid', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='battles.raid')),
+            ],
+            options={
+                'db_table': 'raid_hp_shards',
+                'unique_together': {('raid', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0005_raid'),
+        ('characters', '0003_alter_player_user'),
+        ('core', '0002_initial'),
+        ('world', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(fields=['player', 'is_active'], name='battles_player_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(fields=['player', '-created_at'], name='battles_player_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['updated_at'], name='battles_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battleturn',
+            index=models.Index(fields=['battle', 'turn_number'], name='battle_turns_order_idx'),
+        ),
+    ]
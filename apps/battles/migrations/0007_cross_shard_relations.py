@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0006_query_indexes'),
+        ('characters', '0003_alter_player_user'),
+        ('core', '0002_initial'),
+        ('world', '0002_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='battle',
+            name='concepts_used',
+            field=models.ManyToManyField(blank=True, db_constraint=False, to='core.pythonconcept'),
+        ),
+        migrations.AlterField(
+            model_name='battle',
+            name='location',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='battles', to='world.location'),
+        ),
+        migrations.AlterField(
+            model_name='raid',
+            name='defeated_by',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='raid_kills', to='characters.player'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0007_cross_shard_relations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='battleparticipant',
+            index=models.Index(condition=models.Q(('character_type', 'player')), fields=['character_type', 'character_id'], name='participants_player_idx'),
+        ),
+    ]
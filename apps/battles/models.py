@@ -1,3 +1,4 @@
+from django.apps import apps as django_apps
 from django.db import models
 from django.contrib.auth.models import User
 from apps.core.models import TimestampedModel, PythonConcept
@@ -102,7 +103,8 @@ class Battle(TimestampedModel):
         'world.Location', 
         on_delete=models.SET_NULL, 
         null=True,
-        related_name='battles'
+        related_name='battles',
+        db_constraint=False
     )
     
     # Results
@@ -112,12 +114,25 @@ class Battle(TimestampedModel):
     items_gained = models.JSONField(default=list)
     
     # Educational tracking
-    concepts_used = models.ManyToManyField(PythonConcept, blank=True)
+    concepts_used = models.ManyToManyField(PythonConcept, blank=True, db_constraint=False)
     code_attempts = models.IntegerField(default=0)
     successful_code_executions = models.IntegerField(default=0)
     
     class Meta:
         db_table = 'battles'
+        indexes = [
+            models.Index(fields=['player', 'is_active'], name='battles_player_active_idx'),
+            models.Index(fields=['player', '-created_at'], name='battles_player_recent_idx'),
+            # Finished battles waiting for archival
+            models.Index(fields=['updated_at'], condition=models.Q(is_active=False), name='battles_finished_idx'),
+        ]
+    
+    @staticmethod
+    def involving(player_id: int) -> models.Q:
+        """Battles the player owns or fights in (a PvP opponent is only a participant)"""
+        return models.Q(player_id=player_id) | models.Q(pk__in=BattleParticipant.objects.filter(
+            character_type='player', character_id=player_id,
+        ).values('battle_id'))
     
     def __str__(self):
         return f"{self.player.name}'s {self.get_battle_type_display()} - Turn {self.current_turn}"
@@ -125,6 +140,13 @@ class Battle(TimestampedModel):
 
 class BattleParticipant(models.Model):
     """Track all participants in a battle"""
+    # character_type -> model label for the polymorphic character reference
+    CHARACTER_MODELS = {
+        'player': 'characters.Player',
+        'party_member': 'characters.PartyMember',
+        'enemy': 'characters.Enemy',
+    }
+    
     battle = models.ForeignKey(Battle, on_delete=models.CASCADE, related_name='participants')
     
     # Polymorphic reference to character
@@ -135,6 +157,10 @@ class BattleParticipant(models.Model):
     position = models.IntegerField(default=0)  # Position in battle formation
     is_active = models.BooleanField(default=True)  # False if defeated
     
+    # Per-battle HP/MP for enemy instances (Enemy rows are shared templates)
+    current_hp = models.IntegerField(null=True, blank=True)
+    current_mp = models.IntegerField(null=True, blank=True)
+    
     # Temporary battle stats
     temp_attack_modifier = models.FloatField(default=1.0)
     temp_defense_modifier = models.FloatField(default=1.0)
@@ -142,6 +168,36 @@ class BattleParticipant(models.Model):
     
     class Meta:
         db_table = 'battle_participants'
+        indexes = [
+            # Battle.involving: battles a player fights in without owning them
+            models.Index(
+                fields=['character_type', 'character_id'],
+                condition=models.Q(character_type='player'),
+                name='participants_player_idx'
+            ),
+        ]
+    
+    @classmethod
+    def character_model(cls, character_type):
+        """Resolve a character_type to its model class"""
+        return django_apps.get_model(cls.CHARACTER_MODELS[character_type])
+    
+    @property
+    def character(self):
+        """
+        The Player, PartyMember or Enemy this participant refers to
+        
+        Attached in bulk by apps.battles.roster.load_characters; falls back
+        to a single query when accessed on an unloaded participant.
+        """
+        if not hasattr(self, '_character'):
+            from apps.battles.roster import load_characters
+            load_characters([self])
+        return self._character
+    
+    @character.setter
+    def character(self, value):
+        self._character = value
 
 
 class BattleTurn(TimestampedModel):
@@ -168,6 +224,24 @@ class BattleTurn(TimestampedModel):
     class Meta:
         db_table = 'battle_turns'
         ordering = ['battle', 'turn_number']
+        indexes = [
+            models.Index(fields=['battle', 'turn_number'], name='battle_turns_order_idx'),
+        ]
+
+
+class BattleArchive(models.Model):
+    """Compressed, versioned record of a finished battle's turns"""
+    battle = models.OneToOneField(Battle, on_delete=models.CASCADE, related_name='archive')
+    format_version = models.PositiveSmallIntegerField()
+    turn_count = models.IntegerField(default=0)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'battle_archives'
+    
+    def __str__(self):
+        return f"Archive of battle {self.battle_id} ({self.turn_count} turns)"
 
 
 class StatusEffect(models.Model):
@@ -199,3 +273,46 @@ class StatusEffect(models.Model):
     
     def __str__(self):
         return self.name
+
+
+class Raid(TimestampedModel):
+    """A boss fought by many players at once; its HP lives in RaidHPShard rows"""
+    enemy = models.ForeignKey('characters.Enemy', on_delete=models.CASCADE, related_name='raids')
+    location = models.ForeignKey(
+        'world.Location',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='raids'
+    )
+    max_hp = models.IntegerField()
+    shard_count = models.PositiveSmallIntegerField(default=16)
+    
+    # Result
+    is_active = models.BooleanField(default=True)
+    defeated_at = models.DateTimeField(null=True, blank=True)
+    defeated_by = models.ForeignKey(
+        'characters.Player',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='raid_kills',
+        db_constraint=False
+    )
+    
+    class Meta:
+        db_table = 'raids'
+    
+    def __str__(self):
+        return f"Raid on {self.enemy.name}"
+
+
+class RaidHPShard(models.Model):
+    """One slice of a raid boss's HP; hits decrement a random shard so writers rarely share a row"""
+    raid = models.ForeignKey(Raid, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    hp = models.IntegerField()  # May go negative; only the sum matters
+    
+    class Meta:
+        db_table = 'raid_hp_shards'
+        unique_together = ['raid', 'index']
@@ -0,0 +1,140 @@
+"""
+Co-op raids with sharded boss HP
+
+A raid boss's HP is split across RaidHPShard rows. Every hit is a single
+UPDATE ... SET hp = hp - n on a randomly chosen shard, so concurrent
+attackers contend on different rows instead of serializing on one, and
+no hit reads before it writes.
+
+The remaining HP is the sum of the shards. Each process keeps the last
+aggregate per raid and only re-aggregates when it is older than
+AGGREGATE_INTERVAL or when its own hits since then may have finished the
+boss. The defeat detector closes the raid with a conditional UPDATE, so
+exactly one hit is credited with the killing blow even when several
+processes notice the defeat at the same moment. That player gets an
+EnemyDefeated event for the raid's enemy, so quest objectives count it.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from apps.characters.combatants import get_enemy_template
+from apps.core.events import EnemyDefeated, publish
+from apps.core.game_engine import GameEngine
+
+from .models import Raid, RaidHPShard
+
+
+DEFAULT_SHARDS = 16
+AGGREGATE_INTERVAL = 1.0  # Seconds
+
+RaidHit = namedtuple('RaidHit', ['damage', 'hp', 'defeated', 'killing_blow'])
+
+
+class RaidHPReader:
+    """Per-process view of raid HP, aggregated from the shards at most once per interval"""
+    
+    def __init__(self, interval: float = AGGREGATE_INTERVAL, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        # raid_id -> [hp at last aggregation, aggregated at, local damage since]
+        self._state: Dict[int, list] = {}
+    
+    def aggregate(self, raid_id: int) -> int:
+        hp = RaidHPShard.objects.filter(raid_id=raid_id).aggregate(hp=Sum('hp'))['hp'] or 0
+        with self._lock:
+            self._state[raid_id] = [hp, self.clock(), 0]
+        return hp
+    
+    def hp(self, raid_id: int) -> int:
+        """Remaining HP, at most one interval stale (less this process's own hits since)"""
+        with self._lock:
+            state = self._state.get(raid_id)
+            if state is not None and self.clock() - state[1] < self.interval:
+                return max(0, state[0] - state[2])
+        return max(0, self.aggregate(raid_id))
+    
+    def record(self, raid_id: int, damage: int) -> bool:
+        """Note a local hit; True when the cached figure can no longer vouch for the boss being alive"""
+        with self._lock:
+            state = self._state.get(raid_id)
+            if state is None or self.clock() - state[1] >= self.interval:
+                return True
+            state[2] += damage
+            return state[0] - state[2] <= 0
+
+
+_reader = RaidHPReader()
+
+
+def get_hp_reader() -> RaidHPReader:
+    return _reader
+
+
+def start_raid(enemy, shards: int = DEFAULT_SHARDS, location=None, max_hp: Optional[int] = None) -> Raid:
+    """Open a raid on an Enemy template with its HP split evenly across the shards"""
+    max_hp = max_hp or enemy.max_hp
+    with transaction.atomic():
+        raid = Raid.objects.create(enemy=enemy, location=location, max_hp=max_hp, shard_count=shards)
+        share, extra = divmod(max_hp, shards)
+        RaidHPShard.objects.bulk_create([
+            RaidHPShard(raid=raid, index=index, hp=share + (1 if index < extra else 0))
+            for index in range(shards)
+        ])
+    return raid
+
+
+def _close_raid(raid: Raid, player=None) -> bool:
+    """Mark the raid defeated; True only for the caller that actually closed it (who gets the kill)"""
+    closed = Raid.objects.filter(pk=raid.pk, is_active=True).update(
+        is_active=False, defeated_at=timezone.now(), defeated_by=player,
+    )
+    if closed:
+        raid.is_active = False
+        raid.defeated_by = player
+        if player is not None:
+            publish(EnemyDefeated(player_id=player.pk, enemy_id=raid.enemy_id, using=player._state.db))
+    return bool(closed)
+
+
+def hit_raid(raid: Raid, player, damage: int, reader: Optional[RaidHPReader] = None) -> RaidHit:
+    """Apply a hit to a random shard and run the defeat detector if the boss may be down"""
+    reader = reader or get_hp_reader()
+    if reader.hp(raid.pk) <= 0:
+        # Finished by a hit whose process never got to close the raid
+        _close_raid(raid)
+        return RaidHit(0, 0, True, False)
+    
+    index = random.randrange(raid.shard_count)
+    RaidHPShard.objects.filter(raid_id=raid.pk, index=index).update(hp=F('hp') - damage)
+    
+    if not reader.record(raid.pk, damage):
+        return RaidHit(damage, reader.hp(raid.pk), False, False)
+    
+    hp = reader.aggregate(raid.pk)
+    if hp > 0:
+        return RaidHit(damage, hp, False, False)
+    return RaidHit(damage, 0, True, _close_raid(raid, player))
+
+
+def raid_attack(raid: Raid, player, engine: Optional[GameEngine] = None, reader: Optional[RaidHPReader] = None) -> RaidHit:
+    """A player's basic attack against the raid boss"""
+    engine = engine or GameEngine()
+    damage = engine.calculate_damage(player, get_enemy_template(raid.enemy_id))
+    return hit_raid(raid, player, damage, reader)
+
+
+def detect_defeats() -> List[Raid]:
+    """Close every active raid whose shards sum to zero or less (for periodic jobs)"""
+    defeated = []
+    for raid in Raid.objects.filter(is_active=True).annotate(hp=Sum('shards__hp')).filter(hp__lte=0):
+        if Raid.objects.filter(pk=raid.pk, is_active=True).update(is_active=False, defeated_at=timezone.now()):
+            defeated.append(raid)
+    return defeated
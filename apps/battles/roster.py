@@ -0,0 +1,82 @@
+"""
+Batched resolution of polymorphic BattleParticipant characters, and battle
+lookup by participant
+"""
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+from django.db.models import prefetch_related_objects
+
+from apps.characters.combatants import EnemyCombatant, get_enemy_templates
+from apps.core.sharding import get_from_any_shard, player_shards
+
+from .models import Battle, BattleParticipant
+
+
+def load_characters(participants: Iterable[BattleParticipant]) -> List[BattleParticipant]:
+    """
+    Attach each participant's character as participant.character
+    
+    Ids are grouped by character_type, so the cost is one query per type
+    present rather than one per participant. Enemy participants get an
+    EnemyCombatant built from the cached template and the participant's
+    own HP/MP. Already-loaded participants are skipped.
+    """
+    participants = list(participants)
+    db = participants[0]._state.db if participants else None
+    ids_by_type = defaultdict(set)
+    for participant in participants:
+        if not hasattr(participant, '_character'):
+            ids_by_type[participant.character_type].add(participant.character_id)
+    
+    loaded = {}
+    for character_type, ids in ids_by_type.items():
+        if character_type == 'enemy':
+            # Cached read-only templates; usually no query at all
+            loaded[character_type] = get_enemy_templates(ids)
+        else:
+            model = BattleParticipant.character_model(character_type)
+            loaded[character_type] = model.objects.using(db).in_bulk(ids)
+            if player_shards():
+                # PvP opponents can live on another player shard
+                for character_id in ids - loaded[character_type].keys():
+                    character = get_from_any_shard(model, character_id)
+                    if character is not None:
+                        loaded[character_type][character_id] = character
+    
+    for participant in participants:
+        if hasattr(participant, '_character'):
+            continue
+        character = loaded[participant.character_type].get(participant.character_id)
+        if participant.character_type == 'enemy' and character is not None:
+            # Each enemy participant is its own instance of the template
+            character = EnemyCombatant(character, participant.current_hp, participant.current_mp)
+        participant.character = character
+    return participants
+
+
+def find_player_battle(battle_id: int, player_id: int, **filters) -> Optional[Battle]:
+    """
+    The battle if the player owns or fights in it, else None
+    
+    A PvP battle lives on its owner's shard, which need not be the
+    opponent's, so the battle is looked up on every shard.
+    """
+    battle = get_from_any_shard(Battle, battle_id)
+    if battle is None or not (
+        Battle.objects.using(battle._state.db).filter(Battle.involving(player_id), pk=battle_id, **filters).exists()
+    ):
+        return None
+    return battle
+
+
+def load_battle_rosters(battles: Iterable[Battle]) -> List[Battle]:
+    """Prefetch participants for a page of battles and resolve all their characters"""
+    battles = list(battles)
+    prefetch_related_objects(battles, 'participants')
+    load_characters(
+        participant
+        for battle in battles
+        for participant in battle.participants.all()
+    )
+    return battles
@@ -0,0 +1,359 @@
+"""
+Server-side battle turn loop
+
+Resolves a player action and the enemies' replies against the battle
+session, logs the turns in bulk and returns compact messages for the
+client:
+
+    {"t": "res", "ok": 1, "out": "...", "err": "", "dmg": 12, "tgt": 5}
+    {"t": "res", "ok": 1, "skl": 3, "dmg": 18, "tgt": 5}      (one per target hit)
+    {"t": "foe", "id": 5, "act": "attack", "dmg": 7, "tgt": 4}
+    {"t": "hp", "hp": {"4": 93, "5": 38}}
+    {"t": "end", "win": 1, "xp": 15, "gold": 10}
+    {"t": "err", "m": "..."}
+
+Participants fight on two sides: the battle owner's (0) and the opposing
+one (1), which holds the enemies or, in a PvP battle, the other player.
+PvP players take alternate turns (the owner on odd turns) and nobody
+replies for the opponent; "win" is from the owner's side and the end
+message also names the winning "side".
+
+Besides code ("c") and plain attacks, a player can cast a Skill ("skl"
+with its id in "s") whose required concept they have learned. The skill
+pays its MP cost and hits with its power and element, so enemy
+weaknesses and resistances apply; HP costs are not modelled.
+"""
+from typing import Dict, List, Optional
+
+from apps.characters.models import Player
+from apps.core.events import EnemyDefeated, publish
+from apps.core.game_engine import GameEngine
+
+from .ai import SKILL_MP_COST, SKILL_POWER, decide_enemy_actions, target_view
+from .api_views import run_player_code
+from .boss_ai import Unit, plan_boss_action
+from .models import Battle, Skill, StatusEffect
+from .roster import load_characters
+from .sessions import SessionBusy, get_session_store, participant_character_key
+from .turn_log import TurnLogWriter
+
+
+# Client action codes -> BattleTurn.action_type
+ACTION_TYPES = {'code': 'code', 'atk': 'attack', 'skl': 'skill', 'def': 'defend'}
+
+# Skills the runner can cast: damage dealers aimed at the other side
+DAMAGE_SKILL_TYPES = {'attack', 'magic'}
+ENEMY_TARGET_TYPES = {'single_enemy', 'all_enemies'}
+
+# Defending halves the next hit taken
+GUARD_MODIFIER = 2.0
+
+# skill_weights entries the boss search knows how to model
+BOSS_ACTIONS = {'attack', 'skill', 'defend'}
+
+
+class BattleRunner:
+    """Run one player action (and the enemy replies) for an active battle"""
+    
+    def __init__(self, battle: Battle, store=None, engine=None, player_id=None):
+        self.battle = battle
+        self.store = store or get_session_store()
+        self.engine = engine or GameEngine()
+        self.pvp = battle.battle_type == 'pvp'
+        self.player_id = player_id or battle.player_id  # Whose actions this runner takes
+        self.participants = sorted(load_characters(battle.participants.all()), key=lambda p: p.position)
+        self.by_id = {p.pk: p for p in self.participants}
+    
+    def side(self, participant) -> int:
+        """0 for the battle owner's side, 1 for enemies and the PvP opponent"""
+        if participant.character_type == 'enemy':
+            return 1
+        if self.pvp and participant.character_type == 'player' and participant.character_id != self.battle.player_id:
+            return 1
+        return 0
+    
+    def _allies(self, side=0):
+        return [p for p in self.participants if self.side(p) == side]
+    
+    def _enemies(self, side=0):
+        return [p for p in self.participants if self.side(p) != side]
+    
+    def _alive(self, session, participants):
+        return [
+            p for p in participants
+            if session.participants[str(p.pk)]['is_active']
+            and session.character(participant_character_key(p))['current_hp'] > 0
+        ]
+    
+    def _hit(self, session, target, damage) -> bool:
+        """Apply damage to a participant; returns True if it was defeated"""
+        defeated = session.take_damage(participant_character_key(target), damage)
+        if defeated:
+            session.update_participant(target.pk, is_active=False)
+        return defeated
+    
+    def state(self, session) -> Dict:
+        return {
+            't': 'hp',
+            'hp': {
+                str(p.pk): session.character(participant_character_key(p))['current_hp']
+                for p in self.participants
+            },
+        }
+    
+    def handle(self, message: Dict) -> List[Dict]:
+        """Process a client message and return the messages to broadcast"""
+        # Both PvP players' workers act on the same session; one action at a time
+        try:
+            with self.store.locked(self.battle.pk):
+                return self._handle(message)
+        except SessionBusy:
+            return [{'t': 'err', 'm': 'Battle is busy, try again'}]
+    
+    def _handle(self, message: Dict) -> List[Dict]:
+        session = self.store.open(self.battle)
+        if not session.battle['is_active']:
+            return [{'t': 'err', 'm': 'Battle is over'}]
+        
+        action = message.get('t')
+        if action == 'state':
+            return [self.state(session)]
+        if action not in ACTION_TYPES:
+            return [{'t': 'err', 'm': f'Unknown action: {action}'}]
+        
+        player = next((
+            p for p in self.participants if p.character_type == 'player' and p.character_id == self.player_id
+        ), None)
+        side = self.side(player) if player is not None else 0
+        targets = self._alive(session, self._enemies(side))
+        if player is None or not targets:
+            return [{'t': 'err', 'm': 'Nothing to fight'}]
+        skill = None
+        if action == 'skl':
+            skill = self._skill(player, message.get('s'))
+            if skill is None:
+                return [{'t': 'err', 'm': 'Unknown skill'}]
+            if session.character(participant_character_key(player))['current_mp'] < skill.mp_cost:
+                return [{'t': 'err', 'm': 'Not enough MP'}]
+        if self.pvp:
+            if (session.battle['current_turn'] - 1) % 2 != side:
+                return [{'t': 'err', 'm': 'Not your turn'}]
+            # A guard lasts until the player's next turn
+            session.update_participant(player.pk, temp_defense_modifier=GUARD_MODIFIER if action == 'def' else 1.0)
+        
+        requested = self.by_id.get(message.get('tgt'))
+        target = requested if requested in targets else targets[0]
+        turn_log = TurnLogWriter(self.battle)
+        messages = []
+        
+        # Player action
+        hits = []  # (target, damage) before guards
+        fields = {}
+        if action == 'code':
+            code = message.get('c', '')
+            result = run_player_code(code)
+            session.update_battle(
+                code_attempts=session.battle['code_attempts'] + 1,
+                successful_code_executions=session.battle['successful_code_executions'] + int(result['success']),
+            )
+            hits = [(target, result['damage'] if result['success'] else 0)]
+            fields = {
+                'code_submitted': code,
+                'code_output': result['output'],
+                'code_errors': [result['error']] if result['error'] else [],
+                'execution_successful': result['success'],
+            }
+            messages.append({
+                't': 'res', 'ok': int(result['success']), 'out': result['output'],
+                'err': result['error'], 'dmg': hits[0][1], 'tgt': target.pk,
+            })
+        elif action == 'atk':
+            hits = [(target, self.engine.calculate_damage(player.character, target.character))]
+            messages.append({'t': 'res', 'ok': 1, 'dmg': hits[0][1], 'tgt': target.pk})
+        elif action == 'skl':
+            session.use_mp(participant_character_key(player), skill.mp_cost)
+            hit = targets if skill.target_type == 'all_enemies' else [target]
+            damages = self.engine.calculate_damage_batch(
+                player.character, [p.character for p in hit], skill.power,
+                is_magical=(skill.skill_type == 'magic'), element=skill.element_id,
+            )
+            hits = list(zip(hit, damages))
+            fields = {'action_data': {'skill': skill.pk}}
+        else:
+            messages.append({'t': 'res', 'ok': 1, 'dmg': 0, 'act': 'def'})
+        
+        hit_targets = []
+        damage = 0
+        for hit_target, hit_damage in hits:
+            guard = session.participants[str(hit_target.pk)]['temp_defense_modifier']
+            if hit_damage and guard > 1.0:
+                hit_damage = max(1, int(hit_damage / guard))
+            if hit_damage:
+                self._hit(session, hit_target, hit_damage)
+                hit_targets.append(hit_target)
+                damage += hit_damage
+            if skill is not None:
+                messages.append({'t': 'res', 'ok': 1, 'skl': skill.pk, 'dmg': hit_damage, 'tgt': hit_target.pk})
+        turn_log.record(
+            player, ACTION_TYPES[action],
+            targets=hit_targets, damage_dealt=damage, **fields
+        )
+        
+        # Enemy replies (a PvP opponent takes their own turn)
+        if not self.pvp and self._alive(session, self._enemies()):
+            messages.extend(self._enemy_turns(session, turn_log, defending=(action == 'def')))
+        
+        messages.append(self.state(session))
+        outcome = self._outcome(session)
+        if outcome is None:
+            self.store.end_turn(session, turn_log)
+        else:
+            messages.append(self._finish(session, turn_log, outcome))
+        return messages
+    
+    def _skill(self, player, skill_id) -> Optional[Skill]:
+        """A damage skill aimed at enemies that the player may cast (learned its concept), or None"""
+        skill = Skill.objects.filter(
+            pk=skill_id, skill_type__in=DAMAGE_SKILL_TYPES, target_type__in=ENEMY_TARGET_TYPES,
+        ).first() if skill_id is not None else None
+        if skill is None or skill.required_concept_id is None:
+            return skill
+        learned = player.character.conceptmastery_set.filter(concept_id=skill.required_concept_id).exists()
+        return skill if learned else None
+    
+    def _enemy_turns(self, session, turn_log, defending=False) -> List[Dict]:
+        allies = {p.pk: p for p in self._alive(session, self._allies())}
+        targets = [
+            target_view(p.pk, p.character, session.character(participant_character_key(p))['current_hp'])
+            for p in allies.values()
+        ]
+        enemies = []
+        for enemy in self._alive(session, self._enemies()):
+            enemy.character.current_hp = session.character(participant_character_key(enemy))['current_hp']
+            enemies.append((enemy.pk, enemy.character))
+        
+        # A guard lasts until the enemy's next turn
+        for pk, _ in enemies:
+            if session.participants[str(pk)]['temp_defense_modifier'] != 1.0:
+                session.update_participant(pk, temp_defense_modifier=1.0)
+        
+        if self.battle.battle_type == 'boss':
+            decisions = self._boss_decisions(session, enemies)
+        else:
+            # Every enemy decides against the same view of the field in one pass
+            decisions = decide_enemy_actions(enemies, targets)
+        
+        messages = []
+        for enemy in (self.by_id[pk] for pk, _ in enemies):
+            decision = decisions[enemy.pk]
+            action = decision['action']
+            alive = self._alive(session, list(allies.values()))
+            if not alive:
+                break
+            
+            if action == 'defend':
+                session.update_participant(enemy.pk, temp_defense_modifier=GUARD_MODIFIER)
+                turn_log.record(enemy, 'defend')
+                messages.append({'t': 'foe', 'id': enemy.pk, 'act': 'defend', 'dmg': 0})
+                continue
+            
+            # The chosen target may have fallen to an earlier enemy this turn
+            target = allies.get(decision.get('target'))
+            if target not in alive:
+                target = alive[0]
+            
+            damage = self._enemy_damage(session, enemy, action, target)
+            if defending:
+                damage = max(1, damage // 2)
+            self._hit(session, target, damage)
+            turn_log.record(enemy, action, targets=[target], damage_dealt=damage)
+            messages.append({'t': 'foe', 'id': enemy.pk, 'act': action, 'dmg': damage, 'tgt': target.pk})
+        return messages
+    
+    def _boss_decisions(self, session, enemies) -> Dict:
+        """Plan each boss's move with the lookahead search on an abstract copy of the field"""
+        units = self._search_units(session)
+        index = {unit.pid: i for i, unit in enumerate(units)}
+        decisions = {}
+        for pk, character in enemies:
+            allowed = tuple(action for action in (character.skill_weights or {'attack': 1}) if action in BOSS_ACTIONS)
+            decisions[pk] = plan_boss_action(units, index[pk], allowed or ('attack',))
+        return decisions
+    
+    def _search_units(self, session):
+        """Immutable Unit tuples for the boss search (one query for status effect definitions)"""
+        effect_names = {
+            name
+            for state in session.participants.values()
+            for name, turns in (state['status_effects'] or {}).items() if turns
+        }
+        effects = {
+            effect.name: effect
+            for effect in StatusEffect.objects.filter(name__in=effect_names)
+        } if effect_names else {}
+        
+        units = []
+        for participant in self.participants:
+            state = session.participants[str(participant.pk)]
+            character = participant.character
+            hp = session.character(participant_character_key(participant))
+            active = [effects[name] for name, turns in (state['status_effects'] or {}).items() if turns and name in effects]
+            units.append(Unit(
+                pid=participant.pk,
+                side=self.side(participant),
+                hp=hp['current_hp'] if state['is_active'] else 0,
+                max_hp=hp['max_hp'],
+                mp=hp['current_mp'],
+                attack=character.attack,
+                defense=character.defense,
+                magic_attack=character.magic_attack,
+                magic_defense=character.magic_defense,
+                dot=sum(effect.damage_per_turn for effect in active),
+                stunned=any(effect.prevents_action for effect in active),
+                guard=state['temp_defense_modifier'] > 1.0,
+            ))
+        return tuple(units)
+    
+    def _enemy_damage(self, session, enemy, action, target) -> int:
+        """Damage for an enemy action; anything but a plain attack is a magic skill costing MP"""
+        if action != 'attack' and session.use_mp(participant_character_key(enemy), SKILL_MP_COST):
+            return self.engine.calculate_damage(enemy.character, target.character, SKILL_POWER, is_magical=True)
+        return self.engine.calculate_damage(enemy.character, target.character)
+    
+    def _outcome(self, session):
+        if not self._alive(session, self._enemies()):
+            return 'victory'
+        if not self._alive(session, self._allies()):
+            return 'defeat'
+        return None
+    
+    def _finish(self, session, turn_log, outcome) -> Dict:
+        """Record the result, flush the session and hand out rewards"""
+        victory = outcome == 'victory'
+        # Only enemies carry rewards; PvP wins give none
+        defeated = [p for p in self._enemies() if p.character_type == 'enemy'] if victory else []
+        experience = gold = 0
+        for enemy in defeated:
+            experience += enemy.character.experience_reward
+            gold += enemy.character.gold_reward
+        
+        session.update_battle(
+            is_active=False, victory=victory,
+            experience_gained=experience, gold_gained=gold,
+        )
+        self.store.close(session, turn_log)
+        
+        if defeated:
+            using = self.battle._state.db
+            player = Player.objects.using(using).get(pk=self.battle.player_id)
+            player.gold += gold
+            player.add_experience(experience)
+            for enemy in defeated:
+                publish(EnemyDefeated(
+                    player_id=player.pk, enemy_id=enemy.character_id, battle_id=self.battle.pk, using=using,
+                ))
+        
+        result = {'t': 'end', 'win': int(victory), 'xp': experience, 'gold': gold}
+        if self.pvp:
+            result['side'] = 0 if victory else 1
+        return result
@@ -0,0 +1,475 @@
+"""
+In-memory battle sessions with write-behind persistence
+
+Active battles keep their mutable state (battle counters, participant
+modifiers and character HP/MP) in a session while they are being played.
+Mutations only touch the session; the database is written in batches at
+turn boundaries, when the battle ends, or once the flush interval has
+elapsed.
+
+Session state is plain JSON-serializable data so it can live in any
+backend. The process-local backend is the fastest but only survives as
+long as the worker, and only that worker can flush it: a SessionFlusher
+thread runs flush_due() there every flush interval. The SQLite backend
+persists every change to a shared file, so sessions are visible to every
+web worker on the node and can be flushed from another process
+(`manage.py flush_battle_sessions`), including after a crash (--all).
+
+Each action runs under a per-battle lock taken through the backend
+(BattleSessionStore.locked), so two workers serving the two players of a
+PvP battle cannot both load a session and overwrite each other's save.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from .models import Battle, BattleParticipant
+from .roster import load_characters
+
+
+BATTLE_FIELDS = [
+    'current_turn', 'is_active', 'turn_order', 'victory',
+    'experience_gained', 'gold_gained', 'items_gained',
+    'code_attempts', 'successful_code_executions',
+]
+PARTICIPANT_FIELDS = [
+    'is_active', 'temp_attack_modifier', 'temp_defense_modifier', 'status_effects',
+]
+CHARACTER_FIELDS = ['current_hp', 'current_mp']
+LOCK_POLL_INTERVAL = 0.05  # Seconds between tries while another worker holds a battle
+
+logger = logging.getLogger(__name__)
+
+
+def character_key(character_type: str, character_id: int) -> str:
+    """Key identifying a character inside a session"""
+    return f'{character_type}:{character_id}'
+
+
+def participant_character_key(participant) -> str:
+    """
+    Session key for a participant's character
+    
+    Enemies are keyed by participant id: each enemy participant is its own
+    instance of a shared template, and its state is stored on the
+    BattleParticipant row rather than on the Enemy row.
+    """
+    if participant.character_type == 'enemy':
+        return character_key('enemy', participant.pk)
+    return character_key(participant.character_type, participant.character_id)
+
+
+class SessionBusy(Exception):
+    """Raised when a battle's session stays locked by another worker past the lock timeout"""
+
+
+class BattleSession:
+    """Mutable in-memory state of one active battle"""
+    
+    def __init__(self, battle_id: int, battle: Dict, participants: Dict, characters: Dict,
+                 dirty: Iterable[str] = (), last_flush: Optional[float] = None, db: Optional[str] = None):
+        self.battle_id = battle_id
+        self.db = db  # Database (player shard) holding the battle
+        self.battle = battle
+        self.participants = participants
+        self.characters = characters
+        self.dirty = set(dirty)
+        self.last_flush = time.time() if last_flush is None else last_flush
+    
+    @classmethod
+    def from_battle(cls, battle: Battle) -> 'BattleSession':
+        """Snapshot a battle, its participants and their characters (one query per character type)"""
+        participants = {}
+        characters = {}
+        for participant in load_characters(battle.participants.all()):
+            participants[str(participant.pk)] = {
+                'character_type': participant.character_type,
+                'character_id': participant.character_id,
+                **{field: getattr(participant, field) for field in PARTICIPANT_FIELDS},
+            }
+            character = participant.character
+            if character is not None:
+                characters[participant_character_key(participant)] = {
+                    field: getattr(character, field)
+                    for field in ('current_hp', 'max_hp', 'current_mp', 'max_mp')
+                }
+                state = getattr(character, '_state', None)
+                if state is not None and state.db != battle._state.db:
+                    # A PvP opponent whose rows live on another shard
+                    characters[participant_character_key(participant)]['db'] = state.db
+        
+        return cls(
+            battle_id=battle.pk,
+            battle={field: getattr(battle, field) for field in BATTLE_FIELDS},
+            participants=participants,
+            characters=characters,
+            db=battle._state.db,
+        )
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'BattleSession':
+        return cls(**data)
+    
+    def to_dict(self) -> Dict:
+        return {
+            'battle_id': self.battle_id,
+            'battle': self.battle,
+            'participants': self.participants,
+            'characters': self.characters,
+            'dirty': sorted(self.dirty),
+            'last_flush': self.last_flush,
+            'db': self.db,
+        }
+    
+    # Character state (mirrors BaseCharacter without touching the database)
+    
+    def character(self, key: str) -> Dict:
+        return self.characters[key]
+    
+    def take_damage(self, key: str, amount: int) -> bool:
+        """Apply damage; returns True if the character is defeated"""
+        state = self.characters[key]
+        state['current_hp'] = max(0, state['current_hp'] - amount)
+        self.dirty.add(f'character:{key}')
+        return state['current_hp'] <= 0
+    
+    def heal(self, key: str, amount: int):
+        state = self.characters[key]
+        state['current_hp'] = min(state['max_hp'], state['current_hp'] + amount)
+        self.dirty.add(f'character:{key}')
+    
+    def use_mp(self, key: str, amount: int) -> bool:
+        state = self.characters[key]
+        if state['current_mp'] >= amount:
+            state['current_mp'] -= amount
+            self.dirty.add(f'character:{key}')
+            return True
+        return False
+    
+    def restore_mp(self, key: str, amount: int):
+        state = self.characters[key]
+        state['current_mp'] = min(state['max_mp'], state['current_mp'] + amount)
+        self.dirty.add(f'character:{key}')
+    
+    # Battle and participant state
+    
+    def update_battle(self, **fields):
+        self.battle.update(fields)
+        self.dirty.add('battle')
+    
+    def update_participant(self, participant_id, **fields):
+        self.participants[str(participant_id)].update(fields)
+        self.dirty.add(f'participant:{participant_id}')
+    
+    def advance_turn(self):
+        self.update_battle(current_turn=self.battle['current_turn'] + 1)
+    
+    def flush(self):
+        """Write every dirty row back to the database in one transaction"""
+        if not self.dirty:
+            self.last_flush = time.time()
+            return
+        
+        characters_by_type = defaultdict(list)
+        participants = []
+        battle = None
+        
+        for entry in self.dirty:
+            kind, _, ident = entry.partition(':')
+            if kind == 'battle':
+                battle = Battle(pk=self.battle_id, **self.battle)
+            elif kind == 'participant':
+                state = self.participants[ident]
+                participants.append(BattleParticipant(
+                    pk=int(ident), **{field: state[field] for field in PARTICIPANT_FIELDS}
+                ))
+            elif kind == 'character':
+                character_type, _, character_id = ident.partition(':')
+                model = (
+                    BattleParticipant if character_type == 'enemy'
+                    else BattleParticipant.character_model(character_type)
+                )
+                state = self.characters[ident]
+                characters_by_type[model, state.get('db', self.db)].append(model(
+                    pk=int(character_id), **{field: state[field] for field in CHARACTER_FIELDS}
+                ))
+        
+        with transaction.atomic(using=self.db):
+            if battle is not None:
+                Battle.objects.using(self.db).bulk_update([battle], BATTLE_FIELDS)
+            if participants:
+                BattleParticipant.objects.using(self.db).bulk_update(participants, PARTICIPANT_FIELDS)
+            for (model, db), objs in characters_by_type.items():
+                model.objects.using(db).bulk_update(objs, CHARACTER_FIELDS)
+        
+        self.dirty.clear()
+        self.last_flush = time.time()
+
+
+class LocalSessionBackend:
+    """Process-local backend; sessions are lost if the worker dies before a flush"""
+    shared = False
+    
+    def __init__(self, **options):
+        self._sessions = {}
+        self._locks = {}  # battle_id -> (token, expires)
+        self._lock = threading.Lock()
+    
+    def load(self, battle_id: int) -> Optional[Dict]:
+        return self._sessions.get(battle_id)
+    
+    def save(self, battle_id: int, data: Dict):
+        with self._lock:
+            self._sessions[battle_id] = data
+    
+    def delete(self, battle_id: int):
+        with self._lock:
+            self._sessions.pop(battle_id, None)
+    
+    def battle_ids(self) -> List[int]:
+        return list(self._sessions)
+    
+    def acquire(self, battle_id: int, token: str, timeout: float) -> bool:
+        now = time.time()
+        with self._lock:
+            held = self._locks.get(battle_id)
+            if held is not None and held[1] > now:
+                return False
+            self._locks[battle_id] = (token, now + timeout)
+            return True
+    
+    def release(self, battle_id: int, token: str):
+        with self._lock:
+            if self._locks.get(battle_id, (None,))[0] == token:
+                del self._locks[battle_id]
+
+
+class SQLiteSessionBackend:
+    """
+    Shared backend storing sessions in a local SQLite file
+    
+    Every save is durable, so all workers on a node see the same sessions
+    and unflushed changes survive a crash until recover() writes them out.
+    """
+    shared = True
+    
+    def __init__(self, path=None, **options):
+        self.path = str(path or os.path.join(settings.BASE_DIR, 'battle_sessions.sqlite3'))
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS battle_sessions '
+                '(battle_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS battle_session_locks '
+                '(battle_id INTEGER PRIMARY KEY, token TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+    
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def load(self, battle_id: int) -> Optional[Dict]:
+        row = self._connection().execute(
+            'SELECT data FROM battle_sessions WHERE battle_id = ?', (battle_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save(self, battle_id: int, data: Dict):
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO battle_sessions (battle_id, data, updated_at) VALUES (?, ?, ?)',
+                (battle_id, json.dumps(data, separators=(',', ':')), time.time())
+            )
+    
+    def delete(self, battle_id: int):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM battle_sessions WHERE battle_id = ?', (battle_id,))
+    
+    def battle_ids(self) -> List[int]:
+        return [row[0] for row in self._connection().execute('SELECT battle_id FROM battle_sessions')]
+    
+    def acquire(self, battle_id: int, token: str, timeout: float) -> bool:
+        now = time.time()
+        # Takes over the row only if it has expired; one statement, so atomic between workers
+        with self._connection() as conn:
+            return conn.execute(
+                'INSERT INTO battle_session_locks (battle_id, token, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (battle_id) DO UPDATE SET token = excluded.token, expires = excluded.expires '
+                'WHERE battle_session_locks.expires <= ?',
+                (battle_id, token, now + timeout, now),
+            ).rowcount > 0
+    
+    def release(self, battle_id: int, token: str):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM battle_session_locks WHERE battle_id = ? AND token = ?', (battle_id, token))
+
+
+class BattleSessionStore:
+    """Open, mutate and flush battle sessions through a pluggable backend"""
+    
+    def __init__(self, backend=None, flush_interval: float = 5.0, lock_timeout: float = 10.0):
+        self.backend = backend or LocalSessionBackend()
+        self.flush_interval = flush_interval
+        self.lock_timeout = lock_timeout
+    
+    @contextmanager
+    def locked(self, battle_id: int, wait: bool = True):
+        """
+        Hold a battle's session lock for a load-mutate-save cycle
+        
+        Waits up to lock_timeout (not at all if wait is False) and raises
+        SessionBusy if the lock stays taken. A lock left by a dead worker
+        expires after lock_timeout.
+        """
+        token = uuid.uuid4().hex
+        deadline = time.time() + (self.lock_timeout if wait else 0)
+        while not self.backend.acquire(battle_id, token, self.lock_timeout):
+            if time.time() >= deadline:
+                raise SessionBusy(f"Battle {battle_id} is locked by another worker")
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            self.backend.release(battle_id, token)
+    
+    def open(self, battle: Battle) -> BattleSession:
+        """
+        Return the live session for a battle, creating it from the database if needed
+        
+        A finished battle gets a throwaway session that is not stored, so
+        messages arriving after close() do not bring it back.
+        """
+        data = self.backend.load(battle.pk)
+        if data is not None:
+            return BattleSession.from_dict(data)
+        # The caller's instance may predate close(); read the current state
+        battle.refresh_from_db(fields=BATTLE_FIELDS)
+        session = BattleSession.from_battle(battle)
+        if battle.is_active:
+            self.backend.save(battle.pk, session.to_dict())
+        return session
+    
+    def get(self, battle_id: int) -> Optional[BattleSession]:
+        data = self.backend.load(battle_id)
+        return BattleSession.from_dict(data) if data is not None else None
+    
+    def save(self, session: BattleSession):
+        """Store session changes; flushes to the database once the interval has elapsed"""
+        if session.dirty and time.time() - session.last_flush >= self.flush_interval:
+            session.flush()
+        self.backend.save(session.battle_id, session.to_dict())
+    
+    def end_turn(self, session: BattleSession, turn_log=None):
+        """Turn boundary: advance the turn counter and flush (with the turn log, if given)"""
+        session.advance_turn()
+        with transaction.atomic(using=session.db):
+            session.flush()
+            if turn_log is not None:
+                turn_log.flush()
+        self.backend.save(session.battle_id, session.to_dict())
+    
+    def close(self, session: BattleSession, turn_log=None):
+        """Battle over: flush and drop the session"""
+        with transaction.atomic(using=session.db):
+            session.flush()
+            if turn_log is not None:
+                turn_log.flush()
+        self.backend.delete(session.battle_id)
+    
+    def flush_due(self) -> int:
+        """Flush sessions whose interval has elapsed; call from a timer. Returns the count flushed"""
+        flushed = 0
+        now = time.time()
+        for battle_id in self.backend.battle_ids():
+            try:
+                with self.locked(battle_id, wait=False):
+                    session = self.get(battle_id)
+                    if session and session.dirty and now - session.last_flush >= self.flush_interval:
+                        session.flush()
+                        self.backend.save(battle_id, session.to_dict())
+                        flushed += 1
+            except SessionBusy:
+                # Mid-action; the action flushes at its turn boundary
+                continue
+        return flushed
+    
+    def recover(self) -> int:
+        """Flush every stored session, e.g. after a crash; finished battles are dropped"""
+        recovered = 0
+        for battle_id in self.backend.battle_ids():
+            with self.locked(battle_id):
+                session = self.get(battle_id)
+                if session is None:
+                    continue
+                session.flush()
+                if session.battle.get('is_active', True):
+                    self.backend.save(battle_id, session.to_dict())
+                else:
+                    self.backend.delete(battle_id)
+                recovered += 1
+        return recovered
+
+
+class SessionFlusher(threading.Thread):
+    """Daemon thread calling store.flush_due() every flush interval, for backends only this process can see"""
+    
+    def __init__(self, store: BattleSessionStore):
+        super().__init__(name='battle-session-flusher', daemon=True)
+        self.store = store
+        self._stopped = threading.Event()
+    
+    def run(self):
+        while not self._stopped.wait(self.store.flush_interval):
+            try:
+                self.store.flush_due()
+            except Exception:
+                logger.exception("Flushing battle sessions failed")
+            finally:
+                # This thread's own database connections
+                connections.close_all()
+    
+    def stop(self):
+        self._stopped.set()
+
+
+_store = None
+_store_lock = threading.Lock()
+_flusher = None
+
+
+def get_session_store() -> BattleSessionStore:
+    """Process-wide store configured by settings.BATTLE_SESSION_STORE (starts a SessionFlusher for local backends)"""
+    global _store, _flusher
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'BATTLE_SESSION_STORE', {})
+                backend_class = import_string(config.get('BACKEND', 'apps.battles.sessions.LocalSessionBackend'))
+                store = BattleSessionStore(
+                    backend=backend_class(**config.get('OPTIONS', {})),
+                    flush_interval=config.get('FLUSH_INTERVAL', 5.0),
+                    lock_timeout=config.get('LOCK_TIMEOUT', 10.0),
+                )
+                if not getattr(store.backend, 'shared', True) and store.flush_interval > 0:
+                    _flusher = SessionFlusher(store)
+                    _flusher.start()
+                _store = store
+    return _store
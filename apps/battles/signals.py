@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from apps.characters.models import Enemy
+from .elements import invalidate_affinity_matrix
+from .models import ElementType
+
+
+def connect_signals():
+    """Keep in-process battle caches in sync with admin edits"""
+    post_save.connect(invalidate_affinity_matrix, sender=ElementType, dispatch_uid='affinity_element_save')
+    post_delete.connect(invalidate_affinity_matrix, sender=ElementType, dispatch_uid='affinity_element_delete')
+    # Enemy saves happen on every hit, so only deletes (which cascade the
+    # M2M rows without firing m2m_changed) invalidate the matrix
+    post_delete.connect(invalidate_affinity_matrix, sender=Enemy, dispatch_uid='affinity_enemy_delete')
+    
+    for through in (Enemy.weak_to.through, Enemy.resistant_to.through):
+        m2m_changed.connect(invalidate_affinity_matrix, sender=through, dispatch_uid=f'affinity_m2m_{through.__name__}')
@@ -0,0 +1,79 @@
+"""
+Buffered writer for BattleTurn rows and their target links
+"""
+from typing import Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Battle, BattleTurn
+
+
+class TurnLogWriter:
+    """
+    Collect battle turns in memory and write them in bulk
+    
+    Each flush issues one INSERT for the turns and one for all of their
+    target links, inside a single transaction, instead of an INSERT per
+    turn plus one per target.
+    
+    Usage:
+        with TurnLogWriter(battle) as log:
+            log.record(actor, 'attack', targets=[enemy], damage_dealt=12)
+    """
+    
+    def __init__(self, battle: Battle, next_turn_number: Optional[int] = None):
+        self.battle = battle
+        if next_turn_number is None:
+            last = battle.turns.aggregate(last=Max('turn_number'))['last']
+            next_turn_number = (last or 0) + 1
+        self.next_turn_number = next_turn_number
+        self._pending: List[tuple] = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+    
+    def __len__(self):
+        return len(self._pending)
+    
+    def record(self, actor, action_type: str, targets: Iterable = (), **fields) -> BattleTurn:
+        """Buffer a turn; turn numbers are assigned in recording order"""
+        turn = BattleTurn(
+            battle=self.battle,
+            turn_number=self.next_turn_number,
+            actor=actor,
+            action_type=action_type,
+            **fields
+        )
+        self.next_turn_number += 1
+        target_ids = [getattr(target, 'pk', target) for target in targets]
+        self._pending.append((turn, target_ids))
+        return turn
+    
+    def flush(self) -> List[BattleTurn]:
+        """Write all buffered turns and target links; returns the saved turns"""
+        if not self._pending:
+            return []
+        
+        pending, self._pending = self._pending, []
+        turns = [turn for turn, _ in pending]
+        Through = BattleTurn.targets.through
+        
+        db = self.battle._state.db
+        with transaction.atomic(using=db):
+            # Primary keys come back from bulk_create on SQLite and PostgreSQL
+            BattleTurn.objects.using(db).bulk_create(turns)
+            links = [
+                Through(battleturn_id=turn.pk, battleparticipant_id=target_id)
+                for turn, target_ids in pending
+                for target_id in target_ids
+            ]
+            if links:
+                Through.objects.using(db).bulk_create(links)
+        
+        return turns
@@ -0,0 +1,96 @@
+"""
+Read-only enemy templates and per-battle enemy combatants
+
+Enemy rows are templates shared by every battle, so combat never writes
+to them. A battle gets an EnemyCombatant per enemy participant, built
+from a cached template snapshot, and its HP/MP are persisted on the
+BattleParticipant row instead.
+"""
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, Optional
+
+from .models import Enemy
+
+
+TEMPLATE_FIELDS = [
+    'id', 'name', 'level', 'max_hp', 'max_mp',
+    'attack', 'defense', 'magic_attack', 'magic_defense', 'speed',
+    'sprite_name', 'portrait_name', 'experience_reward', 'gold_reward',
+    'ai_type', 'skill_weights',
+]
+
+EnemyTemplate = namedtuple('EnemyTemplate', TEMPLATE_FIELDS)
+
+
+class EnemyCombatant:
+    """Mutable battle state for one instance of an enemy template"""
+    
+    __slots__ = ('template', 'current_hp', 'current_mp')
+    
+    def __init__(self, template: EnemyTemplate, current_hp: Optional[int] = None, current_mp: Optional[int] = None):
+        self.template = template
+        self.current_hp = template.max_hp if current_hp is None else current_hp
+        self.current_mp = template.max_mp if current_mp is None else current_mp
+    
+    def __getattr__(self, name):
+        # Stats, rewards and AI settings come straight from the template
+        if name == 'template':
+            raise AttributeError(name)
+        return getattr(self.template, name)
+    
+    def __str__(self):
+        return f"{self.template.name} (Lv. {self.template.level})"
+    
+    @property
+    def template_id(self):
+        return self.template.id
+    
+    def take_damage(self, amount):
+        """Apply damage to this instance; returns True if it is defeated"""
+        self.current_hp = max(0, self.current_hp - amount)
+        return self.current_hp <= 0
+    
+    def heal(self, amount):
+        self.current_hp = min(self.template.max_hp, self.current_hp + amount)
+    
+    def use_mp(self, amount):
+        if self.current_mp >= amount:
+            self.current_mp -= amount
+            return True
+        return False
+    
+    def restore_mp(self, amount):
+        self.current_mp = min(self.template.max_mp, self.current_mp + amount)
+    
+    def get_ai_action(self, battle_context):
+        return Enemy.get_ai_action(self, battle_context)
+
+
+_templates: Dict[int, EnemyTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def get_enemy_templates(enemy_ids: Iterable[int]) -> Dict[int, EnemyTemplate]:
+    """Templates for the given ids; misses are loaded together in one query"""
+    enemy_ids = set(enemy_ids)
+    missing = enemy_ids.difference(_templates)
+    if missing:
+        rows = Enemy.objects.filter(pk__in=missing).values_list(*TEMPLATE_FIELDS)
+        loaded = {row[0]: EnemyTemplate(*row) for row in rows}
+        with _templates_lock:
+            _templates.update(loaded)
+    return {enemy_id: _templates[enemy_id] for enemy_id in enemy_ids if enemy_id in _templates}
+
+
+def get_enemy_template(enemy_id: int) -> Optional[EnemyTemplate]:
+    return get_enemy_templates([enemy_id]).get(enemy_id)
+
+
+def invalidate_enemy_template(sender=None, instance=None, **kwargs):
+    """Drop a cached template after an admin edit"""
+    with _templates_lock:
+        if instance is not None:
+            _templates.pop(instance.pk, None)
+        else:
+            _templates.clear()
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battles', '0007_cross_shard_relations'),
+        ('characters', '0003_alter_player_user'),
+        ('core', '0002_initial'),
+        ('world', '0002_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conceptmastery',
+            name='concept',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='core.pythonconcept'),
+        ),
+        migrations.AlterField(
+            model_name='partymember',
+            name='special_skills',
+            field=models.ManyToManyField(blank=True, db_constraint=False, to='battles.skill'),
+        ),
+        migrations.AlterField(
+            model_name='player',
+            name='current_location',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='players_here', to='world.location'),
+        ),
+        migrations.AlterField(
+            model_name='player',
+            name='user',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='playerinventory',
+            name='item',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='core.gameitem'),
+        ),
+        migrations.CreateModel(
+            name='PlayerShard',
+            fields=[
+                ('player_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('shard', models.CharField(db_index=True, max_length=50)),
+                ('moving', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='player_shard', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'player_shards',
+            },
+        ),
+    ]
@@ -1,12 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
+from apps.core.events import LocationEntered, publish
 from apps.core.models import BaseCharacter, GameItem, PythonConcept
+from apps.core.sharding import place_new_player
 import json
 
 
 class Player(BaseCharacter):
     """Player character model"""
-    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
     
     # Experience and progression
     experience = models.IntegerField(default=0)
@@ -17,7 +19,8 @@ class Player(BaseCharacter):
         'world.Location', 
         on_delete=models.SET_NULL, 
         null=True,
-        related_name='players_here'
+        related_name='players_here',
+        db_constraint=False
     )
     story_flags = models.JSONField(default=dict, blank=True)
     
@@ -34,6 +37,18 @@ class Player(BaseCharacter):
     class Meta:
         db_table = 'players'
     
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.pk is None:
+            # New players go to the least-populated shard
+            kwargs['using'] = place_new_player(kwargs.get('using'))
+        location_id = self.current_location_id
+        entered = location_id is not None and (
+            self._state.adding or getattr(self, '_loaded_values', {}).get('current_location_id', location_id) != location_id
+        )
+        super().save(*args, **kwargs)
+        if entered:
+            publish(LocationEntered(player_id=self.pk, location_id=location_id, using=self._state.db))
+    
     def add_experience(self, amount):
         """Add experience and check for level up"""
         self.experience += amount
@@ -79,7 +94,7 @@ class PartyMember(BaseCharacter):
     affinity = models.IntegerField(default=0)  # How much they like the player
     
     # Special abilities
-    special_skills = models.ManyToManyField('battles.Skill', blank=True)
+    special_skills = models.ManyToManyField('battles.Skill', blank=True, db_constraint=False)
     
     # Whether they're currently in the active party
     is_active = models.BooleanField(default=True)
@@ -130,21 +145,35 @@ class Enemy(BaseCharacter):
         db_table = 'enemies'
         verbose_name_plural = 'enemies'
     
+    def spawn_combatant(self, current_hp=None, current_mp=None):
+        """Create per-battle state for this template"""
+        from .combatants import EnemyCombatant, get_enemy_template
+        return EnemyCombatant(get_enemy_template(self.pk), current_hp, current_mp)
+    
+    # Enemy rows are shared templates: battle damage lives on the combatant
+    
+    def take_damage(self, amount):
+        raise TypeError("Enemy templates are read-only in battle; use spawn_combatant()")
+    
+    def heal(self, amount):
+        raise TypeError("Enemy templates are read-only in battle; use spawn_combatant()")
+    
+    def use_mp(self, amount):
+        raise TypeError("Enemy templates are read-only in battle; use spawn_combatant()")
+    
+    def restore_mp(self, amount):
+        raise TypeError("Enemy templates are read-only in battle; use spawn_combatant()")
+    
     def get_ai_action(self, battle_context):
-        """Determine what action the enemy should take"""
-        # Simple AI logic - can be expanded
-        if self.current_hp < self.max_hp * 0.3:
-            # Low health - defensive or healing
-            return {'action': 'defend'}
-        else:
-            # Normal attack
-            return {'action': 'attack', 'target': 'player'}
+        """Determine what action the enemy should take (strategy chosen by ai_type)"""
+        from apps.battles.ai import get_strategy
+        return get_strategy(self.ai_type).decide(self, battle_context.get('targets', []))
 
 
 class ConceptMastery(models.Model):
     """Track player's mastery of Python concepts"""
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
-    concept = models.ForeignKey(PythonConcept, on_delete=models.CASCADE)
+    concept = models.ForeignKey(PythonConcept, on_delete=models.CASCADE, db_constraint=False)
     
     mastery_level = models.IntegerField(default=0)  # 0-100
     times_used = models.IntegerField(default=0)
@@ -162,7 +191,7 @@ class ConceptMastery(models.Model):
 class PlayerInventory(models.Model):
     """Track items in player's inventory"""
     player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='inventory')
-    item = models.ForeignKey(GameItem, on_delete=models.CASCADE)
+    item = models.ForeignKey(GameItem, on_delete=models.CASCADE, db_constraint=False)
     quantity = models.IntegerField(default=1)
     
     # Equipment slots
@@ -183,3 +212,18 @@ class PlayerInventory(models.Model):
     
     def __str__(self):
         return f"{self.player.name}'s {self.item.name} x{self.quantity}"
+
+
+class PlayerShard(models.Model):
+    """Directory entry: which database holds a player's rows (lives on the catalog database)"""
+    player_id = models.BigIntegerField(primary_key=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='player_shard')
+    shard = models.CharField(max_length=50, db_index=True)
+    moving = models.BooleanField(default=False)  # Set while rebalancing copies the player's rows
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'player_shards'
+    
+    def __str__(self):
+        return f"Player {self.player_id} on {self.shard}"
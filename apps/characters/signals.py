@@ -0,0 +1,34 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+
+from apps.core.events import ItemGained, publish
+from apps.core.sharding import register_player_shard
+
+from .combatants import invalidate_enemy_template
+from .models import Enemy, Player, PlayerInventory
+
+
+def remember_inventory_quantity(sender, instance, raw=False, using=None, **kwargs):
+    """pre_save: note how many of the item the player had"""
+    if raw or instance.pk is None:
+        return
+    instance._previous_quantity = (
+        PlayerInventory.objects.using(using).filter(pk=instance.pk).values_list('quantity', flat=True).first()
+    )
+
+
+def publish_item_gained(sender, instance, created, raw=False, using=None, **kwargs):
+    """post_save: publish ItemGained for the quantity added"""
+    if raw:
+        return
+    gained = instance.quantity - (0 if created else getattr(instance, '_previous_quantity', None) or 0)
+    if gained > 0:
+        publish(ItemGained(player_id=instance.player_id, item_id=instance.item_id, quantity=gained, using=using))
+
+
+def connect_signals():
+    """Keep in-process character caches and the player shard directory in sync and publish item events"""
+    post_save.connect(invalidate_enemy_template, sender=Enemy, dispatch_uid='enemy_template_save')
+    post_delete.connect(invalidate_enemy_template, sender=Enemy, dispatch_uid='enemy_template_delete')
+    post_save.connect(register_player_shard, sender=Player, dispatch_uid='player_shard_directory')
+    pre_save.connect(remember_inventory_quantity, sender=PlayerInventory, dispatch_uid='inventory_previous_quantity')
+    post_save.connect(publish_item_gained, sender=PlayerInventory, dispatch_uid='inventory_item_gained')
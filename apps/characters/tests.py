@@ -1,3 +1,106 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from apps.battles.models import Battle, BattleTurn
+from apps.core.middleware import PlayerShardMiddleware
+from apps.core.sharding import (
+    CATALOG_DATABASE, ShardMoveError, current_shard, move_player, plan_rebalance, player_shard,
+    shard_counts, shard_for_player, shard_id_offset,
+)
+
+from .models import Player, PlayerShard
+
+
+@skipUnless(len(settings.PLAYER_SHARDS) >= 2, "Set SQLITE_SHARDS to at least two files to test player sharding")
+class PlayerShardTests(TestCase):
+    """Player placement, routing and rebalancing across local SQLite shards"""
+    databases = '__all__'
+    
+    def create_player(self, name):
+        user = User.objects.create_user(name)
+        return Player.objects.create(user=user, name=name)
+    
+    def test_new_players_fill_the_emptiest_shard(self):
+        players = [self.create_player(f'player{index}') for index in range(4)]
+        self.assertEqual({player._state.db for player in players}, set(settings.PLAYER_SHARDS[:4]))
+        for player in players:
+            self.assertEqual(shard_for_player(player.pk), player._state.db)
+            self.assertGreater(player.pk, shard_id_offset(player._state.db))
+        self.assertFalse(Player.objects.using(CATALOG_DATABASE).exists())
+    
+    def test_related_rows_follow_the_player(self):
+        player = self.create_player('owner')
+        battle = player.battle_set.create(battle_type='random')
+        battle.participants.create(character_type='player', character_id=player.pk)
+        self.assertEqual(battle._state.db, player._state.db)
+        self.assertEqual(battle.participants.count(), 1)
+        self.assertFalse(Battle.objects.using(CATALOG_DATABASE).exists())
+        # Users stay on the catalog database; unhinted queries use the active shard
+        with player_shard(player._state.db):
+            self.assertEqual(Player.objects.get(user=player.user).user.username, 'owner')
+            self.assertEqual(Battle.objects.filter(player__user=player.user).count(), 1)
+        self.assertEqual(User.objects.get(username='owner').player, player)
+    
+    def test_move_player_keeps_ids(self):
+        player = self.create_player('mover')
+        source = player._state.db
+        target = next(alias for alias in settings.PLAYER_SHARDS if alias != source)
+        battle = player.battle_set.create(battle_type='random', is_active=False)
+        participant = battle.participants.create(character_type='player', character_id=player.pk)
+        turn = battle.turns.create(turn_number=1, actor=participant, action_type='attack')
+        turn.targets.add(participant)
+        created_at = timezone.now() - timedelta(days=30)
+        Player.objects.using(source).filter(pk=player.pk).update(created_at=created_at)
+        Battle.objects.using(source).filter(pk=battle.pk).update(created_at=created_at)
+        
+        self.assertEqual(move_player(player.pk, target), 5)
+        self.assertEqual(shard_for_player(player.pk), target)
+        self.assertFalse(PlayerShard.objects.get(pk=player.pk).moving)
+        self.assertFalse(Player.objects.using(source).filter(pk=player.pk).exists())
+        self.assertFalse(Battle.objects.using(source).exists())
+        moved_turn = BattleTurn.objects.using(target).get(pk=turn.pk)
+        self.assertEqual(list(moved_turn.targets.values_list('pk', flat=True)), [participant.pk])
+        # Timestamps are copied, not reset to the time of the move
+        self.assertEqual(Player.objects.using(target).get(pk=player.pk).created_at, created_at)
+        self.assertEqual(Battle.objects.using(target).get(pk=battle.pk).created_at, created_at)
+        self.assertEqual(moved_turn.created_at, turn.created_at)
+    
+    def test_move_refuses_players_in_battle(self):
+        player = self.create_player('fighter')
+        player.battle_set.create(battle_type='random', is_active=True)
+        target = next(alias for alias in settings.PLAYER_SHARDS if alias != player._state.db)
+        with self.assertRaises(ShardMoveError):
+            move_player(player.pk, target)
+        self.assertEqual(shard_for_player(player.pk), player._state.db)
+    
+    def test_rebalance_evens_out_shards(self):
+        first, second = settings.PLAYER_SHARDS[:2]
+        for index in range(4):
+            Player.objects.using(first).create(name=f'crowded{index}')
+        self.assertEqual(shard_counts()[first], 4)
+        
+        for player_id, source, target in plan_rebalance():
+            self.assertEqual(source, first)
+            move_player(player_id, target)
+        counts = shard_counts()
+        self.assertLessEqual(max(counts.values()) - min(counts.values()), 1)
+        self.assertEqual(sum(counts.values()), 4)
+        self.assertEqual(Player.objects.using(second).count(), counts[second])
+    
+    def test_middleware_routes_request_to_players_shard(self):
+        player = self.create_player('visitor')
+        request = RequestFactory().get('/')
+        request.user = player.user
+        
+        response = PlayerShardMiddleware(lambda request: HttpResponse(current_shard()))(request)
+        self.assertEqual(response.content.decode(), player._state.db)
+        
+        PlayerShard.objects.filter(pk=player.pk).update(moving=True)
+        response = PlayerShardMiddleware(lambda request: HttpResponse())(request)
+        self.assertEqual(response.status_code, 503)
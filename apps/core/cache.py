@@ -0,0 +1,592 @@
+"""
+Two-tier application cache with tag invalidation and stampede protection
+
+    local tier   per-process LRU (LOCAL_MAX_ENTRIES), entries kept at most
+                 LOCAL_TTL seconds so other workers' writes show up
+    shared tier  pluggable backend (settings.APP_CACHE['BACKEND']): process
+                 memory, a SQLite file shared by the workers on a node, or
+                 any Django cache from settings.CACHES
+
+Every entry records the version of each of its tags when it was computed.
+invalidate(tag) bumps the tag's version in the shared tier, which makes
+every entry carrying the old version stale at once. Model saves and
+deletes invalidate the model's label ('lessons.lesson', ...) after commit
+(see apps/core/signals.py); querysets are tagged with the labels of the
+tables they read.
+
+Stampedes are handled twice: entries are refreshed early with a
+probability that rises as expiry approaches (XFetch: recompute when
+now - delta * beta * ln(rand) >= expiry, delta being the last compute
+time), and only one caller per key computes at a time (single-flight, a
+thread lock plus a lock entry in the shared tier). Callers that lose the
+race get the stale value if there is one, or wait for the winner.
+
+    cache = get_cache()
+    cache.get_or_set('map', build_map, timeout=60, tags=['world.location'])
+
+    @cached(timeout=60, tags=['lessons.lesson'])
+    def lesson_titles(): ...
+
+    @method_decorator(cache_view(tags=['world.location']), name='list')
+
+    lessons = cache_queryset(Lesson.objects.filter(difficulty='beginner'))
+
+stats() reports hits, misses and the hit rate per tag for this process.
+"""
+import hashlib
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+UNTAGGED = '(untagged)'
+# Written on every request or migration and never cached; not worth a tag bump
+UNTRACKED_MODELS = {'sessions.session', 'migrations.migration', 'admin.logentry'}
+LOCK_POLL_INTERVAL = 0.05  # Seconds between checks while another worker computes a value
+
+
+class LocalCacheBackend:
+    """Process-local shared tier; only useful for a single worker and tests"""
+    shared = False  # Other workers never see its entries or tag bumps
+    
+    def __init__(self, **options):
+        self._data = {}
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+    
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None or (item[1] is not None and item[1] <= time.time()):
+            return None
+        return item[0]
+    
+    def set(self, key: str, value, timeout: Optional[float]):
+        with self._lock:
+            self._data[key] = (value, time.time() + timeout if timeout else None)
+    
+    def add(self, key: str, value, timeout: Optional[float]) -> bool:
+        with self._lock:
+            if self.get(key) is not None:
+                return False
+            self._data[key] = (value, time.time() + timeout if timeout else None)
+            return True
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        return {tag: self._versions[tag] for tag in tags}
+    
+    def bump_versions(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+
+class SQLiteCacheBackend:
+    """
+    Shared tier in a local SQLite file, seen by every worker on the node
+    
+    Values are pickled. Expired rows are ignored on read and pruned now and
+    then on write.
+    """
+    shared = True
+    
+    def __init__(self, path=None, prune_every: int = 1000, **options):
+        self.path = str(path or os.path.join(settings.BASE_DIR, 'app_cache.sqlite3'))
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def get(self, key: str):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+    
+    def _write(self, sql: str, params: tuple) -> int:
+        with self._connection() as conn:
+            changed = conn.execute(sql, params).rowcount
+            self._writes += 1
+            if self.prune_every and self._writes % self.prune_every == 0:
+                conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+        return changed
+    
+    def set(self, key: str, value, timeout: Optional[float]):
+        self._write(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + timeout if timeout else None),
+        )
+    
+    def add(self, key: str, value, timeout: Optional[float]) -> bool:
+        now = time.time()
+        # Replaces the row only if it has expired; one statement, so atomic between workers
+        return self._write(
+            'INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + timeout if timeout else None, now),
+        ) > 0
+    
+    def delete(self, key: str):
+        self._write('DELETE FROM cache_entries WHERE key = ?', (key,))
+    
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        versions = dict.fromkeys(tags, 0)
+        if tags:
+            rows = self._connection().execute(
+                f'SELECT tag, version FROM cache_tags WHERE tag IN ({", ".join("?" * len(tags))})', tags
+            )
+            versions.update(rows)
+        return versions
+    
+    def bump_versions(self, tags: Iterable[str]):
+        with self._connection() as conn:
+            conn.executemany(
+                'INSERT INTO cache_tags (tag, version) VALUES (?, 1) '
+                'ON CONFLICT (tag) DO UPDATE SET version = version + 1',
+                [(tag,) for tag in tags],
+            )
+    
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM cache_entries')
+            conn.execute('DELETE FROM cache_tags')
+
+
+class DjangoCacheBackend:
+    """Shared tier on a cache from settings.CACHES (e.g. Redis or memcached in production)"""
+    
+    def __init__(self, alias: str = 'default', **options):
+        from django.core.cache import caches
+        from django.core.cache.backends.locmem import LocMemCache
+        self.cache = caches[alias]
+        self.shared = not isinstance(self.cache, LocMemCache)
+    
+    def get(self, key: str):
+        return self.cache.get(key)
+    
+    def set(self, key: str, value, timeout: Optional[float]):
+        self.cache.set(key, value, timeout)
+    
+    def add(self, key: str, value, timeout: Optional[float]) -> bool:
+        return self.cache.add(key, value, timeout)
+    
+    def delete(self, key: str):
+        self.cache.delete(key)
+    
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        found = self.cache.get_many([f'tag:{tag}' for tag in tags])
+        return {tag: found.get(f'tag:{tag}', 0) for tag in tags}
+    
+    def bump_versions(self, tags: Iterable[str]):
+        for tag in tags:
+            key = f'tag:{tag}'
+            if not self.cache.add(key, 1, None):
+                try:
+                    self.cache.incr(key)
+                except ValueError:  # Evicted between add() and incr()
+                    self.cache.set(key, 1, None)
+    
+    def clear(self):
+        self.cache.clear()
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used key"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """Local LRU in front of a shared backend; see the module docstring"""
+    
+    def __init__(self, backend=None, local_max_entries: int = 1000, local_ttl: float = 5.0,
+                 tag_ttl: float = 1.0, default_timeout: float = 300, early_refresh_beta: float = 1.0,
+                 lock_timeout: float = 10.0):
+        self.backend = backend or LocalCacheBackend()
+        self.local = LRUCache(local_max_entries)
+        self.local_ttl = local_ttl
+        self.tag_ttl = tag_ttl
+        self.default_timeout = default_timeout
+        self.beta = early_refresh_beta
+        self.lock_timeout = lock_timeout
+        self._tag_versions = {}  # tag -> (version, checked_at)
+        self._key_locks = defaultdict(threading.Lock)
+        self._key_locks_lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+        self._stats_lock = threading.Lock()
+    
+    @property
+    def shared(self) -> bool:
+        """Whether other workers see this cache's entries and invalidations"""
+        return getattr(self.backend, 'shared', True)
+    
+    # Tags
+    
+    def tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Current version of each tag (cached locally for tag_ttl seconds)"""
+        now = time.monotonic()
+        versions = {}
+        missing = []
+        for tag in tags:
+            known = self._tag_versions.get(tag)
+            if known is not None and now - known[1] < self.tag_ttl:
+                versions[tag] = known[0]
+            else:
+                missing.append(tag)
+        if missing:
+            for tag, version in self.backend.get_versions(missing).items():
+                self._tag_versions[tag] = (version, now)
+                versions[tag] = version
+        return versions
+    
+    def invalidate(self, *tags: str):
+        """Make every entry carrying any of the tags stale"""
+        if not tags:
+            return
+        self.backend.bump_versions(tags)
+        for tag in tags:
+            self._tag_versions.pop(tag, None)
+            self._count(tag, 'invalidations')
+    
+    # Entries
+    
+    def _valid(self, entry, now: float) -> bool:
+        if entry is None or entry['expires'] <= now:
+            return False
+        return not entry['tags'] or self.tag_versions(entry['tags']) == entry['tags']
+    
+    def _should_refresh(self, entry, now: float) -> bool:
+        # XFetch: the closer to expiry and the slower to compute, the likelier
+        return now - entry['delta'] * self.beta * math.log(1.0 - random.random()) >= entry['expires']
+    
+    def _store(self, key: str, entry, shared: bool = True):
+        if shared:
+            self.backend.set(key, entry, max(entry['expires'] - time.time(), 0.001))
+        local_entry = dict(entry, expires=min(entry['expires'], time.time() + self.local_ttl))
+        self.local.set(key, local_entry)
+    
+    def _lookup(self, key: str):
+        """(entry, tier) for a valid entry, or (None, None)"""
+        now = time.time()
+        entry = self.local.get(key)
+        if self._valid(entry, now):
+            return entry, 'local'
+        entry = self.backend.get(key)
+        if self._valid(entry, now):
+            self._store(key, entry, shared=False)
+            return entry, 'shared'
+        return None, None
+    
+    def get(self, key: str, default=None):
+        entry, _ = self._lookup(key)
+        return default if entry is None else entry['value']
+    
+    def set(self, key: str, value, timeout: Optional[float] = None, tags: Iterable[str] = (), delta: float = 0.0):
+        tags = list(tags)
+        timeout = self.default_timeout if timeout is None else timeout
+        self._store(key, {
+            'value': value,
+            'expires': time.time() + timeout,
+            'delta': delta,
+            'tags': self.tag_versions(tags),
+        })
+    
+    def delete(self, key: str):
+        self.local.delete(key)
+        self.backend.delete(key)
+    
+    def get_or_set(self, key: str, compute: Callable, timeout: Optional[float] = None, tags: Iterable[str] = ()):
+        """Cached value for key, computing (once across all callers) on a miss or early refresh"""
+        tags = list(tags)
+        entry, tier = self._lookup(key)
+        if entry is not None and not self._should_refresh(entry, time.time()):
+            self._count_all(tags, 'hits', f'{tier}_hits')
+            return entry['value']
+        
+        stale = entry
+        with self._key_locks_lock:
+            key_lock = self._key_locks[key]
+        if not key_lock.acquire(blocking=stale is None):
+            # Another thread here is refreshing it
+            self._count_all(tags, 'hits', 'stale_hits')
+            return stale['value']
+        try:
+            if stale is None:
+                # It may have been filled while we waited for the lock
+                entry, tier = self._lookup(key)
+                if entry is not None:
+                    self._count_all(tags, 'hits', f'{tier}_hits')
+                    return entry['value']
+            return self._compute(key, compute, timeout, tags, stale)
+        finally:
+            key_lock.release()
+            with self._key_locks_lock:
+                if not key_lock.locked():
+                    self._key_locks.pop(key, None)
+    
+    def _compute(self, key: str, compute: Callable, timeout: Optional[float], tags, stale):
+        lock_key = f'lock:{key}'
+        token = uuid.uuid4().hex
+        owner = self.backend.add(lock_key, token, self.lock_timeout)
+        if not owner:
+            # Another worker is computing it
+            if stale is not None:
+                self._count_all(tags, 'hits', 'stale_hits')
+                return stale['value']
+            deadline = time.time() + self.lock_timeout
+            while time.time() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry, tier = self._lookup(key)
+                if entry is not None:
+                    self._count_all(tags, 'hits', 'waited_hits')
+                    return entry['value']
+        
+        self._count_all(tags, 'misses', 'refreshes' if stale is not None else 'computes')
+        try:
+            # Versions are read before computing: an invalidation meanwhile leaves the result stale
+            versions = self.tag_versions(tags)
+            started = time.time()
+            value = compute()
+            finished = time.time()
+            timeout = self.default_timeout if timeout is None else timeout
+            self._store(key, {
+                'value': value,
+                'expires': finished + timeout,
+                'delta': finished - started,
+                'tags': versions,
+            })
+            return value
+        finally:
+            if owner and self.backend.get(lock_key) == token:
+                self.backend.delete(lock_key)
+    
+    def clear(self):
+        self.local.clear()
+        self.backend.clear()
+        self._tag_versions.clear()
+    
+    # Stats
+    
+    def _count(self, tag: str, name: str):
+        with self._stats_lock:
+            self._stats[tag][name] += 1
+    
+    def _count_all(self, tags, *names):
+        with self._stats_lock:
+            for tag in tags or [UNTAGGED]:
+                for name in names:
+                    self._stats[tag][name] += 1
+    
+    def stats(self) -> Dict[str, Dict]:
+        """Per-tag counters for this process, with hit_rate = hits / (hits + misses)"""
+        with self._stats_lock:
+            report = {tag: dict(counters) for tag, counters in self._stats.items()}
+        for counters in report.values():
+            lookups = counters.get('hits', 0) + counters.get('misses', 0)
+            counters['hit_rate'] = counters.get('hits', 0) / lookups if lookups else None
+        return report
+    
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    """Process-wide cache configured by settings.APP_CACHE"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = getattr(settings, 'APP_CACHE', {})
+                backend_class = import_string(config.get('BACKEND', 'apps.core.cache.LocalCacheBackend'))
+                backend = backend_class(**config.get('OPTIONS', {}))
+                if not getattr(backend, 'shared', True) and config.get('WORKERS', 1) > 1:
+                    raise ImproperlyConfigured(
+                        f"{backend_class.__name__} is a process-local APP_CACHE backend but WORKERS is "
+                        f"{config['WORKERS']}; use apps.core.cache.SQLiteCacheBackend or a shared Django cache"
+                    )
+                _cache = TieredCache(
+                    backend=backend,
+                    local_max_entries=config.get('LOCAL_MAX_ENTRIES', 1000),
+                    local_ttl=config.get('LOCAL_TTL', 5.0),
+                    tag_ttl=config.get('TAG_TTL', 1.0),
+                    default_timeout=config.get('DEFAULT_TIMEOUT', 300),
+                    early_refresh_beta=config.get('EARLY_REFRESH_BETA', 1.0),
+                    lock_timeout=config.get('LOCK_TIMEOUT', 10.0),
+                )
+    return _cache
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+# Decorators and helpers
+
+def cached(timeout: Optional[float] = None, tags: Iterable[str] = (), key: Optional[Callable] = None):
+    """Cache a function's result per arguments (key(*args, **kwargs) overrides the key)"""
+    tags = list(tags)
+    
+    def decorator(function):
+        prefix = f'fn:{function.__module__}.{function.__qualname__}'
+        
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            suffix = key(*args, **kwargs) if key is not None else _digest(args, sorted(kwargs.items()))
+            return get_cache().get_or_set(
+                f'{prefix}:{suffix}', lambda: function(*args, **kwargs), timeout=timeout, tags=tags,
+            )
+        
+        wrapper.invalidate = lambda: get_cache().invalidate(*tags)
+        return wrapper
+    return decorator
+
+
+def cache_view(timeout: Optional[float] = None, tags: Iterable[str] = (), per_user: bool = False):
+    """
+    Cache successful GET/HEAD responses of a view by full path (and user, if per_user)
+    
+    Works on plain Django views and on DRF view methods (the response data
+    is cached and re-wrapped, since DRF renders after the method returns).
+    """
+    tags = list(tags)
+    
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            user_part = getattr(request.user, 'pk', None) if per_user else None
+            key = f'view:{view.__module__}.{view.__qualname__}:{_digest(request.get_full_path(), user_part)}'
+            response = None
+            
+            def render():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return None
+                if hasattr(response, 'data'):
+                    return ('data', response.data)
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.render()
+                return ('content', response.content, response.get('Content-Type'))
+            
+            cached_response = get_cache().get_or_set(key, render, timeout=timeout, tags=tags)
+            if response is not None:
+                # Computed by this call; return the original response
+                return response
+            if cached_response is None:
+                return view(request, *args, **kwargs)
+            if cached_response[0] == 'data':
+                from rest_framework.response import Response
+                return Response(cached_response[1])
+            from django.http import HttpResponse
+            return HttpResponse(cached_response[1], content_type=cached_response[2])
+        return wrapper
+    return decorator
+
+
+def queryset_tags(queryset) -> list:
+    """Model labels of every table the queryset reads (for invalidation)"""
+    from django.apps import apps
+    tables = {alias.table_name for alias in queryset.query.alias_map.values()} or {queryset.model._meta.db_table}
+    return sorted(
+        model._meta.label_lower for model in apps.get_models(include_auto_created=True)
+        if model._meta.db_table in tables
+    )
+
+
+def cache_queryset(queryset, timeout: Optional[float] = None, tags: Optional[Iterable[str]] = None) -> list:
+    """Evaluate a queryset through the cache; tagged with its tables' models unless tags are given"""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except Exception:  # EmptyResultSet and friends: nothing worth caching
+        return list(queryset)
+    # sql_with_params() builds the joins, so the alias map is complete now
+    tags = queryset_tags(queryset) if tags is None else list(tags)
+    key = f'qs:{queryset.model._meta.label_lower}:{_digest(queryset.db, sql, params)}'
+    return get_cache().get_or_set(key, lambda: list(queryset), timeout=timeout, tags=tags)
+
+
+def invalidate_model(sender, instance=None, raw=False, **kwargs):
+    """post_save/post_delete/m2m_changed: invalidate the changed model's tag once the transaction commits"""
+    from django.db import router, transaction
+    if raw or kwargs.get('action', 'post_').startswith('pre_') or sender._meta.label_lower in UNTRACKED_MODELS:
+        return
+    labels = {sender._meta.label_lower}
+    if instance is not None:
+        labels.add(instance._meta.label_lower)
+    if kwargs.get('model') is not None:
+        labels.add(kwargs['model']._meta.label_lower)
+    using = kwargs.get('using') or router.db_for_write(sender)
+    transaction.on_commit(lambda: get_cache().invalidate(*sorted(labels)), using=using)
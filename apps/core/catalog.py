@@ -0,0 +1,381 @@
+"""
+Versioned, memory-mapped snapshot of the admin-edited game content
+
+Lessons, challenges, hints, concepts, skills, element types, enemies and
+world locations only change when an admin edits them. The snapshot
+serializes them into one file:
+
+    header   magic, version, length of the JSON table of contents
+    toc      per model: field names, where its index starts, foreign-key
+             groups and the pks in default ordering
+    index    per model: (pk, record offset, length) entries sorted by pk
+    records  one compact JSON array of field values per row
+
+Every worker memory-maps the same file, so the rows live once in the
+page cache of the node rather than once per process. Lookups binary-search
+the index and decode only the row asked for, returning a fresh (unsaved
+changes stay local) model instance with its snapshotted foreign keys
+already attached: catalog reads cost no queries.
+
+Admin saves bump CatalogVersion (after commit). Workers compare it with
+their snapshot every CHECK_INTERVAL seconds; the first worker on a node to
+notice rebuilds the file, written to a temporary name and swapped in with
+os.replace(), and the others pick the new file up on their next check.
+Without a snapshot file (run `manage.py build_catalog` once) every read
+falls back to the database.
+"""
+import bisect
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import F
+from django.http import Http404
+
+try:
+    import fcntl
+except ImportError:  # Windows: rebuilds are not coordinated between workers
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MODELS = [
+    'core.pythonconcept',
+    'lessons.lessoncategory', 'lessons.lesson', 'lessons.challenge', 'lessons.hint',
+    'battles.elementtype', 'battles.skill',
+    'characters.enemy',
+    'world.region', 'world.location',
+]
+
+MAGIC = b'PYCATLG1'
+HEADER = struct.Struct('<8sQI')  # magic, version, toc length
+INDEX_ENTRY = struct.Struct('<qQI')  # pk, offset, length
+CATALOG_DATABASE = 'default'
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without its millisecond rounding of times"""
+    
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CatalogSnapshot:
+    """One memory-mapped snapshot file (immutable)"""
+    
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            stat = os.fstat(handle.fileno())
+            self.buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        
+        magic, self.version, toc_length = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        toc = json.loads(self.buffer[HEADER.size:HEADER.size + toc_length])
+        self.database = toc['database']
+        self.models = toc['models']
+        # Offsets in the file are relative to the start of their section
+        self.index_start = HEADER.size + toc_length
+        self.records_start = self.index_start + toc['entries'] * INDEX_ENTRY.size
+        # bisect needs a sequence of keys; keep one small list of pks per model
+        self._keys = {
+            label: [self._entry(label, i)[0] for i in range(entry['count'])]
+            for label, entry in self.models.items()
+        }
+    
+    def _entry(self, label: str, position: int):
+        offset = self.index_start + (self.models[label]['index'] + position) * INDEX_ENTRY.size
+        return INDEX_ENTRY.unpack_from(self.buffer, offset)
+    
+    def has(self, label: str) -> bool:
+        return label in self.models
+    
+    def _values(self, label: str, pk) -> Optional[list]:
+        keys = self._keys[label]
+        position = bisect.bisect_left(keys, pk)
+        if position == len(keys) or keys[position] != pk:
+            return None
+        _, offset, length = self._entry(label, position)
+        start = self.records_start + offset
+        return json.loads(self.buffer[start:start + length])
+    
+    def instance(self, model, pk, _attached=None):
+        """Model instance for a row, with snapshotted forward foreign keys attached, or None"""
+        label = model._meta.label_lower
+        _attached = {} if _attached is None else _attached
+        if (label, pk) in _attached:
+            return _attached[label, pk]
+        values = self._values(label, pk)
+        if values is None:
+            return None
+        
+        entry = self.models[label]
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        attnames = entry['fields']
+        # Snapshots from older builds append many-to-many id lists; they are not read
+        record = values[:len(attnames)]
+        converted = [
+            fields[name].to_python(value) if value is not None and isinstance(value, str) else value
+            for name, value in zip(attnames, record)
+        ]
+        instance = model.from_db(CATALOG_DATABASE, attnames, converted)
+        _attached[label, pk] = instance
+        
+        for field in model._meta.concrete_fields:
+            if field.is_relation and self.has(field.related_model._meta.label_lower):
+                related_pk = getattr(instance, field.attname)
+                if related_pk is not None:
+                    related = self.instance(field.related_model, related_pk, _attached)
+                    if related is not None:
+                        field.set_cached_value(instance, related)
+        return instance
+    
+    def pks(self, label: str, field: Optional[str] = None, value=None) -> List:
+        """Pks in default ordering, optionally only rows whose field equals value"""
+        entry = self.models[label]
+        if field is None:
+            return entry['order']
+        return entry['groups'].get(field, {}).get(str(value), [])
+
+
+def _encode_rows(model):
+    """(pk, payload) for every row, in default ordering; payload = concrete field values"""
+    concrete = [field.attname for field in model._meta.concrete_fields]
+    rows = list(model.objects.using(CATALOG_DATABASE).values_list(*concrete))
+    encoder = SnapshotEncoder(separators=(',', ':'), ensure_ascii=False)
+    pk_index = concrete.index(model._meta.pk.attname)
+    for row in rows:
+        pk = row[pk_index]
+        yield pk, encoder.encode(list(row)).encode()
+
+
+def build_snapshot(path, version: int):
+    """Write a snapshot of the catalog database to path (atomically replacing any old one)"""
+    models = [django_apps.get_model(label) for label in SNAPSHOT_MODELS]
+    records = bytearray()
+    toc_models = {}
+    indexes = {}
+    for model in models:
+        label = model._meta.label_lower
+        entries = []
+        order = []
+        groups = {}
+        fk_fields = [field.attname for field in model._meta.concrete_fields if field.is_relation]
+        attnames = [field.attname for field in model._meta.concrete_fields]
+        for pk, payload in _encode_rows(model):
+            entries.append((pk, len(records), len(payload)))
+            records += payload
+            order.append(pk)
+        # Foreign-key groups answer "challenges of lesson 3" without scanning
+        values = model.objects.using(CATALOG_DATABASE).values_list('pk', *fk_fields) if fk_fields else []
+        for row in values:
+            for name, value in zip(fk_fields, row[1:]):
+                if value is not None:
+                    groups.setdefault(name, {}).setdefault(str(value), []).append(row[0])
+        for name in groups:
+            position = {pk: i for i, pk in enumerate(order)}
+            for members in groups[name].values():
+                members.sort(key=position.__getitem__)
+        indexes[label] = sorted(entries)
+        toc_models[label] = {
+            'fields': attnames,
+            'count': len(entries),
+            'order': order,
+            'groups': groups,
+        }
+    
+    position = 0
+    for label, entries in indexes.items():
+        toc_models[label]['index'] = position  # In index entries from the start of the index section
+        position += len(entries)
+    toc = json.dumps({
+        'version': version,
+        'database': str(connections[CATALOG_DATABASE].settings_dict['NAME']),
+        'built_at': time.time(),
+        'entries': position,
+        'models': toc_models,
+    }, separators=(',', ':')).encode()
+    
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.catalog-')
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(HEADER.pack(MAGIC, version, len(toc)))
+            handle.write(toc)
+            for entries in indexes.values():
+                for pk, offset, length in entries:
+                    handle.write(INDEX_ENTRY.pack(pk, offset, length))
+            handle.write(records)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.chmod(temporary, 0o644)  # mkstemp creates it owner-only
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+def current_version() -> int:
+    CatalogVersion = django_apps.get_model('core.CatalogVersion')
+    version = CatalogVersion.objects.using(CATALOG_DATABASE).filter(pk=1).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_version():
+    """Mark the snapshot stale (called after admin edits commit)"""
+    CatalogVersion = django_apps.get_model('core.CatalogVersion')
+    if not CatalogVersion.objects.using(CATALOG_DATABASE).filter(pk=1).update(version=F('version') + 1):
+        CatalogVersion.objects.using(CATALOG_DATABASE).get_or_create(pk=1, defaults={'version': 1})
+
+
+class Catalog:
+    """Process-wide reader that keeps its snapshot in step with CatalogVersion"""
+    
+    def __init__(self, path, check_interval: float = 2.0):
+        self.path = str(path)
+        self.check_interval = check_interval
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def _open(self) -> Optional[CatalogSnapshot]:
+        try:
+            snapshot = CatalogSnapshot(self.path)
+        except (OSError, ValueError):
+            return None
+        # A snapshot of another database (e.g. during tests) is never used
+        if snapshot.database != str(connections[CATALOG_DATABASE].settings_dict['NAME']):
+            return None
+        return snapshot
+    
+    def rebuild(self, force: bool = False):
+        """Build a new snapshot file (one worker per node at a time) and switch to it"""
+        version = current_version()
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have rebuilt it while we waited for the lock
+            existing = self._open()
+            if force or existing is None or existing.version < version:
+                build_snapshot(self.path, version)
+                logger.info("Built catalog snapshot version %d", version)
+        self.snapshot = self._open()
+        self._checked_at = time.monotonic()
+    
+    def _refresh(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._checked_at = time.monotonic()
+            snapshot = self.snapshot
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                self.snapshot = None
+                return
+            if snapshot is None or snapshot.file_id != (stat.st_ino, stat.st_mtime_ns):
+                # Another worker swapped in a new file
+                snapshot = self.snapshot = self._open()
+            if snapshot is not None and snapshot.version < current_version():
+                self.rebuild()
+    
+    def active(self, model=None) -> Optional[CatalogSnapshot]:
+        """The current snapshot, if there is one (covering model, when given)"""
+        self._refresh()
+        snapshot = self.snapshot
+        if snapshot is None or (model is not None and not snapshot.has(model._meta.label_lower)):
+            return None
+        return snapshot
+    
+    def get(self, model, pk):
+        """Row by pk, or None"""
+        snapshot = self.active(model)
+        if snapshot is None:
+            return model.objects.using(CATALOG_DATABASE).filter(pk=pk).first()
+        try:
+            pk = model._meta.pk.to_python(pk)
+        except Exception:
+            return None
+        return snapshot.instance(model, pk)
+    
+    def get_many(self, model, pks: Iterable) -> Dict:
+        """{pk: row} for the pks that exist"""
+        snapshot = self.active(model)
+        if snapshot is None:
+            return model.objects.using(CATALOG_DATABASE).in_bulk(list(pks))
+        found = {}
+        for pk in pks:
+            instance = snapshot.instance(model, pk)
+            if instance is not None:
+                found[pk] = instance
+        return found
+    
+    def all(self, model) -> List:
+        """Every row, in the model's default ordering"""
+        snapshot = self.active(model)
+        if snapshot is None:
+            return list(model.objects.using(CATALOG_DATABASE).all())
+        return [snapshot.instance(model, pk) for pk in snapshot.pks(model._meta.label_lower)]
+    
+    def related(self, model, field: str, value) -> List:
+        """Rows whose foreign key field equals value, in default ordering (e.g. a lesson's challenges)"""
+        snapshot = self.active(model)
+        if snapshot is None:
+            return list(model.objects.using(CATALOG_DATABASE).filter(**{field: value}))
+        attname = model._meta.get_field(field).attname
+        return [snapshot.instance(model, pk) for pk in snapshot.pks(model._meta.label_lower, attname, value)]
+
+
+class CatalogObjectMixin:
+    """DetailView mixin loading the object from the catalog snapshot"""
+    
+    def get_object(self, queryset=None):
+        instance = get_catalog().get(self.model, self.kwargs.get(self.pk_url_kwarg))
+        if instance is None:
+            raise Http404(f"No {self.model._meta.verbose_name} found")
+        return instance
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """Process-wide catalog reader configured by settings.CONTENT_CATALOG"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                config = getattr(settings, 'CONTENT_CATALOG', {})
+                _catalog = Catalog(
+                    config.get('PATH', os.path.join(settings.BASE_DIR, 'catalog.snapshot')),
+                    check_interval=config.get('CHECK_INTERVAL', 2.0),
+                )
+    return _catalog
+
+
+def catalog_changed(sender, **kwargs):
+    """post_save/post_delete on snapshot models: bump the version once committed"""
+    if kwargs.get('raw') or kwargs.get('action', 'post_').startswith('pre_'):
+        return
+    transaction.on_commit(bump_version, using=CATALOG_DATABASE)
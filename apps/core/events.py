@@ -0,0 +1,136 @@
+"""
+Typed in-process event bus for gameplay events
+
+Events are frozen dataclasses. Handlers subscribe to an event class (or to
+a base class, to receive its subclasses too) and are called synchronously,
+in subscription order, when an event is published:
+
+    subscribe(EnemyDefeated, record_quest_event, dispatch_uid='quests')
+    publish(EnemyDefeated(player_id=player.pk, enemy_id=enemy.pk, using=player._state.db))
+
+using is the database holding the player's rows (their shard); handlers
+look it up when it is None. A failing handler is logged and does not stop
+the others or the publisher.
+"""
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, ClassVar, Dict, List, Optional, Type
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, kw_only=True)
+class Event:
+    """Something that happened to a player"""
+    type: ClassVar[str] = 'event'
+    target_field: ClassVar[Optional[str]] = None  # Field naming the object the event is about
+    amount_field: ClassVar[Optional[str]] = None  # Field with a count, if not 1
+    
+    player_id: int
+    using: Optional[str] = None
+    
+    @property
+    def target(self) -> Optional[int]:
+        return getattr(self, self.target_field) if self.target_field else None
+    
+    @property
+    def amount(self) -> int:
+        return getattr(self, self.amount_field) if self.amount_field else 1
+
+
+@dataclass(frozen=True, kw_only=True)
+class EnemyDefeated(Event):
+    type: ClassVar[str] = 'enemy_defeated'
+    target_field: ClassVar[str] = 'enemy_id'
+    
+    enemy_id: int
+    battle_id: Optional[int] = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class ChallengePassed(Event):
+    type: ClassVar[str] = 'challenge_passed'
+    target_field: ClassVar[str] = 'challenge_id'
+    
+    challenge_id: int
+    lesson_id: Optional[int] = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class ItemGained(Event):
+    type: ClassVar[str] = 'item_gained'
+    target_field: ClassVar[str] = 'item_id'
+    amount_field: ClassVar[str] = 'quantity'
+    
+    item_id: int
+    quantity: int = 1
+
+
+@dataclass(frozen=True, kw_only=True)
+class LocationEntered(Event):
+    type: ClassVar[str] = 'location_entered'
+    target_field: ClassVar[str] = 'location_id'
+    
+    location_id: int
+
+
+@dataclass(frozen=True, kw_only=True)
+class QuestCompleted(Event):
+    type: ClassVar[str] = 'quest_completed'
+    target_field: ClassVar[str] = 'quest_id'
+    
+    quest_id: int
+
+
+# Event.type -> class, for objectives and other stored references
+EVENT_TYPES: Dict[str, Type[Event]] = {
+    cls.type: cls for cls in (EnemyDefeated, ChallengePassed, ItemGained, LocationEntered, QuestCompleted)
+}
+
+
+class EventBus:
+    """Synchronous publish/subscribe keyed by event class"""
+    
+    def __init__(self):
+        self._handlers: Dict[Type[Event], List] = defaultdict(list)
+        self._lock = threading.Lock()
+    
+    def subscribe(self, event_class: Type[Event], handler: Callable, dispatch_uid: Optional[str] = None):
+        """Call handler(event) for every published event_class (or subclass) instance"""
+        uid = dispatch_uid or id(handler)
+        with self._lock:
+            handlers = self._handlers[event_class]
+            if all(existing_uid != uid for existing_uid, _ in handlers):
+                handlers.append((uid, handler))
+    
+    def unsubscribe(self, event_class: Type[Event], handler: Optional[Callable] = None, dispatch_uid: Optional[str] = None):
+        uid = dispatch_uid or id(handler)
+        with self._lock:
+            self._handlers[event_class] = [entry for entry in self._handlers[event_class] if entry[0] != uid]
+    
+    def handlers(self, event_class: Type[Event]) -> List[Callable]:
+        return [
+            handler
+            for cls in event_class.__mro__ if cls in self._handlers
+            for _, handler in self._handlers[cls]
+        ]
+    
+    def publish(self, event: Event) -> int:
+        """Deliver event to its handlers; returns how many ran without error"""
+        delivered = 0
+        for handler in self.handlers(type(event)):
+            try:
+                handler(event)
+                delivered += 1
+            except Exception:
+                logger.exception("Handler %r failed for %r", handler, event)
+        return delivered
+
+
+bus = EventBus()
+subscribe = bus.subscribe
+unsubscribe = bus.unsubscribe
+publish = bus.publish
@@ -94,8 +94,48 @@ class GameEngine:
                 'result': None
             }
     
-    def calculate_damage(self, attacker, defender, skill_power=1.0, is_magical=False) -> int:
+    def calculate_damage(self, attacker, defender, skill_power=1.0, is_magical=False, element=None) -> int:
         """Calculate damage based on character stats and skill power"""
+        multiplier = 1.0
+        if element is not None:
+            from apps.battles.elements import get_affinity_matrix
+            multiplier = get_affinity_matrix().multiplier(
+                getattr(element, 'pk', element), self._affinity_id(defender)
+            )
+        return self._roll_damage(attacker, defender, skill_power, is_magical, multiplier)
+    
+    def calculate_damage_batch(self, attacker, defenders: List, skill_power=1.0,
+                               is_magical=False, element=None) -> List[int]:
+        """Calculate damage against several defenders with one affinity lookup pass"""
+        if element is not None:
+            from apps.battles.elements import get_affinity_matrix
+            multipliers = get_affinity_matrix().multipliers(
+                getattr(element, 'pk', element),
+                [self._affinity_id(defender) for defender in defenders]
+            )
+        else:
+            multipliers = [1.0] * len(defenders)
+        
+        return [
+            self._roll_damage(attacker, defender, skill_power, is_magical, multiplier)
+            for defender, multiplier in zip(defenders, multipliers)
+        ]
+    
+    @staticmethod
+    def _affinity_id(defender) -> Optional[int]:
+        """Key used for element affinity lookups (only enemies have affinities)"""
+        from apps.characters.combatants import EnemyCombatant, EnemyTemplate
+        from apps.characters.models import Enemy
+        if isinstance(defender, EnemyCombatant):
+            return defender.template_id
+        if isinstance(defender, EnemyTemplate):
+            return defender.id
+        if isinstance(defender, Enemy):
+            return defender.pk
+        return None
+    
+    def _roll_damage(self, attacker, defender, skill_power, is_magical, multiplier) -> int:
+        """Apply the damage formula, element multiplier, variance and crits"""
         if is_magical:
             base_damage = attacker.magic_attack * skill_power
             defense = defender.magic_defense
@@ -104,7 +144,7 @@ class GameEngine:
             defense = defender.defense
         
         # Basic damage formula
-        damage = max(1, int(base_damage - defense / 2))
+        damage = max(1, int((base_damage - defense / 2) * multiplier))
         
         # Add some randomness (±10%)
         variance = random.uniform(0.9, 1.1)
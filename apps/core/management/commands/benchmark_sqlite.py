@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.db.base import DEFAULT_PRAGMAS, apply_pragmas, begin_transaction, is_locked_error
+
+
+# name -> (pragmas, transaction mode, BEGIN retries); 'default' is what Django's stock backend does
+PROFILES = {
+    'default': ({}, 'DEFERRED', 0),
+    'tuned': (DEFAULT_PRAGMAS, 'IMMEDIATE', 5),
+}
+ROWS = 1000
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent read/write throughput of the stock and tuned SQLite profiles"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each run")
+        parser.add_argument('--writers', type=int, default=4, help="Threads doing read-modify-write transactions")
+        parser.add_argument('--readers', type=int, default=4, help="Threads doing read-only queries")
+    
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profile':<10}{'writes/s':>10}{'reads/s':>10}{'locked':>8}{'p95 write ms':>14}"
+        )
+        for name, profile in PROFILES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                result = self.run_profile(os.path.join(directory, 'bench.sqlite3'), *profile, **options)
+            self.stdout.write(
+                f"{name:<10}{result['writes']:>10.0f}{result['reads']:>10.0f}"
+                f"{result['locked']:>8}{result['p95']:>14.2f}"
+            )
+    
+    def run_profile(self, path, pragmas, mode, retries, seconds, writers, readers, **options):
+        setup = sqlite3.connect(path, isolation_level=None)
+        apply_pragmas(setup, pragmas)
+        setup.execute('CREATE TABLE characters (id INTEGER PRIMARY KEY, current_hp INTEGER)')
+        setup.executemany('INSERT INTO characters VALUES (?, 100)', ((i,) for i in range(ROWS)))
+        setup.close()
+        
+        counts = {'writes': 0, 'reads': 0, 'locked': 0}
+        latencies = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+        
+        def connect():
+            # Autocommit like Django: transactions are started explicitly
+            conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            apply_pragmas(conn, pragmas)
+            return conn
+        
+        def writer(seed):
+            conn = connect()
+            row = seed
+            while time.monotonic() < deadline:
+                row = (row * 7919 + 1) % ROWS
+                started = time.perf_counter()
+                try:
+                    # Read-modify-write, as take_damage() does
+                    begin_transaction(conn.execute, mode, retries)
+                    hp = conn.execute('SELECT current_hp FROM characters WHERE id = ?', (row,)).fetchone()[0]
+                    conn.execute('UPDATE characters SET current_hp = ? WHERE id = ?', (max(0, hp - 1), row))
+                    conn.execute('COMMIT')
+                except sqlite3.OperationalError as error:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    if not is_locked_error(error):
+                        raise
+                    with lock:
+                        counts['locked'] += 1
+                    continue
+                with lock:
+                    counts['writes'] += 1
+                    latencies.append(time.perf_counter() - started)
+            conn.close()
+        
+        def reader(seed):
+            conn = connect()
+            row = seed
+            while time.monotonic() < deadline:
+                row = (row * 104729 + 3) % ROWS
+                try:
+                    conn.execute(
+                        'SELECT SUM(current_hp) FROM characters WHERE id BETWEEN ? AND ?', (row, row + 50)
+                    ).fetchone()
+                except sqlite3.OperationalError as error:
+                    if not is_locked_error(error):
+                        raise
+                    with lock:
+                        counts['locked'] += 1
+                    continue
+                with lock:
+                    counts['reads'] += 1
+            conn.close()
+        
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        latencies.sort()
+        return {
+            'writes': counts['writes'] / seconds,
+            'reads': counts['reads'] / seconds,
+            'locked': counts['locked'],
+            'p95': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        }
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.catalog import get_catalog
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped content catalog snapshot (workers pick it up automatically)"
+    
+    def handle(self, *args, **options):
+        catalog = get_catalog()
+        catalog.rebuild(force=True)
+        self.stdout.write(self.style.SUCCESS(f"Built catalog version {catalog.snapshot.version} at {catalog.path}"))
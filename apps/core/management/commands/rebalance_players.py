@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.sharding import ShardMoveError, move_player, plan_rebalance, player_shards, shard_counts
+
+
+class Command(BaseCommand):
+    help = "Move players between shards: one player (--player/--to) or enough to even the shards out"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--player', type=int, help="Move only this player id")
+        parser.add_argument('--to', dest='target', help="Target shard alias for --player")
+        parser.add_argument('--tolerance', type=int, default=1, help="Allowed difference in players between shards")
+        parser.add_argument('--limit', type=int, help="Maximum players to move in one run")
+        parser.add_argument('--dry-run', action='store_true', help="Print the planned moves without moving anyone")
+    
+    def handle(self, *args, **options):
+        if not player_shards():
+            raise CommandError("No player shards configured; set SQLITE_SHARDS")
+        
+        if options['player'] is not None:
+            if not options['target']:
+                raise CommandError("--player needs --to")
+            moves = [(options['player'], None, options['target'])]
+        else:
+            moves = plan_rebalance(tolerance=options['tolerance'], limit=options['limit'])
+        
+        moved = 0
+        for player_id, source, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f"Would move player {player_id} from {source} to {target}")
+                continue
+            try:
+                rows = move_player(player_id, target)
+            except ShardMoveError as exc:
+                self.stderr.write(f"Skipped player {player_id}: {exc}")
+                continue
+            moved += 1
+            self.stdout.write(f"Moved player {player_id} to {target} ({rows} rows)")
+        
+        for alias, count in shard_counts().items():
+            self.stdout.write(f"{alias}: {count} player(s)")
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} player(s)"))
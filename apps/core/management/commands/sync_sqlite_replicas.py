@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto each local replica file (for testing replica routing)"
+    
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError("No replicas configured; set SQLITE_REPLICAS")
+        
+        primary = settings.DATABASES['default']
+        if 'sqlite' not in primary['ENGINE'] and primary['ENGINE'] != 'apps.core.db':
+            raise CommandError("sync_sqlite_replicas only works with a SQLite primary")
+        
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in replicas:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # Online backup: consistent snapshot even while the primary is being written
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"Synced {alias}")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(replicas)} replica(s)"))
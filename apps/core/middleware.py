@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import sharding
+from .routers import request_scope, wrote_in_scope
+
+
+PIN_COOKIE = 'primary_pin'
+
+
+class ReplicaPinningMiddleware:
+    """Scope replica pinning to the request and keep recent writers on the primary"""
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        
+        with request_scope(pinned=pinned_until > time.time()):
+            response = self.get_response(request)
+            wrote = wrote_in_scope()
+        
+        if wrote and pin_seconds and getattr(settings, 'DATABASE_REPLICAS', []):
+            response.set_cookie(PIN_COOKIE, str(time.time() + pin_seconds), max_age=pin_seconds, httponly=True)
+        return response
+
+
+class PlayerShardMiddleware:
+    """Route the request's player queries to the signed-in player's shard"""
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        if not sharding.player_shards() or user is None or not user.is_authenticated:
+            return self.get_response(request)
+        
+        entry = sharding.shard_for_user(user.pk)
+        if entry is None:
+            return self.get_response(request)
+        shard, moving = entry
+        if moving:
+            response = JsonResponse({'error': 'Your save is being moved, try again shortly'}, status=503)
+            response['Retry-After'] = '5'
+            return response
+        with sharding.player_shard(shard):
+            return self.get_response(request)
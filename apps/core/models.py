@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+import copy
 import uuid
 
 
@@ -21,7 +22,81 @@ class UUIDModel(models.Model):
         abstract = True
 
 
-class BaseCharacter(TimestampedModel):
+class DirtyFieldsMixin:
+    """
+    Track which concrete fields changed since the row was loaded or saved
+    
+    save() on an existing row writes only the changed columns (plus
+    auto_now timestamps) through update_fields, and skips the query
+    entirely when nothing changed. An explicit update_fields, or a forced
+    insert or update, goes through unchanged.
+    """
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+    
+    def _snapshot(self, fields=None):
+        """Remember the current value of every loaded (or the given) concrete field"""
+        if fields is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        loaded = self.__dict__
+        for field in self._meta.concrete_fields:
+            if field.attname in loaded and (fields is None or field.name in fields or field.attname in fields):
+                value = loaded[field.attname]
+                # JSON values are mutated in place, so keep a copy to compare against
+                self._loaded_values[field.attname] = copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+    
+    def get_dirty_fields(self):
+        """Names of the concrete fields whose value differs from the snapshot"""
+        snapshot = getattr(self, '_loaded_values', None)
+        if snapshot is None:
+            return [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        
+        loaded = self.__dict__
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in loaded:
+                continue
+            # Fields loaded after the snapshot (deferred) count as changed
+            if field.attname not in snapshot or snapshot[field.attname] != loaded[field.attname]:
+                dirty.append(field.name)
+        return dirty
+    
+    def is_dirty(self):
+        return bool(self.get_dirty_fields())
+    
+    def save(self, *args, **kwargs):
+        tracked = (
+            not self._state.adding
+            and hasattr(self, '_loaded_values')
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and not kwargs.get('force_update')
+            and not args
+        )
+        if tracked:
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            auto_now = [
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False) and field.name not in dirty
+            ]
+            kwargs['update_fields'] = dirty + auto_now
+        
+        super().save(*args, **kwargs)
+        self._snapshot(kwargs.get('update_fields'))
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        fields = kwargs.get('fields', args[1] if len(args) > 1 else None)
+        self._snapshot(fields)
+
+
+class BaseCharacter(DirtyFieldsMixin, TimestampedModel):
     """Abstract base model for all character types (players, enemies, NPCs)"""
     name = models.CharField(max_length=100)
     level = models.IntegerField(default=1)
@@ -143,3 +218,15 @@ class PythonConcept(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.get_difficulty_display()})"
+
+
+class CatalogVersion(models.Model):
+    """Single row counting admin edits to snapshotted content (see apps/core/catalog.py)"""
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'catalog_version'
+    
+    def __str__(self):
+        return f"Catalog v{self.version}"
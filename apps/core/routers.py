@@ -0,0 +1,164 @@
+"""
+Database routing: player shards and read replicas
+
+Writes always go to the primary ('default'). Reads go to one of
+settings.DATABASE_REPLICAS when either:
+
+- the model is catalog content (CATALOG_MODELS) that only admins edit, or
+- the code runs inside use_replica(), e.g. a safe request to a read-only
+  view (ReplicaReadsMixin)
+
+Once anything has been written during a request, every later read in that
+request is pinned to the primary (read-your-writes). ReplicaPinningMiddleware
+scopes the pin to the request and also keeps the client on the primary for
+REPLICA_PIN_SECONDS afterwards, to cover replication lag.
+
+PlayerShardRouter (listed first) sends player-owned models to their
+player's shard; see apps/core/sharding.py.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import sharding
+
+
+# Admin-edited content that is safe to serve slightly stale
+CATALOG_MODELS = {
+    'world.world', 'world.region', 'world.location', 'world.npc', 'world.quest',
+    'world.enemyspawn', 'world.npcspawn', 'world.itemspawn',
+    'lessons.lessoncategory', 'lessons.lesson', 'lessons.challenge', 'lessons.hint', 'lessons.codesnippet',
+    'core.pythonconcept', 'core.gameitem',
+    'battles.elementtype', 'battles.skill', 'battles.statuseffect',
+    'characters.enemy',
+}
+
+# Apps whose reads must never lag (logins, permissions)
+PRIMARY_ONLY_APPS = {'sessions', 'auth', 'contenttypes', 'admin'}
+
+_pinned = ContextVar('replica_pinned', default=False)
+_wrote = ContextVar('replica_wrote', default=False)
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_to_primary():
+    """Send every further read in this context to the primary"""
+    _pinned.set(True)
+
+
+def is_pinned() -> bool:
+    return _pinned.get()
+
+
+def wrote_in_scope() -> bool:
+    """Whether anything was written since the current request_scope began"""
+    return _wrote.get()
+
+
+@contextmanager
+def use_replica():
+    """Allow reads of any model to go to a replica inside the block"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def request_scope(pinned: bool = False):
+    """Fresh pinning state for one request"""
+    pinned_token = _pinned.set(pinned)
+    wrote_token = _wrote.set(False)
+    reads_token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(reads_token)
+        _wrote.reset(wrote_token)
+        _pinned.reset(pinned_token)
+
+
+class PlayerShardRouter:
+    """Route player-owned models to the player's shard and keep everything else on the catalog"""
+    
+    def _db_for(self, model, hints):
+        if not sharding.player_shards():
+            return None
+        instance = hints.get('instance')
+        if not sharding.is_sharded(model):
+            # Catalog rows reached from a player's row (battle.location, ...)
+            if instance is not None and sharding.is_sharded(type(instance)):
+                return sharding.CATALOG_DATABASE
+            return None
+        if instance is not None:
+            if sharding.is_sharded(type(instance)):
+                if instance._state.db:
+                    return instance._state.db
+                # Unsaved row: follow the player-owned parent it was built with (Battle(player=...))
+                for parent in instance._state.fields_cache.values():
+                    if parent is not None and sharding.is_sharded(type(parent)) and parent._state.db:
+                        return parent._state.db
+            if instance._meta.label_lower == 'auth.user' and instance.pk:
+                entry = sharding.shard_for_user(instance.pk)
+                if entry:
+                    return entry[0]
+        return sharding.current_shard() or sharding.CATALOG_DATABASE
+    
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+    
+    def db_for_write(self, model, **hints):
+        db = self._db_for(model, hints)
+        if db is not None:
+            # The replica router never sees routed writes, so pin here too
+            pin_to_primary()
+            _wrote.set(True)
+        return db
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Player rows point at catalog rows across databases (no FK constraints)
+        if sharding.player_shards():
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every database gets the full schema; unused tables stay empty
+        return None
+
+
+class ReplicaRouter:
+    """Route catalog and read-only reads to replicas and everything else to the primary"""
+    
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas or _pinned.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        if _replica_reads.get() or model._meta.label_lower in CATALOG_MODELS:
+            return random.choice(replicas)
+        return None
+    
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return 'default'
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaReadsMixin:
+    """View mixin serving safe (GET/HEAD/OPTIONS) requests from a replica"""
+    
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return super().dispatch(request, *args, **kwargs)
+        with use_replica():
+            return super().dispatch(request, *args, **kwargs)
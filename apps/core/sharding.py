@@ -0,0 +1,292 @@
+"""
+Player-id sharding
+
+Every row owned by a player (SHARDED_MODELS) lives on one of the
+databases in settings.PLAYER_SHARDS. Shared content (world, lessons,
+enemies, users, raids) stays on the catalog database, which also holds
+the PlayerShard directory mapping each player to their shard.
+
+- New players go to the least-populated shard (Player.save).
+- Ids of sharded rows are unique across shards: each shard's sequences
+  start at its own offset (set after migrate), so rows can move between
+  shards with their primary keys intact.
+- PlayerShardRouter sends a sharded model to the database of the
+  instance it is reached from, or else to the shard activated for the
+  current request or task (PlayerShardMiddleware, player_shard()).
+- move_player() and plan_rebalance() move players between shards.
+
+Without PLAYER_SHARDS every helper here is a no-op and everything stays
+on 'default'.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_DATABASE = 'default'
+SHARD_ID_SPAN = 10 ** 12  # Ids on shard n start above n * SHARD_ID_SPAN
+
+# Player-owned models -> lookup from the model to the owning player id, parents first
+SHARDED_MODELS = {
+    'characters.player': 'pk',
+    'characters.partymember': 'player',
+    'characters.partymember_special_skills': 'partymember__player',
+    'characters.conceptmastery': 'player',
+    'characters.playerinventory': 'player',
+    'lessons.playerlessonprogress': 'player',
+    'lessons.challengecompletion': 'progress__player',
+    'lessons.playerchallengeattempt': 'player',
+    'battles.battle': 'player',
+    'battles.battle_concepts_used': 'battle__player',
+    'battles.battleparticipant': 'battle__player',
+    'battles.battleturn': 'battle__player',
+    'battles.battleturn_targets': 'battleturn__battle__player',
+    'battles.battlearchive': 'battle__player',
+    'world.playerquest': 'player',
+    'world.questobjectiveprogress': 'player',
+}
+
+_current_shard = ContextVar('player_shard', default=None)
+
+
+class ShardMoveError(Exception):
+    """Raised when a player cannot be moved between shards"""
+
+
+def player_shards() -> List[str]:
+    return getattr(settings, 'PLAYER_SHARDS', [])
+
+
+def is_sharded(model) -> bool:
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def _directory():
+    return django_apps.get_model('characters.PlayerShard').objects.using(CATALOG_DATABASE)
+
+
+def shard_for_player(player_id: int) -> str:
+    """Database holding a player's rows (players without a directory entry predate sharding)"""
+    shard = _directory().filter(player_id=player_id).values_list('shard', flat=True).first()
+    return shard or CATALOG_DATABASE
+
+
+def shard_for_user(user_id: int) -> Optional[Tuple[str, bool]]:
+    """(shard, moving) for a user's player, or None"""
+    return _directory().filter(user_id=user_id).values_list('shard', 'moving').first()
+
+
+def player_db(player_id: int) -> Optional[str]:
+    """Alias for .using() / atomic(using=...) on a player's rows; None when not sharded"""
+    return shard_for_player(player_id) if player_shards() else None
+
+
+def current_shard() -> Optional[str]:
+    return _current_shard.get()
+
+
+def activate_shard(alias: Optional[str]):
+    """Route unhinted player queries in this context to alias"""
+    _current_shard.set(alias)
+
+
+@contextmanager
+def player_shard(alias: Optional[str]):
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def get_from_any_shard(model, pk):
+    """Look a sharded row up by id on the current shard first, then on the others (None if absent)"""
+    current = current_shard()
+    aliases = [current] if current else []
+    aliases += [alias for alias in player_shards() + [CATALOG_DATABASE] if alias != current]
+    for alias in aliases:
+        obj = model.objects.using(alias).filter(pk=pk).first()
+        if obj is not None:
+            return obj
+    return None
+
+
+def shard_counts() -> Dict[str, int]:
+    """Players per shard, from the directory"""
+    counts = {alias: 0 for alias in player_shards()}
+    rows = _directory().order_by().values_list('shard').annotate(players=Count('player_id'))
+    for alias, players in rows:
+        if alias in counts:
+            counts[alias] = players
+    return counts
+
+
+def place_new_player(using: Optional[str]) -> Optional[str]:
+    """Database for a player about to be created"""
+    shards = player_shards()
+    if not shards or using in shards:
+        return using
+    counts = shard_counts()
+    return min(shards, key=lambda alias: (counts[alias], shards.index(alias)))
+
+
+def register_player_shard(sender, instance, created, using, **kwargs):
+    """post_save: record a new player's shard in the directory"""
+    if created and player_shards():
+        _directory().update_or_create(
+            player_id=instance.pk,
+            defaults={'user_id': instance.user_id, 'shard': using or CATALOG_DATABASE},
+        )
+
+
+def shard_id_offset(alias: str) -> int:
+    return (player_shards().index(alias) + 1) * SHARD_ID_SPAN
+
+
+def ensure_id_offsets(sender=None, using=CATALOG_DATABASE, **kwargs):
+    """post_migrate: start every sharded table's id sequence at the shard's offset"""
+    if using not in player_shards():
+        return
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        logger.warning("Set id sequences on shard %s manually (offset %d)", using, shard_id_offset(using))
+        return
+    
+    offset = shard_id_offset(using)
+    tables = [django_apps.get_model(label)._meta.db_table for label in SHARDED_MODELS]
+    with connection.cursor() as cursor:
+        # sqlite_sequence exists once any AUTOINCREMENT table does; introspection hides it
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        existing = {name for name, in cursor.fetchall()}
+        if 'sqlite_sequence' not in existing:
+            return
+        for table in tables:
+            if table not in existing:
+                continue
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, offset])
+            elif row[0] < offset:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [offset, table])
+
+
+def _player_rows(alias: str, player_id: int):
+    """(model, queryset) for every sharded model, parents first"""
+    for label, lookup in SHARDED_MODELS.items():
+        model = django_apps.get_model(label)
+        yield model, model.objects.using(alias).filter(**{lookup: player_id})
+
+
+def _delete_player_rows(alias: str, player_id: int):
+    # Children first, so nothing is left for the cascade collector to chase
+    for model, queryset in reversed(list(_player_rows(alias, player_id))):
+        queryset.delete()
+
+
+def _copy_rows(model, objs, target: str):
+    """Insert objs on target unchanged (bulk_create refreshes auto_now/auto_now_add fields)"""
+    stamped = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    original = [[getattr(obj, field.attname) for field in stamped] for obj in objs]
+    model.objects.using(target).bulk_create(objs)
+    if stamped:
+        for obj, values in zip(objs, original):
+            for field, value in zip(stamped, values):
+                setattr(obj, field.attname, value)
+        # bulk_update writes the attributes as they are, without pre_save
+        model.objects.using(target).bulk_update(objs, [field.name for field in stamped])
+
+
+def move_player(player_id: int, target: str) -> int:
+    """
+    Copy a player's rows to target, repoint the directory and delete the originals
+    
+    Rows keep their primary keys. The player must not be in an active
+    battle (its state may be buffered in a battle session). Requests for
+    the player get a 503 while the directory entry is marked as moving.
+    Returns the number of rows moved.
+    """
+    if target not in player_shards():
+        raise ShardMoveError(f"Unknown shard: {target}")
+    
+    entry, _ = _directory().get_or_create(player_id=player_id, defaults={'shard': CATALOG_DATABASE})
+    source = entry.shard
+    if source == target:
+        return 0
+    Battle = django_apps.get_model('battles.Battle')
+    if Battle.objects.using(source).filter(player_id=player_id, is_active=True).exists():
+        raise ShardMoveError(f"Player {player_id} is in an active battle")
+    
+    _directory().filter(pk=player_id).update(moving=True)
+    try:
+        rows = [(model, list(queryset)) for model, queryset in _player_rows(source, player_id)]
+        if not rows[0][1]:
+            raise ShardMoveError(f"Player {player_id} not found on {source}")
+        if entry.user_id is None:
+            entry.user_id = rows[0][1][0].user_id
+        with transaction.atomic(using=target):
+            # Leftovers of an interrupted move
+            _delete_player_rows(target, player_id)
+            for model, objs in rows:
+                if objs:
+                    _copy_rows(model, objs, target)
+        _directory().filter(pk=player_id).update(shard=target, user_id=entry.user_id, moving=False)
+    except Exception:
+        _directory().filter(pk=player_id).update(moving=False)
+        raise
+    
+    with transaction.atomic(using=source):
+        _delete_player_rows(source, player_id)
+    return sum(len(objs) for _, objs in rows)
+
+
+def plan_rebalance(tolerance: int = 1, limit: Optional[int] = None) -> List[Tuple[int, str, str]]:
+    """
+    Moves (player_id, source, target) that even out the shards
+    
+    Players move from the fullest to the emptiest shard until the
+    difference is within tolerance. Players still on the catalog database
+    (created before sharding) are moved first.
+    """
+    shards = player_shards()
+    if not shards:
+        return []
+    counts = shard_counts()
+    legacy_ids = list(
+        django_apps.get_model('characters.Player').objects.using(CATALOG_DATABASE)
+        .exclude(pk__in=_directory().exclude(shard=CATALOG_DATABASE).values('player_id'))
+        .values_list('pk', flat=True)
+    )
+    candidates = {
+        alias: list(_directory().filter(shard=alias, moving=False).order_by('player_id').values_list('player_id', flat=True))
+        for alias in shards
+    }
+    
+    moves = []
+    for player_id in legacy_ids:
+        if limit is not None and len(moves) >= limit:
+            return moves
+        target = min(shards, key=lambda alias: counts[alias])
+        moves.append((player_id, CATALOG_DATABASE, target))
+        counts[target] += 1
+    
+    while limit is None or len(moves) < limit:
+        fullest = max(shards, key=lambda alias: counts[alias])
+        emptiest = min(shards, key=lambda alias: counts[alias])
+        if counts[fullest] - counts[emptiest] <= tolerance or not candidates[fullest]:
+            break
+        moves.append((candidates[fullest].pop(), fullest, emptiest))
+        counts[fullest] -= 1
+        counts[emptiest] += 1
+    return moves
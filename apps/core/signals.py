@@ -0,0 +1,19 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+
+from .cache import invalidate_model
+from .catalog import SNAPSHOT_MODELS, catalog_changed
+from .sharding import ensure_id_offsets
+
+
+def connect_signals():
+    """Give freshly migrated player shards their own id ranges and track catalog and cache edits"""
+    post_migrate.connect(ensure_id_offsets, sender=apps.get_app_config('core'), dispatch_uid='shard_id_offsets')
+    for label in SNAPSHOT_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_save_{label}')
+        post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_delete_{label}')
+    # Every model's label is a cache tag (apps/core/cache.py)
+    post_save.connect(invalidate_model, dispatch_uid='cache_invalidate_save')
+    post_delete.connect(invalidate_model, dispatch_uid='cache_invalidate_delete')
+    m2m_changed.connect(invalidate_model, dispatch_uid='cache_invalidate_m2m')
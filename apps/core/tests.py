@@ -1,3 +1,195 @@
-from django.test import TestCase
+import re
+import sqlite3
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import SkipTest
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.battles.models import Battle, BattleTurn
+from apps.characters.models import Player
+from apps.lessons.models import PlayerChallengeAttempt, PlayerLessonProgress
+from apps.world.models import EnemySpawn, Location
+
+from .db.base import DatabaseWrapper
+from .middleware import PIN_COOKIE, ReplicaPinningMiddleware
+from .routers import ReplicaRouter, request_scope, use_replica
+
+
+# SQLite reports a full table scan as "SCAN <table>" without "USING ... INDEX"
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (\w+)(?!\w| USING)')
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot queries and fail if any of them falls back to a full scan"""
+    databases = '__all__'  # The player may be placed on a shard
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+        cls.player = Player.objects.create(user=cls.user, name='Planner')
+    
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make sequential scans look cheap; only index availability matters here
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest(f'No plan checks for {connection.vendor}')
+    
+    def assertIndexed(self, queryset, ordered=False):
+        """Fail on a full scan (and, if ordered, on a separate sort step)"""
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertEqual(SQLITE_FULL_SCAN.findall(plan), [], f'Full scan in plan:\n{plan}')
+            if ordered:
+                self.assertNotIn('TEMP B-TREE', plan, f'Sort step in plan:\n{plan}')
+        else:
+            self.assertNotIn('Seq Scan', plan, f'Full scan in plan:\n{plan}')
+            if ordered:
+                self.assertNotIn('Sort Key', plan, f'Sort step in plan:\n{plan}')
+        return plan
+    
+    def test_lesson_progress_lookup(self):
+        self.assertIndexed(PlayerLessonProgress.objects.filter(player=self.player, lesson_id=1))
+    
+    def test_completed_lessons(self):
+        plan = self.assertIndexed(PlayerLessonProgress.objects.filter(player=self.player, is_completed=True))
+        if connection.vendor == 'sqlite':
+            self.assertIn('progress_completed_idx', plan)
+    
+    def test_recent_challenge_attempts(self):
+        self.assertIndexed(
+            PlayerChallengeAttempt.objects.filter(player=self.player, challenge_id=1).order_by('-submission_time'),
+            ordered=True,
+        )
+    
+    def test_passed_challenge_attempts(self):
+        self.assertIndexed(PlayerChallengeAttempt.objects.filter(player=self.player, challenge_id=1, passed=True))
+    
+    def test_active_battles(self):
+        self.assertIndexed(Battle.objects.filter(player=self.player, is_active=True))
+    
+    def test_battle_history(self):
+        self.assertIndexed(Battle.objects.filter(player=self.player).order_by('-created_at'), ordered=True)
+    
+    def test_battle_list_for_user(self):
+        # Owned and PvP battles come from two indexes, so the merged rows still need a sort
+        plan = self.assertIndexed(Battle.objects.filter(Battle.involving(self.player.pk)).order_by('-created_at'))
+        if connection.vendor == 'sqlite':
+            self.assertIn('participants_player_idx', plan)
+    
+    def test_battles_due_for_archival(self):
+        cutoff = timezone.now() - timedelta(days=30)
+        plan = self.assertIndexed(
+            Battle.objects.filter(is_active=False, updated_at__lt=cutoff, archive__isnull=True).order_by('updated_at'),
+            ordered=True,
+        )
+        if connection.vendor == 'sqlite':
+            self.assertIn('battles_finished_idx', plan)
+    
+    def test_battle_turns_in_order(self):
+        self.assertIndexed(BattleTurn.objects.filter(battle_id=1).order_by('turn_number'), ordered=True)
+    
+    def test_enemy_spawns_for_level(self):
+        self.assertIndexed(EnemySpawn.objects.filter(
+            location_id=1, min_player_level__lte=10, max_player_level__gte=10,
+        ))
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Routing decisions for the read-replica router (no replica database needed)"""
+    
+    def setUp(self):
+        self.router = ReplicaRouter()
+    
+    def test_catalog_reads_use_replica(self):
+        with request_scope():
+            self.assertEqual(self.router.db_for_read(Location), 'replica0')
+            self.assertIsNone(self.router.db_for_read(Player))
+    
+    def test_read_only_scope_uses_replica(self):
+        with request_scope(), use_replica():
+            self.assertEqual(self.router.db_for_read(Player), 'replica0')
+            self.assertIsNone(self.router.db_for_read(User))
+    
+    def test_write_pins_rest_of_request(self):
+        with request_scope(), use_replica():
+            self.assertEqual(self.router.db_for_write(Player), 'default')
+            self.assertIsNone(self.router.db_for_read(Location))
+        with request_scope():
+            self.assertEqual(self.router.db_for_read(Location), 'replica0')
+    
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica0', 'world'))
+        self.assertTrue(self.router.allow_migrate('default', 'world'))
+    
+    def test_middleware_pins_client_after_write(self):
+        def write_view(request):
+            self.router.db_for_write(Player)
+            return HttpResponse()
+        
+        def read_view(request):
+            return HttpResponse(self.router.db_for_read(Location) or 'default')
+        
+        factory = RequestFactory()
+        response = ReplicaPinningMiddleware(write_view)(factory.post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        
+        pinned = factory.get('/')
+        pinned.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        self.assertEqual(ReplicaPinningMiddleware(read_view)(pinned).content, b'default')
+        self.assertEqual(ReplicaPinningMiddleware(read_view)(factory.get('/')).content, b'replica0')
+
+
+class ReplicaDatabaseTests(TestCase):
+    """A replica alias with REPLICA_DATABASE_OPTIONS over its own SQLite file"""
+    
+    alias = 'replica_file'
+    
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor != 'sqlite':
+            raise SkipTest('Replica files are SQLite only')
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = Path(cls.directory.name) / 'replica.sqlite3'
+        # What sync_sqlite_replicas does, before the test transaction opens (the backup would wait on it)
+        connection.ensure_connection()
+        target = sqlite3.connect(cls.path)
+        connection.connection.backup(target)
+        target.close()
+        cls.connect(settings.DATABASES['default']['OPTIONS'])
+        User.objects.db_manager(cls.alias).create_user('reader')
+        cls.connect(settings.REPLICA_DATABASE_OPTIONS)
+        super().setUpClass()
+    
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        cls.directory.cleanup()
+    
+    @classmethod
+    def connect(cls, options):
+        if hasattr(connections._connections, cls.alias):
+            connections[cls.alias].close()
+        connections[cls.alias] = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': cls.path, 'OPTIONS': options}, cls.alias,
+        )
+    
+    def test_reads_inside_transactions(self):
+        with transaction.atomic(using=self.alias):
+            self.assertTrue(User.objects.using(self.alias).filter(username='reader').exists())
+    
+    def test_writes_are_refused(self):
+        with self.assertRaisesMessage(OperationalError, 'readonly database'):
+            with transaction.atomic(using=self.alias):
+                User.objects.db_manager(self.alias).create_user('writer')
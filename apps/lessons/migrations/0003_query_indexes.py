@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0003_alter_player_user'),
+        ('lessons', '0002_alter_hint_options_remove_challenge_hints_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playerchallengeattempt',
+            index=models.Index(fields=['player', 'challenge', '-submission_time'], name='attempts_player_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerchallengeattempt',
+            index=models.Index(condition=models.Q(('passed', True)), fields=['player', 'challenge'], name='attempts_passed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerlessonprogress',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['player'], name='progress_completed_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='playerchallengeattempt',
+            name='challenge',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='lessons.challenge'),
+        ),
+        migrations.AlterField(
+            model_name='playerlessonprogress',
+            name='lesson',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='lessons.lesson'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:40
+
+import django.db.models.deletion
+import json
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def copy_completions(apps, schema_editor):
+    """Turn the completed_challenges JSON lists into rows and fill the counters"""
+    using = schema_editor.connection.alias
+    Lesson = apps.get_model('lessons', 'Lesson')
+    PlayerLessonProgress = apps.get_model('lessons', 'PlayerLessonProgress')
+    ChallengeCompletion = apps.get_model('lessons', 'ChallengeCompletion')
+    
+    for lesson in Lesson.objects.using(using).annotate(total=Count('challenges')):
+        Lesson.objects.using(using).filter(pk=lesson.pk).update(challenge_count=lesson.total)
+    
+    for progress in PlayerLessonProgress.objects.using(using).exclude(completed_challenges=[]):
+        completed = progress.completed_challenges
+        if isinstance(completed, str):
+            # SubmitSolutionView used to store the list JSON-encoded a second time
+            completed = json.loads(completed or '[]')
+        challenge_ids = sorted({int(challenge_id) for challenge_id in completed or []})
+        ChallengeCompletion.objects.using(using).bulk_create([
+            ChallengeCompletion(progress=progress, challenge_id=challenge_id) for challenge_id in challenge_ids
+        ])
+        PlayerLessonProgress.objects.using(using).filter(pk=progress.pk).update(
+            completed_challenge_count=len(challenge_ids)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0004_cross_shard_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='challenge_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='playerlessonprogress',
+            name='completed_challenge_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ChallengeCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+                ('challenge', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='lessons.challenge')),
+                ('progress', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='challenge_completions', to='lessons.playerlessonprogress')),
+            ],
+            options={
+                'db_table': 'challenge_completions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='challengecompletion',
+            constraint=models.UniqueConstraint(fields=('progress', 'challenge'), name='unique_challenge_completion'),
+        ),
+        migrations.RunPython(copy_completions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='playerlessonprogress',
+            name='completed_challenges',
+        ),
+    ]
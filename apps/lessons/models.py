@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 from apps.core.models import TimestampedModel, PythonConcept
 
 
@@ -63,6 +65,9 @@ class Lesson(TimestampedModel):
     unlocks_skills = models.ManyToManyField('battles.Skill', blank=True)
     unlocks_items = models.ManyToManyField('core.GameItem', blank=True)
     
+    # Denormalized, kept in sync by signals on Challenge
+    challenge_count = models.IntegerField(default=0, editable=False)
+    
     class Meta:
         ordering = ['category', 'order', 'title']
     
@@ -147,7 +152,7 @@ class Challenge(TimestampedModel):
 class PlayerLessonProgress(TimestampedModel):
     """Track player progress through lessons"""
     player = models.ForeignKey('characters.Player', on_delete=models.CASCADE)
-    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, db_constraint=False)
     
     # Progress tracking
     is_completed = models.BooleanField(default=False)
@@ -158,7 +163,7 @@ class PlayerLessonProgress(TimestampedModel):
     # Performance
     score = models.IntegerField(default=0)  # 0-100
     attempts = models.IntegerField(default=0)
-    completed_challenges = models.JSONField(default=list)  # List of challenge IDs
+    completed_challenge_count = models.IntegerField(default=0)  # Rows in challenge_completions
     
     # Section progress
     completed_sections = models.JSONField(default=list)
@@ -166,6 +171,9 @@ class PlayerLessonProgress(TimestampedModel):
     
     class Meta:
         unique_together = ['player', 'lesson']
+        indexes = [
+            models.Index(fields=['player'], condition=models.Q(is_completed=True), name='progress_completed_idx'),
+        ]
         verbose_name = 'Player Lesson Progress'
         verbose_name_plural = 'Player Lesson Progress'
     
@@ -174,27 +182,63 @@ class PlayerLessonProgress(TimestampedModel):
     
     @property
     def completion_percentage(self):
-        """Calculate completion percentage based on challenges"""
-        total_challenges = self.lesson.challenges.count()
+        """Calculate completion percentage based on challenges (no query once the lesson is loaded)"""
+        total_challenges = self.lesson.challenge_count
         if total_challenges == 0:
             return 100 if self.is_completed else 0
         
-        completed_count = len(self.completed_challenges) if self.completed_challenges else 0
-        return int((completed_count / total_challenges) * 100)
+        return min(100, int((self.completed_challenge_count / total_challenges) * 100))
+    
+    @cached_property
+    def completed_challenge_ids(self):
+        """Set of completed challenge IDs (one query)"""
+        return set(self.challenge_completions.values_list('challenge_id', flat=True))
+    
+    def has_completed(self, challenge):
+        """Whether a challenge is completed (one indexed lookup)"""
+        if 'completed_challenge_ids' in self.__dict__:
+            return challenge.pk in self.completed_challenge_ids
+        return self.challenge_completions.filter(challenge=challenge).exists()
+    
+    def complete_challenge(self, challenge):
+        """Record a completed challenge; returns False if it was already completed"""
+        using = self._state.db
+        try:
+            with transaction.atomic(using=using):
+                ChallengeCompletion.objects.using(using).create(progress=self, challenge=challenge)
+                PlayerLessonProgress.objects.using(using).filter(pk=self.pk).update(
+                    completed_challenge_count=F('completed_challenge_count') + 1
+                )
+        except IntegrityError:
+            # Completed already (possibly by a concurrent request)
+            return False
+        
+        self.completed_challenge_count += 1
+        if 'completed_challenge_ids' in self.__dict__:
+            self.completed_challenge_ids.add(challenge.pk)
+        return True
+
+
+class ChallengeCompletion(models.Model):
+    """A challenge a player has solved, one row per lesson progress and challenge"""
+    progress = models.ForeignKey(PlayerLessonProgress, on_delete=models.CASCADE, related_name='challenge_completions')
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, db_constraint=False, related_name='completions')
+    completed_at = models.DateTimeField(auto_now_add=True)
     
-    @property
-    def completed_challenges_list(self):
-        """Get list of completed challenge IDs"""
-        import json
-        if isinstance(self.completed_challenges, str):
-            return json.loads(self.completed_challenges)
-        return self.completed_challenges or []
+    class Meta:
+        db_table = 'challenge_completions'
+        constraints = [
+            models.UniqueConstraint(fields=['progress', 'challenge'], name='unique_challenge_completion'),
+        ]
+    
+    def __str__(self):
+        return f"{self.progress_id}: {self.challenge_id}"
 
 
 class PlayerChallengeAttempt(TimestampedModel):
     """Record of player attempts at challenges"""
     player = models.ForeignKey('characters.Player', on_delete=models.CASCADE)
-    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE)
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, db_constraint=False)
     
     # Submission
     submitted_code = models.TextField()
@@ -211,6 +255,10 @@ class PlayerChallengeAttempt(TimestampedModel):
     
     class Meta:
         ordering = ['-submission_time']
+        indexes = [
+            models.Index(fields=['player', 'challenge', '-submission_time'], name='attempts_player_recent_idx'),
+            models.Index(fields=['player', 'challenge'], condition=models.Q(passed=True), name='attempts_passed_idx'),
+        ]
     
     def __str__(self):
         status = "✓" if self.passed else "✗"
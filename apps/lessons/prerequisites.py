@@ -0,0 +1,181 @@
+"""
+Lesson prerequisite closure and per-player unlocks
+
+The prerequisite graph (Lesson.prerequisite_lessons) is loaded once, in
+two queries, into a PrerequisiteGraph. Each lesson gets a bit position,
+and closure[i] is an int bitset of every lesson lesson i transitively
+depends on, built in topological order. A lesson is unlocked when all of
+its transitive prerequisites are completed and the player's level is
+high enough:
+
+    closure[i] & ~completed == 0  and  required_level[i] <= level
+
+so the whole lesson map is O(lessons) bit operations on one set of
+completed lessons. The graph is kept in the app cache (apps/core/cache.py)
+for up to GRAPH_TIMEOUT and rebuilt after any lesson or prerequisite edit;
+a lookup of a lesson the cached graph has not seen yet (created before
+the tag bump reached this worker) reloads it. Edits that would make a
+cycle are rejected before they are written (see signals.py).
+"""
+from typing import Iterable, List, Optional, Set
+
+from django.core.exceptions import ValidationError
+
+from apps.core.cache import get_cache
+
+from .models import Lesson
+
+
+CACHE_KEY = 'lessons:prerequisite_graph'
+CACHE_TAGS = ['lessons.lesson']  # Prerequisite (m2m) changes invalidate the lesson tag too
+GRAPH_TIMEOUT = 24 * 60 * 60  # Seconds; edits invalidate the tag long before this
+
+
+class PrerequisiteCycleError(ValidationError):
+    """Raised when a prerequisite edit would make lessons depend on themselves"""
+
+
+class PrerequisiteGraph:
+    """Lesson DAG with precomputed transitive prerequisite bitsets"""
+    
+    def __init__(self, lessons: Iterable[tuple], edges: Iterable[tuple]):
+        """lessons: (pk, required_level) pairs; edges: (lesson_pk, prerequisite_pk) pairs"""
+        lessons = sorted(lessons)
+        self.pks = [pk for pk, _ in lessons]
+        self.index = {pk: position for position, pk in enumerate(self.pks)}
+        self.required_levels = [level for _, level in lessons]
+        self.direct = [0] * len(self.pks)
+        for lesson_pk, prerequisite_pk in edges:
+            if lesson_pk in self.index and prerequisite_pk in self.index:
+                self.direct[self.index[lesson_pk]] |= 1 << self.index[prerequisite_pk]
+        self.closure = self._close()
+        self._level_masks = {}
+    
+    @classmethod
+    def load(cls) -> 'PrerequisiteGraph':
+        """Build from the database (two queries)"""
+        through = Lesson.prerequisite_lessons.through
+        return cls(
+            Lesson.objects.values_list('pk', 'required_level'),
+            through.objects.values_list('from_lesson_id', 'to_lesson_id'),
+        )
+    
+    def _close(self) -> List[int]:
+        # Kahn's algorithm: a lesson is closed once all its prerequisites are
+        count = len(self.pks)
+        dependents = [[] for _ in range(count)]
+        waiting = [0] * count
+        for position, mask in enumerate(self.direct):
+            for prerequisite in self.positions(mask):
+                dependents[prerequisite].append(position)
+                waiting[position] += 1
+        
+        closure = list(self.direct)
+        ready = [position for position in range(count) if not waiting[position]]
+        done = 0
+        while ready:
+            position = ready.pop()
+            done += 1
+            for dependent in dependents[position]:
+                closure[dependent] |= closure[position]
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if done < count:
+            stuck = [self.pks[position] for position in range(count) if waiting[position]]
+            raise PrerequisiteCycleError(f"Lesson prerequisites form a cycle through lessons {stuck}")
+        return closure
+    
+    @staticmethod
+    def positions(mask: int):
+        """Bit positions set in mask"""
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+    
+    def mask(self, lesson_pks: Iterable[int]) -> int:
+        """Bitset of the given lessons (unknown ids are ignored)"""
+        mask = 0
+        for pk in lesson_pks:
+            position = self.index.get(pk)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+    
+    def pks_in(self, mask: int) -> Set[int]:
+        return {self.pks[position] for position in self.positions(mask)}
+    
+    def prerequisites(self, lesson_pk: int) -> Set[int]:
+        """Every lesson lesson_pk transitively depends on"""
+        position = self.index.get(lesson_pk)
+        return set() if position is None else self.pks_in(self.closure[position])
+    
+    def level_mask(self, level: Optional[int]) -> int:
+        """Bitset of lessons a player of this level may take (all of them if level is None)"""
+        if level is None:
+            return (1 << len(self.pks)) - 1
+        if level not in self._level_masks:
+            self._level_masks[level] = self.mask(
+                pk for pk, required in zip(self.pks, self.required_levels) if required <= level
+            )
+        return self._level_masks[level]
+    
+    def unlocked_mask(self, completed: int, level: Optional[int] = None) -> int:
+        """Bitset of lessons whose prerequisites are all within the completed bitset"""
+        unlocked = 0
+        for position, needed in enumerate(self.closure):
+            if not needed & ~completed:
+                unlocked |= 1 << position
+        return unlocked & self.level_mask(level)
+    
+    def would_cycle(self, lesson_pk: int, prerequisite_pks: Iterable[int]) -> List[int]:
+        """Prerequisites that would make a cycle if added to lesson_pk"""
+        return sorted(
+            pk for pk in prerequisite_pks
+            if pk == lesson_pk or lesson_pk in self.prerequisites(pk)
+        )
+    
+    def __getstate__(self):
+        # The per-level masks are rebuilt lazily
+        return dict(self.__dict__, _level_masks={})
+
+
+def get_prerequisite_graph(lesson_pk: Optional[int] = None) -> PrerequisiteGraph:
+    """The cached prerequisite graph, reloaded if it does not know lesson_pk yet"""
+    cache = get_cache()
+    graph = cache.get_or_set(CACHE_KEY, PrerequisiteGraph.load, timeout=GRAPH_TIMEOUT, tags=CACHE_TAGS)
+    if lesson_pk is not None and lesson_pk not in graph.index:
+        graph = PrerequisiteGraph.load()
+        cache.set(CACHE_KEY, graph, timeout=GRAPH_TIMEOUT, tags=CACHE_TAGS)
+    return graph
+
+
+def check_prerequisites(lesson_pk: int, prerequisite_pks: Iterable[int]):
+    """Raise PrerequisiteCycleError if lesson_pk may not depend on these lessons"""
+    # Read fresh: a stale graph could let a cycle through
+    cycles = PrerequisiteGraph.load().would_cycle(lesson_pk, prerequisite_pks)
+    if cycles:
+        raise PrerequisiteCycleError(
+            f"Lessons {cycles} already depend on lesson {lesson_pk} and cannot be its prerequisites",
+            code='prerequisite_cycle',
+        )
+
+
+def unlocked_lesson_ids(player, graph: Optional[PrerequisiteGraph] = None) -> Set[int]:
+    """Ids of every lesson the player has unlocked (one query for their completed lessons)"""
+    graph = graph or get_prerequisite_graph()
+    completed = player.playerlessonprogress_set.filter(is_completed=True).values_list('lesson_id', flat=True)
+    return graph.pks_in(graph.unlocked_mask(graph.mask(completed), player.level))
+
+
+def is_unlocked(player, lesson_pk: int) -> bool:
+    """Whether one lesson is unlocked (one query, and none without prerequisites)"""
+    graph = get_prerequisite_graph(lesson_pk)
+    position = graph.index.get(lesson_pk)
+    if position is None or graph.required_levels[position] > player.level:
+        return False
+    needed = graph.pks_in(graph.closure[position])
+    return not needed or (
+        player.playerlessonprogress_set.filter(is_completed=True, lesson_id__in=needed).count() == len(needed)
+    )
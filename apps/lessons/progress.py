@@ -0,0 +1,62 @@
+"""
+Lesson lists with the player's progress attached in one query
+"""
+from typing import List
+
+from django.db.models import F, FilteredRelation, Q
+
+from apps.core.sharding import player_shards
+
+from .models import Lesson, PlayerLessonProgress
+
+
+# Progress columns the lesson list needs (completion_percentage reads the
+# counters; challenge totals come from the denormalized Lesson.challenge_count)
+PROGRESS_FIELDS = (
+    'id', 'is_completed', 'is_unlocked', 'completion_date', 'score', 'attempts', 'completed_challenge_count',
+)
+
+
+def lessons_with_progress(player, queryset=None) -> List[Lesson]:
+    """
+    Lessons with category and concept joined and lesson.player_progress set
+    
+    The player's progress comes from the same query through a LEFT JOIN on
+    their PlayerLessonProgress rows ((player, lesson) is unique, so there
+    is at most one per lesson). player_progress is None for lessons the
+    player hasn't started, and each progress has its lesson cached so
+    completion_percentage needs no query. With player shards the progress
+    lives on another database, so it is fetched with one extra query.
+    """
+    queryset = (queryset if queryset is not None else Lesson.objects.all()).select_related('category', 'concept')
+    if player_shards():
+        lessons = list(queryset)
+        progress = PlayerLessonProgress.objects.using(player._state.db).filter(player=player).only('player', 'lesson', *PROGRESS_FIELDS)
+        by_lesson = {p.lesson_id: p for p in progress}
+        for lesson in lessons:
+            lesson.player_progress = by_lesson.get(lesson.pk)
+            if lesson.player_progress is not None:
+                lesson.player_progress.lesson = lesson
+        return lessons
+    
+    lessons = list(
+        queryset
+        .annotate(own_progress=FilteredRelation('playerlessonprogress', condition=Q(playerlessonprogress__player=player)))
+        .annotate(**{f'progress_{field}': F(f'own_progress__{field}') for field in PROGRESS_FIELDS})
+    )
+    # from_db() wants the loaded columns in model order
+    attnames = [
+        field.attname for field in PlayerLessonProgress._meta.concrete_fields
+        if field.attname in PROGRESS_FIELDS or field.attname in ('player_id', 'lesson_id')
+    ]
+    for lesson in lessons:
+        lesson.player_progress = None
+        if lesson.progress_id is None:
+            continue
+        values = {'player_id': player.pk, 'lesson_id': lesson.pk}
+        values.update((field, getattr(lesson, f'progress_{field}')) for field in PROGRESS_FIELDS)
+        progress = PlayerLessonProgress.from_db(lesson._state.db, attnames, [values[name] for name in attnames])
+        progress.player = player
+        progress.lesson = lesson
+        lesson.player_progress = progress
+    return lessons
@@ -0,0 +1,52 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+
+from .models import Challenge, Lesson
+from .prerequisites import check_prerequisites
+
+
+def refresh_challenge_counts(lesson_ids):
+    """Recount Lesson.challenge_count for the given lessons in one UPDATE"""
+    counts = (
+        Challenge.objects.filter(lesson=OuterRef('pk'))
+        .order_by().values('lesson').annotate(count=Count('pk')).values('count')
+    )
+    Lesson.objects.filter(pk__in=lesson_ids).update(challenge_count=Coalesce(Subquery(counts), 0))
+
+
+def remember_challenge_lesson(sender, instance, raw=False, **kwargs):
+    """pre_save: note the lesson a challenge is being moved away from"""
+    if raw or instance.pk is None:
+        return
+    instance._previous_lesson_id = (
+        Challenge.objects.filter(pk=instance.pk).values_list('lesson_id', flat=True).first()
+    )
+
+
+def update_challenge_counts(sender, instance, raw=False, **kwargs):
+    lesson_ids = {instance.lesson_id, getattr(instance, '_previous_lesson_id', None)} - {None}
+    if not raw and lesson_ids:
+        refresh_challenge_counts(lesson_ids)
+
+
+def reject_prerequisite_cycles(sender, instance, action, reverse, pk_set, **kwargs):
+    """m2m_changed: refuse prerequisite additions that would make a cycle"""
+    if action != 'pre_add' or not pk_set:
+        return
+    if reverse:
+        # instance is becoming a prerequisite of the lessons in pk_set
+        for lesson_pk in pk_set:
+            check_prerequisites(lesson_pk, [instance.pk])
+    else:
+        check_prerequisites(instance.pk, pk_set)
+
+
+def connect_signals():
+    """Keep the denormalized challenge counts on lessons in sync and the prerequisite graph acyclic"""
+    pre_save.connect(remember_challenge_lesson, sender=Challenge, dispatch_uid='challenge_previous_lesson')
+    post_save.connect(update_challenge_counts, sender=Challenge, dispatch_uid='challenge_count_save')
+    post_delete.connect(update_challenge_counts, sender=Challenge, dispatch_uid='challenge_count_delete')
+    m2m_changed.connect(
+        reject_prerequisite_cycles, sender=Lesson.prerequisite_lessons.through, dispatch_uid='lesson_prerequisite_cycles',
+    )
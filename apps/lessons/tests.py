@@ -1,3 +1,57 @@
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.template.loader import render_to_string
 from django.test import TestCase
 
-# Create your tests here.
+from apps.characters.models import Player
+from apps.core.models import PythonConcept
+from apps.core.sharding import player_shards
+
+from .models import Challenge, Lesson, LessonCategory
+from .progress import lessons_with_progress
+
+
+class LessonListQueryTests(TestCase):
+    """The lesson list (lessons, categories, concepts and progress) renders from one query"""
+    databases = '__all__'
+    
+    @classmethod
+    def setUpTestData(cls):
+        concept = PythonConcept.objects.create(name='Loops', description='', difficulty='beginner', syntax_example='')
+        categories = [LessonCategory.objects.create(name=f'Category {index}', description='') for index in range(4)]
+        cls.lessons = Lesson.objects.bulk_create([
+            Lesson(
+                category=categories[index % len(categories)], concept=concept, title=f'Lesson {index}',
+                description='', introduction='', example_code='', order=index,
+            )
+            for index in range(40)
+        ])
+        for lesson in cls.lessons[:10]:
+            for number in range(4):
+                Challenge.objects.create(
+                    lesson=lesson, title=f'Challenge {number}', description='', problem_statement='', starter_code='',
+                )
+        
+        cls.player = Player.objects.create(user=User.objects.create_user('student'), name='Student')
+        for lesson in cls.lessons[:10]:
+            progress = cls.player.playerlessonprogress_set.create(lesson=lesson, is_unlocked=True)
+            for challenge in Challenge.objects.filter(lesson=lesson)[:lesson.order % 4]:
+                progress.complete_challenge(challenge)
+    
+    def test_lesson_list_renders_in_one_query(self):
+        # With sharding, the progress is one more query on the player's shard
+        shard_queries = self.assertNumQueries(1, using=self.player._state.db) if player_shards() else nullcontext()
+        with self.assertNumQueries(1), shard_queries:
+            lessons = lessons_with_progress(self.player)
+            html = render_to_string('lessons/lesson_list.html', {'lessons': lessons})
+        self.assertEqual(len(lessons), 40)
+        self.assertIn('Lesson 39', html)
+    
+    def test_progress_is_attached(self):
+        lessons = {lesson.title: lesson for lesson in lessons_with_progress(self.player)}
+        self.assertIsNone(lessons['Lesson 20'].player_progress)
+        progress = lessons['Lesson 3'].player_progress
+        self.assertEqual(progress.completed_challenge_count, 3)
+        self.assertEqual(progress.completion_percentage, 75)
+        self.assertEqual(lessons['Lesson 4'].player_progress.completion_percentage, 0)
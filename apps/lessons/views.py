@@ -1,48 +1,58 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, redirect
 from django.views.generic import ListView, DetailView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib import messages
 import json
 
 from .models import Lesson, Challenge, PlayerLessonProgress, Hint
+from .prerequisites import is_unlocked, unlocked_lesson_ids
+from .progress import lessons_with_progress
 from apps.characters.models import Player, ConceptMastery
 from apps.core.models import PythonConcept
+from apps.core.catalog import CatalogObjectMixin, get_catalog
+from apps.core.events import ChallengePassed, publish
 from apps.core.game_engine import GameEngine
+from apps.core.routers import ReplicaReadsMixin
 
 
-class LessonListView(LoginRequiredMixin, ListView):
+class LessonListView(ReplicaReadsMixin, LoginRequiredMixin, ListView):
     """Display all available lessons"""
     model = Lesson
     template_name = 'lessons/lesson_list.html'
     context_object_name = 'lessons'
     
+    def get_queryset(self):
+        # Lessons, their category/concept and the player's progress in one query
+        return lessons_with_progress(self.request.user.player, super().get_queryset())
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Get player's progress on all lessons
-        player = self.request.user.player
-        progress = PlayerLessonProgress.objects.filter(player=player)
-        progress_dict = {p.lesson_id: p for p in progress}
-        
-        # Add progress info to each lesson
+        # One pass over the precomputed prerequisite bitsets
+        unlocked = unlocked_lesson_ids(self.request.user.player)
         for lesson in context['lessons']:
-            lesson.player_progress = progress_dict.get(lesson.id)
-            
+            lesson.is_locked = lesson.pk not in unlocked
         return context
 
 
-class LessonDetailView(LoginRequiredMixin, DetailView):
+class LessonDetailView(CatalogObjectMixin, LoginRequiredMixin, DetailView):
     """Display a specific lesson with its content and challenges"""
     model = Lesson
     template_name = 'lessons/lesson_detail.html'
     context_object_name = 'lesson'
     
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if not is_unlocked(request.user.player, self.object.pk):
+            messages.error(request, "Complete this lesson's prerequisites first!")
+            return redirect('lessons:list')
+        return self.render_to_response(self.get_context_data(object=self.object))
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         player = self.request.user.player
         
-        # Get or create progress for this lesson
+        # Get or create progress for this lesson (get() checked that it is unlocked)
         progress, created = PlayerLessonProgress.objects.get_or_create(
             player=player,
             lesson=self.object,
@@ -50,12 +60,14 @@ class LessonDetailView(LoginRequiredMixin, DetailView):
         )
         
         context['progress'] = progress
-        context['challenges'] = self.object.challenges.all().order_by('order')
+        context['challenges'] = sorted(
+            get_catalog().related(Challenge, 'lesson', self.object.pk), key=lambda challenge: challenge.order
+        )
         
         return context
 
 
-class ChallengeView(LoginRequiredMixin, DetailView):
+class ChallengeView(CatalogObjectMixin, LoginRequiredMixin, DetailView):
     """Display a specific challenge for the player to solve"""
     model = Challenge
     template_name = 'lessons/challenge.html'
@@ -76,11 +88,10 @@ class ChallengeView(LoginRequiredMixin, DetailView):
             return redirect('lessons:list')
             
         # Get hints for this challenge
-        context['hints'] = self.object.hints.all().order_by('order')
+        context['hints'] = get_catalog().related(Hint, 'challenge', self.object.pk)
         
         # Check if player has completed this challenge
-        completed_challenges = json.loads(progress.completed_challenges or '[]')
-        context['is_completed'] = self.object.id in completed_challenges
+        context['is_completed'] = progress.has_completed(self.object)
         
         return context
 
@@ -89,7 +100,9 @@ class SubmitSolutionView(LoginRequiredMixin, View):
     """Handle solution submission for a challenge"""
     
     def post(self, request, challenge_id):
-        challenge = get_object_or_404(Challenge, id=challenge_id)
+        challenge = get_catalog().get(Challenge, challenge_id)
+        if challenge is None:
+            raise Http404("No challenge found")
         player = request.user.player
         
         try:
@@ -113,11 +126,11 @@ class SubmitSolutionView(LoginRequiredMixin, View):
                         lesson=challenge.lesson
                     )
                     
-                    completed = json.loads(progress.completed_challenges or '[]')
-                    if challenge.id not in completed:
-                        completed.append(challenge.id)
-                        progress.completed_challenges = json.dumps(completed)
-                        progress.save()
+                    if progress.complete_challenge(challenge):
+                        publish(ChallengePassed(
+                            player_id=player.pk, challenge_id=challenge.pk, lesson_id=challenge.lesson_id,
+                            using=progress._state.db,
+                        ))
                     
                     # Award experience
                     player.add_experience(challenge.experience_reward)
@@ -179,7 +192,7 @@ class SubmitSolutionView(LoginRequiredMixin, View):
     
     def _get_hint(self, challenge, attempt_number):
         """Get an appropriate hint based on the number of attempts"""
-        hints = challenge.hints.all().order_by('order')
+        hints = get_catalog().related(Hint, 'challenge', challenge.pk)
         
         if hints and attempt_number < len(hints):
             return hints[attempt_number].content
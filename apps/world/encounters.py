@@ -0,0 +1,125 @@
+"""
+Weighted encounter tables compiled from EnemySpawn rows
+
+Each location's spawns are compiled once into level buckets: the player
+level range is split at every spawn's min/max level, and each bucket
+gets a Walker/Vose alias sampler over the spawns eligible in it. A draw
+is then a bisect over the (few) bucket boundaries plus an O(1) alias
+draw, with no database access.
+"""
+import random
+import threading
+from bisect import bisect_right
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .models import EnemySpawn
+
+
+class AliasSampler:
+    """Walker's alias method for O(1) weighted sampling"""
+    
+    def __init__(self, items: Sequence, weights: Sequence[float]):
+        n = len(items)
+        if n == 0:
+            raise ValueError("AliasSampler needs at least one item")
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self.items = list(items)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Leftovers are 1.0 up to floating point error
+        for i in small + large:
+            self.prob[i] = 1.0
+    
+    def draw(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+
+class EncounterTable:
+    """Level-bucketed alias samplers for one location"""
+    
+    def __init__(self, spawns: Iterable[Tuple[int, float, int, int, str]]):
+        # (enemy_id, spawn_rate, min_level, max_level, story_flag_required)
+        self.spawns = [spawn for spawn in spawns if spawn[1] > 0]
+        self.boundaries: List[int] = sorted(
+            {spawn[2] for spawn in self.spawns} | {spawn[3] + 1 for spawn in self.spawns}
+        )
+        self.buckets: List[List[tuple]] = []
+        for level in self.boundaries:
+            self.buckets.append([spawn for spawn in self.spawns if spawn[2] <= level <= spawn[3]])
+        self._samplers: Dict[Tuple[int, FrozenSet[str]], Optional[AliasSampler]] = {}
+    
+    def _sampler(self, bucket_index: int, flags: FrozenSet[str]) -> Optional[AliasSampler]:
+        key = (bucket_index, flags)
+        if key not in self._samplers:
+            eligible = [
+                spawn for spawn in self.buckets[bucket_index]
+                if not spawn[4] or spawn[4] in flags
+            ]
+            self._samplers[key] = AliasSampler(
+                [spawn[0] for spawn in eligible],
+                [spawn[1] for spawn in eligible],
+            ) if eligible else None
+        return self._samplers[key]
+    
+    def draw(self, player_level: int, story_flags: Iterable[str] = (), rng=random) -> Optional[int]:
+        """Pick an enemy id for a player level, or None if nothing spawns there"""
+        index = bisect_right(self.boundaries, player_level) - 1
+        if index < 0:
+            return None
+        # Only the flags that gate a spawn in this bucket matter for the sampler key
+        gating = {spawn[4] for spawn in self.buckets[index] if spawn[4]}
+        flags = frozenset(flag for flag in story_flags if flag in gating)
+        sampler = self._sampler(index, flags)
+        return sampler.draw(rng) if sampler else None
+
+
+_tables: Dict[int, EncounterTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_encounter_table(location_id: int) -> EncounterTable:
+    """Compiled table for a location (one query on first use, cached afterwards)"""
+    table = _tables.get(location_id)
+    if table is None:
+        spawns = EnemySpawn.objects.filter(location_id=location_id).values_list(
+            'enemy_id', 'spawn_rate', 'min_player_level', 'max_player_level', 'story_flag_required'
+        )
+        table = EncounterTable(spawns)
+        with _tables_lock:
+            _tables[location_id] = table
+    return table
+
+
+def draw_encounter(location_id: int, player_level: int, story_flags: Iterable[str] = (), rng=random) -> Optional[int]:
+    """Draw an enemy id for a random encounter at a location"""
+    return get_encounter_table(location_id).draw(player_level, story_flags, rng)
+
+
+def remember_spawn_location(sender, instance, raw=False, **kwargs):
+    """pre_save: note the location an enemy spawn is being moved away from"""
+    if raw or instance.pk is None:
+        return
+    instance._previous_location_id = (
+        EnemySpawn.objects.filter(pk=instance.pk).values_list('location_id', flat=True).first()
+    )
+
+
+def invalidate_encounter_table(sender=None, instance=None, **kwargs):
+    """Drop the compiled tables of a spawn's old and new location (or all of them) after spawn changes"""
+    with _tables_lock:
+        if instance is not None and instance.location_id is not None:
+            for location_id in {instance.location_id, getattr(instance, '_previous_location_id', None)} - {None}:
+                _tables.pop(location_id, None)
+        else:
+            _tables.clear()
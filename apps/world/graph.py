@@ -0,0 +1,380 @@
+"""
+In-memory travel graph of each world's locations
+
+A WorldGraph holds one world's locations as dense indices with
+coordinate arrays and per-location adjacency arrays (neighbor indices and
+Euclidean edge lengths), loaded in two queries. Neighbors, reachability
+(connected components, labelled on first use) and shortest travel paths
+(Dijkstra over coordinate distances) are answered from memory.
+
+Paths between two locations of the same region come from that region's
+all-pairs table: one Dijkstra from every location in the region over the
+whole world graph, computed on first use and kept until an edit could
+change it.
+
+Edits are applied incrementally (see signals.py): a connection added or
+removed, or a location moved, patches only the adjacency arrays of the
+locations involved and drops only the region tables in the affected
+connected component. Other workers notice the edit through the
+'world.location' tag of the app cache (apps/core/cache.py), bumped when
+the edit commits, and reload the world. A process-local app cache never
+sees other processes' bumps (a single web worker still misses edits made
+from the shell or a management command), so without a shared cache a
+graph is also reloaded every LOCAL_RELOAD_INTERVAL seconds.
+"""
+import heapq
+import math
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from apps.core.cache import get_cache
+
+from .models import Location, Region
+
+
+CACHE_TAGS = ['world.location']  # Location saves and connection changes both bump it
+LOCAL_RELOAD_INTERVAL = 60.0  # Seconds; only used when the app cache is process-local
+
+UNREACHABLE = math.inf
+
+
+class RegionTable:
+    """Shortest distances and predecessors from every location of a region"""
+    
+    def __init__(self, sources: List[int], distances: Dict[int, Dict[int, float]], previous: Dict[int, array]):
+        self.sources = sources
+        self.distances = distances  # source index -> {target index: distance} for reached targets
+        self.previous = previous  # source index -> predecessor index per location (-1: none)
+
+
+class WorldGraph:
+    """Adjacency arrays for one world's location graph"""
+    
+    def __init__(self, world_id: int, locations: Iterable[tuple], edges: Iterable[tuple], version=None):
+        """locations: (id, region_id, x, y); edges: (location_id, location_id) pairs"""
+        self.world_id = world_id
+        self.version = version
+        self.ids: List[Optional[int]] = []
+        self.index: Dict[int, int] = {}
+        self.regions = array('q')
+        self.x = array('d')
+        self.y = array('d')
+        self.adjacency: List[array] = []
+        self.weights: List[array] = []
+        for location_id, region_id, x, y in locations:
+            self._append(location_id, region_id, x, y)
+        for a, b in edges:
+            if a in self.index and b in self.index:
+                self._link(self.index[a], self.index[b])
+        self._components: Optional[array] = None
+        self._region_tables: Dict[int, RegionTable] = {}
+        self._lock = threading.RLock()
+    
+    @classmethod
+    def load(cls, world_id: int, version=None) -> 'WorldGraph':
+        """Build one world's graph from the database (two queries)"""
+        through = Location.connected_locations.through
+        return cls(
+            world_id,
+            Location.objects.filter(region__world_id=world_id).order_by('pk')
+            .values_list('pk', 'region_id', 'x_coordinate', 'y_coordinate'),
+            through.objects.filter(from_location__region__world_id=world_id)
+            .values_list('from_location_id', 'to_location_id'),
+            version=version,
+        )
+    
+    # Structure
+    
+    def _append(self, location_id: int, region_id: int, x: float, y: float) -> int:
+        position = len(self.ids)
+        self.ids.append(location_id)
+        self.index[location_id] = position
+        self.regions.append(region_id)
+        self.x.append(x)
+        self.y.append(y)
+        self.adjacency.append(array('q'))
+        self.weights.append(array('d'))
+        return position
+    
+    def _distance(self, a: int, b: int) -> float:
+        return math.hypot(self.x[a] - self.x[b], self.y[a] - self.y[b])
+    
+    def _link(self, a: int, b: int):
+        # Symmetric relation: the through table holds both directions, so add each side once
+        if a != b and b not in self.adjacency[a]:
+            weight = self._distance(a, b)
+            self.adjacency[a].append(b)
+            self.weights[a].append(weight)
+            self.adjacency[b].append(a)
+            self.weights[b].append(weight)
+    
+    def _unlink(self, a: int, b: int):
+        for source, target in ((a, b), (b, a)):
+            neighbors = self.adjacency[source]
+            if target in neighbors:
+                slot = neighbors.index(target)
+                del neighbors[slot]
+                del self.weights[source][slot]
+    
+    def _reweigh(self, position: int):
+        for slot, neighbor in enumerate(self.adjacency[position]):
+            weight = self._distance(position, neighbor)
+            self.weights[position][slot] = weight
+            self.weights[neighbor][self.adjacency[neighbor].index(position)] = weight
+    
+    def _affected(self, positions: Iterable[int]):
+        """Forget what an edit around these locations may have changed"""
+        components = self.components()
+        touched = {components[position] for position in positions}
+        for region_id, table in list(self._region_tables.items()):
+            if any(components[source] in touched for source in table.sources):
+                del self._region_tables[region_id]
+        self._components = None
+    
+    # Incremental edits
+    
+    def connect(self, location_id: int, other_ids: Iterable[int]):
+        with self._lock:
+            pairs = [(self.index[location_id], self.index[other]) for other in other_ids
+                     if location_id in self.index and other in self.index]
+            self._affected({position for pair in pairs for position in pair})
+            for a, b in pairs:
+                self._link(a, b)
+    
+    def disconnect(self, location_id: int, other_ids: Optional[Iterable[int]] = None):
+        """Remove connections (all of the location's if other_ids is None)"""
+        with self._lock:
+            position = self.index.get(location_id)
+            if position is None:
+                return
+            others = list(self.adjacency[position]) if other_ids is None else [
+                self.index[other] for other in other_ids if other in self.index
+            ]
+            self._affected([position, *others])
+            for other in others:
+                self._unlink(position, other)
+    
+    def upsert_location(self, location_id: int, region_id: int, x: float, y: float):
+        """Add a location or apply a move to another position or region"""
+        with self._lock:
+            position = self.index.get(location_id)
+            if position is None:
+                self._append(location_id, region_id, x, y)
+                self._components = None
+                self._region_tables.pop(region_id, None)
+                return
+            if (self.regions[position], self.x[position], self.y[position]) == (region_id, x, y):
+                return
+            self._affected([position])
+            # Either region's set of locations may have changed
+            self._region_tables.pop(self.regions[position], None)
+            self._region_tables.pop(region_id, None)
+            self.regions[position] = region_id
+            self.x[position], self.y[position] = x, y
+            self._reweigh(position)
+    
+    def remove_location(self, location_id: int):
+        with self._lock:
+            if location_id not in self.index:
+                return
+            self.disconnect(location_id)
+            position = self.index.pop(location_id)
+            self._region_tables.pop(self.regions[position], None)
+            self.ids[position] = None  # Tombstone; indices of the others stay valid
+    
+    # Queries
+    
+    def __contains__(self, location_id: int) -> bool:
+        return location_id in self.index
+    
+    def neighbors(self, location_id: int) -> List[Tuple[int, float]]:
+        """(location id, distance) for each directly connected location"""
+        position = self.index.get(location_id)
+        if position is None:
+            return []
+        return [(self.ids[other], weight) for other, weight in zip(self.adjacency[position], self.weights[position])]
+    
+    def components(self) -> array:
+        """Connected component label per location index"""
+        components = self._components
+        if components is None:
+            components = array('q', [-1]) * len(self.ids)
+            for start in range(len(self.ids)):
+                if components[start] != -1:
+                    continue
+                components[start] = start
+                stack = [start]
+                while stack:
+                    for neighbor in self.adjacency[stack.pop()]:
+                        if components[neighbor] == -1:
+                            components[neighbor] = start
+                            stack.append(neighbor)
+            self._components = components
+        return components
+    
+    def reachable(self, source_id: int, target_id: int) -> bool:
+        if source_id not in self.index or target_id not in self.index:
+            return False
+        components = self.components()
+        return components[self.index[source_id]] == components[self.index[target_id]]
+    
+    def reachable_from(self, location_id: int) -> Set[int]:
+        position = self.index.get(location_id)
+        if position is None:
+            return set()
+        components = self.components()
+        label = components[position]
+        return {self.ids[other] for other, other_label in enumerate(components) if other_label == label}
+    
+    def _dijkstra(self, source: int, target: Optional[int] = None) -> Tuple[Dict[int, float], array]:
+        distances = {source: 0.0}
+        previous = array('q', [-1]) * len(self.ids)
+        heap = [(0.0, source)]
+        while heap:
+            distance, position = heapq.heappop(heap)
+            if position == target:
+                break
+            if distance > distances[position]:
+                continue
+            for neighbor, weight in zip(self.adjacency[position], self.weights[position]):
+                candidate = distance + weight
+                if candidate < distances.get(neighbor, UNREACHABLE):
+                    distances[neighbor] = candidate
+                    previous[neighbor] = position
+                    heapq.heappush(heap, (candidate, neighbor))
+        return distances, previous
+    
+    def _walk(self, previous: array, source: int, target: int) -> List[int]:
+        path = [target]
+        while path[-1] != source:
+            path.append(previous[path[-1]])
+        return [self.ids[position] for position in reversed(path)]
+    
+    def region_table(self, region_id: int) -> RegionTable:
+        """All-pairs shortest paths from the region's locations (computed once per edit)"""
+        with self._lock:
+            table = self._region_tables.get(region_id)
+            if table is None:
+                sources = [
+                    position for position, region in enumerate(self.regions)
+                    if region == region_id and self.ids[position] is not None
+                ]
+                members = set(sources)
+                distances, previous = {}, {}
+                for source in sources:
+                    reached, previous[source] = self._dijkstra(source)
+                    distances[source] = {target: reached[target] for target in members if target in reached}
+                table = self._region_tables[region_id] = RegionTable(sources, distances, previous)
+            return table
+    
+    def shortest_path(self, source_id: int, target_id: int) -> Tuple[float, List[int]]:
+        """(travel distance, location ids from source to target); (inf, []) if unreachable"""
+        source, target = self.index.get(source_id), self.index.get(target_id)
+        if source is None or target is None or not self.reachable(source_id, target_id):
+            return UNREACHABLE, []
+        if self.regions[source] == self.regions[target]:
+            table = self.region_table(self.regions[source])
+            return table.distances[source][target], self._walk(table.previous[source], source, target)
+        distances, previous = self._dijkstra(source, target)
+        return distances[target], self._walk(previous, source, target)
+    
+    def region_distances(self, region_id: int) -> Dict[int, Dict[int, float]]:
+        """{source id: {target id: distance}} between the region's locations, for map rendering"""
+        table = self.region_table(region_id)
+        return {
+            self.ids[source]: {self.ids[target]: distance for target, distance in reached.items()}
+            for source, reached in table.distances.items()
+        }
+
+
+_graphs: Dict[int, WorldGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def _version():
+    cache = get_cache()
+    version = cache.tag_versions(CACHE_TAGS)
+    if not cache.shared:
+        # Other processes' tag bumps never arrive; expire on a clock instead
+        return version, int(time.monotonic() // LOCAL_RELOAD_INTERVAL)
+    return version
+
+
+def get_world_graph(world_id: int) -> WorldGraph:
+    """A world's graph (two queries on first use, reloaded after edits made elsewhere)"""
+    version = _version()
+    graph = _graphs.get(world_id)
+    if graph is None or graph.version != version:
+        graph = WorldGraph.load(world_id, version)
+        with _graphs_lock:
+            _graphs[world_id] = graph
+    return graph
+
+
+def world_of_location(location_id: int) -> Optional[int]:
+    """World id of a location, from a loaded graph if possible"""
+    for world_id, graph in list(_graphs.items()):
+        if location_id in graph:
+            return world_id
+    return Location.objects.filter(pk=location_id).values_list('region__world_id', flat=True).first()
+
+
+def graph_for_location(location_id: int) -> Optional[WorldGraph]:
+    world_id = world_of_location(location_id)
+    return get_world_graph(world_id) if world_id is not None else None
+
+
+def _loaded_graphs_with(location_ids: Iterable[int]) -> List[WorldGraph]:
+    location_ids = set(location_ids)
+    return [graph for graph in list(_graphs.values()) if any(pk in graph for pk in location_ids)]
+
+
+def _keep_version(graphs: List[WorldGraph], using: str):
+    # Once the edit commits the cache tag moves on; these graphs already have it
+    def sync():
+        version = _version()
+        for graph in graphs:
+            graph.version = version
+    transaction.on_commit(sync, using=using)
+
+
+def update_connections(sender, instance, action, reverse, model, pk_set, using=None, **kwargs):
+    """m2m_changed on Location.connected_locations: patch the loaded graphs"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    graphs = _loaded_graphs_with([instance.pk])
+    for graph in graphs:
+        if action == 'post_add':
+            graph.connect(instance.pk, pk_set)
+        else:
+            graph.disconnect(instance.pk, None if action == 'post_clear' else pk_set)
+    _keep_version(graphs, using)
+
+
+def update_location(sender, instance, raw=False, using=None, **kwargs):
+    """post_save on Location: add or move it in the loaded graphs"""
+    if raw or not _graphs:
+        return
+    world_id = Region.objects.using(using).filter(pk=instance.region_id).values_list('world_id', flat=True).first()
+    graphs = []
+    for graph_world_id, graph in list(_graphs.items()):
+        if graph_world_id == world_id:
+            graph.upsert_location(instance.pk, instance.region_id, instance.x_coordinate, instance.y_coordinate)
+            graphs.append(graph)
+        elif instance.pk in graph:
+            # Moved to a region of another world
+            graph.remove_location(instance.pk)
+            graphs.append(graph)
+    _keep_version(graphs, using)
+
+
+def remove_location(sender, instance, using=None, **kwargs):
+    """post_delete on Location: drop it from the loaded graphs"""
+    graphs = _loaded_graphs_with([instance.pk])
+    for graph in graphs:
+        graph.remove_location(instance.pk)
+    _keep_version(graphs, using)
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0003_alter_player_user'),
+        ('world', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enemyspawn',
+            index=models.Index(fields=['location', 'min_player_level', 'max_player_level'], name='spawns_level_range_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0004_player_shards'),
+        ('world', '0002_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerQuest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('completed', 'Completed'), ('abandoned', 'Abandoned')], default='active', max_length=20)),
+                ('accepted_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quests', to='characters.player')),
+                ('quest', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='player_quests', to='world.quest')),
+            ],
+            options={
+                'db_table': 'player_quests',
+                'unique_together': {('player', 'quest')},
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestObjectiveProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('event_type', models.CharField(max_length=30)),
+                ('target', models.BigIntegerField(blank=True, null=True)),
+                ('required', models.IntegerField(default=1)),
+                ('progress', models.IntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='characters.player')),
+                ('player_quest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='objectives', to='world.playerquest')),
+            ],
+            options={
+                'db_table': 'quest_objective_progress',
+                'indexes': [models.Index(condition=models.Q(('completed', False)), fields=['player', 'event_type', 'target'], name='objective_listener_idx')],
+                'unique_together': {('player_quest', 'position')},
+            },
+        ),
+    ]
@@ -166,6 +166,54 @@ class Quest(TimestampedModel):
         return f"{self.name} ({self.get_quest_type_display()})"
 
 
+class PlayerQuest(models.Model):
+    """A quest a player has accepted (lives on the player's shard)"""
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+        ('abandoned', 'Abandoned'),
+    ]
+    
+    player = models.ForeignKey('characters.Player', on_delete=models.CASCADE, related_name='quests')
+    quest = models.ForeignKey(Quest, on_delete=models.CASCADE, db_constraint=False, related_name='player_quests')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    accepted_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'player_quests'
+        unique_together = ['player', 'quest']
+    
+    def __str__(self):
+        return f"{self.player.name} - {self.quest.name} ({self.status})"
+
+
+class QuestObjectiveProgress(models.Model):
+    """Progress on one entry of Quest.objectives, indexed by the event type it listens for"""
+    player_quest = models.ForeignKey(PlayerQuest, on_delete=models.CASCADE, related_name='objectives')
+    player = models.ForeignKey('characters.Player', on_delete=models.CASCADE)  # Denormalized for the listener index
+    position = models.IntegerField()  # Index into Quest.objectives
+    event_type = models.CharField(max_length=30)  # apps.core.events.Event.type
+    target = models.BigIntegerField(null=True, blank=True)  # Id the event must be about; null matches any
+    required = models.IntegerField(default=1)
+    progress = models.IntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    
+    class Meta:
+        db_table = 'quest_objective_progress'
+        unique_together = ['player_quest', 'position']
+        indexes = [
+            # The per-player listener index: open objectives by event type
+            models.Index(
+                fields=['player', 'event_type', 'target'], condition=models.Q(completed=False),
+                name='objective_listener_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.progress}/{self.required}"
+
+
 class EnemySpawn(models.Model):
     """Control enemy spawning in locations"""
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
@@ -183,6 +231,9 @@ class EnemySpawn(models.Model):
     class Meta:
         db_table = 'enemy_spawns'
         unique_together = ['location', 'enemy']
+        indexes = [
+            models.Index(fields=['location', 'min_player_level', 'max_player_level'], name='spawns_level_range_idx'),
+        ]
 
 
 class NPCSpawn(models.Model):
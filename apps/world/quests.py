@@ -0,0 +1,177 @@
+"""
+Event-driven quest objective tracking
+
+Quest.objectives entries look like
+
+    {"type": "enemy_defeated", "target": 12, "count": 3, "description": "Defeat 3 slimes"}
+
+type is an apps.core.events event type, target the id the event must be
+about (omit it to match any) and count how many times it must happen
+(quantity for item_gained). The grouped form used by the fixtures,
+
+    {"defeat_enemies": [{"enemy_id": 12, "count": 3}]}
+
+is read as the same list (GROUPED_OBJECTIVES). Accepting a quest copies
+its objectives into QuestObjectiveProgress rows on the player's shard;
+the partial index on (player, event_type, target) over open objectives is
+the player's listener index.
+
+record_event() (subscribed to every objective event) looks up only the
+objectives listening for that event type and target and bumps their
+counters in place, so an event costs O(matching objectives) however many
+quests exist. When the app cache is shared between workers, the set of
+event types a player listens for is cached, so events nobody is waiting
+for cost no query at all. When an objective update closes a quest's last
+open objective the quest is completed and a QuestCompleted event is
+published, which other objectives can listen for.
+"""
+from typing import FrozenSet, List
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from apps.core.cache import get_cache
+from apps.core.events import EVENT_TYPES, Event, QuestCompleted, publish
+from apps.core.sharding import CATALOG_DATABASE, player_shards, shard_for_player
+
+from .models import PlayerQuest, Quest, QuestObjectiveProgress
+
+
+LISTENING_TIMEOUT = 3600
+
+# Grouped objective keys -> (event type, key holding the target id)
+GROUPED_OBJECTIVES = {
+    'defeat_enemies': ('enemy_defeated', 'enemy_id'),
+    'complete_challenges': ('challenge_passed', 'challenge_id'),
+    'collect_items': ('item_gained', 'item_id'),
+    'visit_locations': ('location_entered', 'location_id'),
+    'complete_quests': ('quest_completed', 'quest_id'),
+}
+
+
+def _listening_tag(player_id: int) -> str:
+    return f'quests.player:{player_id}'
+
+
+def _listeners_changed(player_id: int, using: str):
+    # Now for this process, and again on commit so no worker caches the old set
+    get_cache().invalidate(_listening_tag(player_id))
+    transaction.on_commit(lambda: get_cache().invalidate(_listening_tag(player_id)), using=using)
+
+
+def _player_db(event: Event) -> str:
+    if event.using:
+        return event.using
+    return shard_for_player(event.player_id) if player_shards() else CATALOG_DATABASE
+
+
+def objective_list(objectives) -> List[dict]:
+    """Quest.objectives as a flat list of {type, target, count} entries"""
+    if not isinstance(objectives, dict):
+        return list(objectives or [])
+    flat = []
+    for key, entries in objectives.items():
+        event_type, target_key = GROUPED_OBJECTIVES.get(key, (key, None))
+        for entry in entries if isinstance(entries, list) else [entries]:
+            entry = entry if isinstance(entry, dict) else {}
+            flat.append({'type': event_type, 'target': entry.get(target_key), 'count': entry.get('count', 1)})
+    return flat
+
+
+def parse_objectives(quest: Quest) -> List[QuestObjectiveProgress]:
+    """Unsaved progress rows for the quest's trackable objectives (unknown types are skipped)"""
+    rows = []
+    for position, objective in enumerate(objective_list(quest.objectives)):
+        if not isinstance(objective, dict) or objective.get('type') not in EVENT_TYPES:
+            continue
+        rows.append(QuestObjectiveProgress(
+            position=position,
+            event_type=objective['type'],
+            target=objective.get('target'),
+            required=max(1, int(objective.get('count', 1))),
+        ))
+    return rows
+
+
+def accept_quest(player, quest: Quest) -> PlayerQuest:
+    """Start tracking a quest for a player (returns the existing entry if already accepted)"""
+    using = player._state.db
+    with transaction.atomic(using=using):
+        player_quest, created = PlayerQuest.objects.using(using).get_or_create(player=player, quest=quest)
+        if created:
+            objectives = parse_objectives(quest)
+            for objective in objectives:
+                objective.player_quest = player_quest
+                objective.player = player
+            QuestObjectiveProgress.objects.using(using).bulk_create(objectives)
+    if created:
+        _listeners_changed(player.pk, using)
+    return player_quest
+
+
+def listening_event_types(player_id: int, using: str) -> FrozenSet[str]:
+    """Event types some open objective of the player is waiting for (cached if the app cache is shared)"""
+    def load():
+        return frozenset(
+            QuestObjectiveProgress.objects.using(using)
+            .filter(player_id=player_id, completed=False)
+            .values_list('event_type', flat=True).distinct()
+        )
+    
+    cache = get_cache()
+    if not cache.shared:
+        # A process-local cache never hears of quests accepted in other workers;
+        # a stale empty set there would drop their events
+        return load()
+    # Shared: invalidations reach every worker within the cache's TAG_TTL
+    return cache.get_or_set(
+        f'quests:listening:{player_id}', load, timeout=LISTENING_TIMEOUT, tags=[_listening_tag(player_id)],
+    )
+
+
+def record_event(event: Event) -> List[int]:
+    """Advance the player's objectives matching event; returns the ids of quests it completed"""
+    using = _player_db(event)
+    if event.type not in listening_event_types(event.player_id, using):
+        return []
+    
+    matching = QuestObjectiveProgress.objects.using(using).filter(
+        Q(target=event.target) | Q(target__isnull=True),
+        player_id=event.player_id, event_type=event.type, completed=False,
+    )
+    with transaction.atomic(using=using):
+        touched = list(matching.select_for_update().values_list('pk', 'player_quest_id'))
+        if not touched:
+            return []
+        objective_ids = [pk for pk, _ in touched]
+        objectives = QuestObjectiveProgress.objects.using(using).filter(pk__in=objective_ids)
+        objectives.update(progress=Least(F('progress') + event.amount, F('required')))
+        closed = objectives.filter(progress__gte=F('required')).update(completed=True)
+        
+        completed_quests = []
+        if closed:
+            quest_ids = {player_quest_id for _, player_quest_id in touched}
+            still_open = set(
+                QuestObjectiveProgress.objects.using(using)
+                .filter(player_quest_id__in=quest_ids, completed=False)
+                .values_list('player_quest_id', flat=True)
+            )
+            completed_quests = _complete(using, quest_ids - still_open)
+    
+    if closed:
+        _listeners_changed(event.player_id, using)
+    for quest_id in completed_quests:
+        publish(QuestCompleted(player_id=event.player_id, quest_id=quest_id, using=using))
+    return completed_quests
+
+
+def _complete(using: str, player_quest_ids) -> List[int]:
+    """Mark player quests completed; returns their Quest ids"""
+    if not player_quest_ids:
+        return []
+    player_quests = PlayerQuest.objects.using(using).filter(pk__in=player_quest_ids, status='active')
+    quest_ids = list(player_quests.values_list('quest_id', flat=True))
+    player_quests.update(status='completed', completed_at=timezone.now())
+    return quest_ids
@@ -0,0 +1,32 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
+
+from apps.core.events import EVENT_TYPES, subscribe
+
+from .encounters import invalidate_encounter_table, remember_spawn_location
+from .graph import remove_location, update_connections, update_location
+from .models import EnemySpawn, ItemSpawn, Location, NPCSpawn
+from .spatial import (
+    remove_item_entry, remove_location_entry, remove_npc_entry, update_item_entry, update_location_entry,
+    update_npc_entry,
+)
+from .quests import record_event
+
+
+def connect_signals():
+    """Keep in-process world caches, graphs and spatial indexes in sync with admin edits and track quest objectives"""
+    pre_save.connect(remember_spawn_location, sender=EnemySpawn, dispatch_uid='encounters_spawn_previous_location')
+    post_save.connect(invalidate_encounter_table, sender=EnemySpawn, dispatch_uid='encounters_spawn_save')
+    post_delete.connect(invalidate_encounter_table, sender=EnemySpawn, dispatch_uid='encounters_spawn_delete')
+    post_save.connect(update_location, sender=Location, dispatch_uid='world_graph_location_save')
+    post_delete.connect(remove_location, sender=Location, dispatch_uid='world_graph_location_delete')
+    post_save.connect(update_location_entry, sender=Location, dispatch_uid='spatial_location_save')
+    post_delete.connect(remove_location_entry, sender=Location, dispatch_uid='spatial_location_delete')
+    post_save.connect(update_npc_entry, sender=NPCSpawn, dispatch_uid='spatial_npc_spawn_save')
+    post_delete.connect(remove_npc_entry, sender=NPCSpawn, dispatch_uid='spatial_npc_spawn_delete')
+    post_save.connect(update_item_entry, sender=ItemSpawn, dispatch_uid='spatial_item_spawn_save')
+    post_delete.connect(remove_item_entry, sender=ItemSpawn, dispatch_uid='spatial_item_spawn_delete')
+    m2m_changed.connect(
+        update_connections, sender=Location.connected_locations.through, dispatch_uid='world_graph_connections',
+    )
+    for event_class in EVENT_TYPES.values():
+        subscribe(event_class, record_event, dispatch_uid=f'quest_objectives_{event_class.type}')
@@ -0,0 +1,309 @@
+"""
+Uniform-grid spatial index over map objects
+
+Two kinds of coordinate space are indexed:
+
+    ('world', world_id)        locations at x_coordinate/y_coordinate, and
+                               visible item spawns at their location
+    ('location', location_id)  NPC spawns at x_position/y_position in the
+                               location's scene
+
+Each space is a GridIndex of CELL_SIZE square buckets, loaded with one
+query on first use. A viewport or radius query walks only the cells it
+overlaps (clamped to the occupied area), so its cost and payload follow
+what is on screen rather than the size of the world.
+
+Spawn and location edits patch the loaded spaces in place (see
+signals.py); other workers reload a space when the app cache tags of the
+indexed models move after the edit commits. A process-local app cache
+never carries other processes' tag bumps, so without a shared cache a
+space is also reloaded every LOCAL_RELOAD_INTERVAL seconds.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+
+from apps.core.cache import get_cache
+
+from .models import ItemSpawn, Location, NPCSpawn, Region, World
+
+
+CELL_SIZE = 256  # Map units per grid cell; about a quarter of a typical viewport
+# Payloads also carry NPC and item names
+CACHE_TAGS = ['world.location', 'world.npcspawn', 'world.itemspawn', 'world.npc', 'core.gameitem']
+LOCAL_RELOAD_INTERVAL = 60.0  # Seconds; only used when the app cache is process-local
+
+Space = Tuple[str, int]
+SPACE_MODELS = {'world': World, 'location': Location}
+
+
+class GridIndex:
+    """Points bucketed by grid cell, with the payload returned by queries"""
+    
+    def __init__(self, cell_size: float = CELL_SIZE, version=None):
+        self.cell_size = cell_size
+        self.version = version
+        self.cells: Dict[Tuple[int, int], Dict[Tuple[str, int], dict]] = defaultdict(dict)
+        self.positions: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+    
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+    
+    def insert(self, kind: str, pk: int, x: float, y: float, payload: dict):
+        """Add or move an entry"""
+        key = (kind, pk)
+        entry = dict(payload, kind=kind, id=pk, x=x, y=y)
+        with self._lock:
+            self._remove(key)
+            cell = self._cell(x, y)
+            self.cells[cell][key] = entry
+            self.positions[key] = cell
+    
+    def _remove(self, key):
+        cell = self.positions.pop(key, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            bucket.pop(key, None)
+            if not bucket:
+                del self.cells[cell]
+    
+    def remove(self, kind: str, pk: int):
+        with self._lock:
+            self._remove((kind, pk))
+    
+    def __contains__(self, key) -> bool:
+        return key in self.positions
+    
+    def __len__(self):
+        return len(self.positions)
+    
+    def _cells_in(self, x0: float, y0: float, x1: float, y1: float):
+        if not self.cells:
+            return []
+        low_x, low_y = self._cell(min(x0, x1), min(y0, y1))
+        high_x, high_y = self._cell(max(x0, x1), max(y0, y1))
+        if (high_x - low_x + 1) * (high_y - low_y + 1) > len(self.cells):
+            # Viewport larger than the occupied area: walk the occupied cells instead
+            return [
+                cell for cell in list(self.cells)
+                if low_x <= cell[0] <= high_x and low_y <= cell[1] <= high_y
+            ]
+        return [
+            (cx, cy) for cx in range(low_x, high_x + 1) for cy in range(low_y, high_y + 1)
+            if (cx, cy) in self.cells
+        ]
+    
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float, kinds: Optional[Iterable[str]] = None) -> List[dict]:
+        """Entries inside the rectangle (edges included)"""
+        kinds = set(kinds) if kinds else None
+        left, right, top, bottom = min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+        found = []
+        for cell in self._cells_in(x0, y0, x1, y1):
+            for entry in list(self.cells.get(cell, {}).values()):
+                if (kinds is None or entry['kind'] in kinds) and left <= entry['x'] <= right and top <= entry['y'] <= bottom:
+                    found.append(entry)
+        return found
+    
+    def query_radius(self, x: float, y: float, radius: float, kinds: Optional[Iterable[str]] = None) -> List[dict]:
+        """Entries within radius of (x, y), nearest first, each with its distance"""
+        found = []
+        for entry in self.query_rect(x - radius, y - radius, x + radius, y + radius, kinds):
+            distance = math.hypot(entry['x'] - x, entry['y'] - y)
+            if distance <= radius:
+                found.append(dict(entry, distance=distance))
+        found.sort(key=lambda entry: entry['distance'])
+        return found
+
+
+def _location_payload(row) -> dict:
+    return {'name': row['name'], 'location_type': row['location_type'], 'map_icon': row['map_icon']}
+
+
+def _npc_payload(row) -> dict:
+    return {
+        'npc': row['npc_id'], 'name': row['npc__name'], 'sprite_name': row['npc__sprite_name'],
+        'movement_pattern': row['movement_pattern'],
+    }
+
+
+def _item_payload(row) -> dict:
+    return {
+        'item': row['item_id'], 'name': row['item__name'], 'quantity': row['quantity'],
+        'location': row['location_id'],
+    }
+
+
+LOCATION_FIELDS = ('pk', 'x_coordinate', 'y_coordinate', 'name', 'location_type', 'map_icon')
+NPC_FIELDS = ('pk', 'x_position', 'y_position', 'npc_id', 'npc__name', 'npc__sprite_name', 'movement_pattern')
+ITEM_FIELDS = ('pk', 'location__x_coordinate', 'location__y_coordinate', 'item_id', 'item__name', 'quantity', 'location_id')
+
+
+def load_space(space: Space, version=None) -> GridIndex:
+    kind, pk = space
+    index = GridIndex(version=version)
+    if kind == 'world':
+        for row in Location.objects.filter(region__world_id=pk).values(*LOCATION_FIELDS):
+            index.insert('location', row['pk'], row['x_coordinate'], row['y_coordinate'], _location_payload(row))
+        for row in ItemSpawn.objects.filter(location__region__world_id=pk, is_hidden=False).values(*ITEM_FIELDS):
+            index.insert(
+                'item', row['pk'], row['location__x_coordinate'], row['location__y_coordinate'], _item_payload(row),
+            )
+    elif kind == 'location':
+        for row in NPCSpawn.objects.filter(location_id=pk).values(*NPC_FIELDS):
+            index.insert('npc', row['pk'], row['x_position'], row['y_position'], _npc_payload(row))
+    else:
+        raise ValueError(f"Unknown spatial space: {kind}")
+    return index
+
+
+_spaces: Dict[Space, GridIndex] = {}
+_spaces_lock = threading.Lock()
+
+
+def _version():
+    cache = get_cache()
+    version = cache.tag_versions(CACHE_TAGS)
+    if not cache.shared:
+        # Other processes' tag bumps never arrive; expire on a clock instead
+        return version, int(time.monotonic() // LOCAL_RELOAD_INTERVAL)
+    return version
+
+
+def get_spatial_index(kind: str, pk: int) -> Optional[GridIndex]:
+    """
+    The index of a world map or location scene, or None if there is no such world or location
+    
+    Loaded on first use and reloaded after edits made elsewhere. Only
+    existing worlds and locations get a space, so arbitrary ids cannot
+    grow the set of loaded spaces.
+    """
+    if kind not in SPACE_MODELS:
+        raise ValueError(f"Unknown spatial space: {kind}")
+    version = _version()
+    index = _spaces.get((kind, pk))
+    if index is None or index.version != version:
+        if not SPACE_MODELS[kind].objects.filter(pk=pk).exists():
+            with _spaces_lock:
+                _spaces.pop((kind, pk), None)
+            return None
+        index = load_space((kind, pk), version)
+        with _spaces_lock:
+            _spaces[(kind, pk)] = index
+    return index
+
+
+def _keep_version(indexes: List[GridIndex], using: str):
+    # Once the edit commits the cache tags move on; these indexes already have it
+    def sync():
+        version = _version()
+        for index in indexes:
+            index.version = version
+    if indexes:
+        transaction.on_commit(sync, using=using)
+
+
+def _loaded(kind: str, pk) -> Optional[GridIndex]:
+    return _spaces.get((kind, pk)) if pk is not None else None
+
+
+def _world_of_region(region_id: int, using: str) -> Optional[int]:
+    return Region.objects.using(using).filter(pk=region_id).values_list('world_id', flat=True).first()
+
+
+def update_location_entry(sender, instance, raw=False, using=None, **kwargs):
+    """post_save on Location: move it (and the items spawning there) on its world map"""
+    if raw or not _spaces:
+        return
+    world_id = _world_of_region(instance.region_id, using)
+    patched = []
+    for (kind, space_pk), index in list(_spaces.items()):
+        if kind != 'world':
+            continue
+        if space_pk == world_id:
+            row = {field: getattr(instance, field) for field in ('name', 'location_type', 'map_icon')}
+            index.insert('location', instance.pk, instance.x_coordinate, instance.y_coordinate, _location_payload(row))
+        elif ('location', instance.pk) in index:
+            index.remove('location', instance.pk)
+        else:
+            continue
+        patched.append(index)
+    # Item spawns sit at their location's position
+    items = list(ItemSpawn.objects.using(using).filter(location=instance, is_hidden=False).values(*ITEM_FIELDS)) if patched else []
+    for index in patched:
+        for row in items:
+            index.remove('item', row['pk'])
+            if index is _spaces.get(('world', world_id)):
+                index.insert('item', row['pk'], instance.x_coordinate, instance.y_coordinate, _item_payload(row))
+    _keep_version(patched, using)
+
+
+def remove_location_entry(sender, instance, using=None, **kwargs):
+    """post_delete on Location: drop it from the world maps and its scene index"""
+    patched = []
+    for (kind, space_pk), index in list(_spaces.items()):
+        if kind == 'world' and ('location', instance.pk) in index:
+            index.remove('location', instance.pk)
+            patched.append(index)
+    with _spaces_lock:
+        _spaces.pop(('location', instance.pk), None)
+    _keep_version(patched, using)
+
+
+def update_npc_entry(sender, instance, raw=False, using=None, **kwargs):
+    """post_save on NPCSpawn: place it in its location's scene index"""
+    if raw:
+        return
+    patched = []
+    for (kind, space_pk), index in list(_spaces.items()):
+        if kind == 'location' and (space_pk == instance.location_id or ('npc', instance.pk) in index):
+            index.remove('npc', instance.pk)
+            patched.append(index)
+    index = _loaded('location', instance.location_id)
+    if index is not None:
+        row = NPCSpawn.objects.using(using).filter(pk=instance.pk).values(*NPC_FIELDS).first()
+        if row is not None:
+            index.insert('npc', row['pk'], row['x_position'], row['y_position'], _npc_payload(row))
+    _keep_version(patched, using)
+
+
+def remove_npc_entry(sender, instance, using=None, **kwargs):
+    index = _loaded('location', instance.location_id)
+    if index is not None:
+        index.remove('npc', instance.pk)
+        _keep_version([index], using)
+
+
+def update_item_entry(sender, instance, raw=False, using=None, **kwargs):
+    """post_save on ItemSpawn: place it (unless hidden) on its location's world map"""
+    if raw:
+        return
+    patched = [
+        index for (kind, _), index in list(_spaces.items())
+        if kind == 'world' and ('item', instance.pk) in index
+    ]
+    for index in patched:
+        index.remove('item', instance.pk)
+    if not instance.is_hidden and any(kind == 'world' for kind, _ in list(_spaces)):
+        row = ItemSpawn.objects.using(using).filter(pk=instance.pk).values(*ITEM_FIELDS, 'location__region__world_id').first()
+        index = _loaded('world', row['location__region__world_id']) if row else None
+        if index is not None:
+            index.insert(
+                'item', row['pk'], row['location__x_coordinate'], row['location__y_coordinate'], _item_payload(row),
+            )
+            patched.append(index)
+    _keep_version(patched, using)
+
+
+def remove_item_entry(sender, instance, using=None, **kwargs):
+    patched = [
+        index for (kind, _), index in list(_spaces.items())
+        if kind == 'world' and ('item', instance.pk) in index
+    ]
+    for index in patched:
+        index.remove('item', instance.pk)
+    _keep_version(patched, using)
@@ -2,6 +2,9 @@
 ASGI config for pyrealm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections go to the battle socket
+(``/ws/battles/<id>/``). Serve it with an ASGI server, e.g.
+``uvicorn pyrealm.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -13,4 +16,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pyrealm.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Import after Django is set up
+from apps.battles.consumers import BattleSocket  # noqa: E402
+
+battle_socket = BattleSocket()
+
+
+async def application(scope, receive, send):
+    """Route by protocol: WebSockets to the battle socket, everything else to Django"""
+    if scope['type'] == 'websocket':
+        await battle_socket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -67,6 +67,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.core.middleware.ReplicaPinningMiddleware',
+    'apps.core.middleware.PlayerShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,13 +97,85 @@ WSGI_APPLICATION = 'pyrealm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# apps.core.db is Django's SQLite backend with per-connection pragmas (WAL,
+# busy timeout, ...) and BEGIN IMMEDIATE transactions; see apps/core/db/base.py
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'apps.core.db',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': env('SQLITE_SYNCHRONOUS', default='NORMAL'),
+                'busy_timeout': env.int('SQLITE_BUSY_TIMEOUT', default=5000),  # Milliseconds
+                'mmap_size': env.int('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024),
+                'cache_size': env.int('SQLITE_CACHE_SIZE', default=-64 * 1024),  # KiB when negative
+            },
+            'transaction_mode': 'IMMEDIATE',
+            'begin_retries': 5,
+        },
     }
 }
 
+# Read replicas (see apps/core/routers.py). Locally each replica can be a
+# SQLite file refreshed from the primary with `manage.py sync_sqlite_replicas`.
+# Replicas are query_only, so their transactions must not BEGIN IMMEDIATE
+# (that takes the write lock and fails on a read-only connection).
+# read_uncommitted only matters for shared-cache connections: in tests the
+# replica mirrors the in-memory primary and would otherwise block on the
+# test case's open transaction.
+REPLICA_DATABASE_OPTIONS = {
+    **DATABASES['default']['OPTIONS'],
+    'pragmas': {**DATABASES['default']['OPTIONS']['pragmas'], 'query_only': 1, 'read_uncommitted': 1},
+    'transaction_mode': 'DEFERRED',
+}
+DATABASE_REPLICAS = []
+for index, replica_path in enumerate(env.list('SQLITE_REPLICAS', default=[])):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / replica_path,
+        'OPTIONS': REPLICA_DATABASE_OPTIONS,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Player shards (see apps/core/sharding.py). Player-owned rows are spread
+# over these databases by player id; 'default' stays the catalog database.
+# Move players between them with `manage.py rebalance_players`.
+PLAYER_SHARDS = []
+for index, shard_path in enumerate(env.list('SQLITE_SHARDS', default=[])):
+    alias = f'shard{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': BASE_DIR / shard_path}
+    PLAYER_SHARDS.append(alias)
+
+DATABASE_ROUTERS = ['apps.core.routers.PlayerShardRouter', 'apps.core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5  # Keep a client on the primary this long after it writes
+
+# Memory-mapped snapshot of lessons, enemies, world, ... shared by all workers
+# on a node (see apps/core/catalog.py). Build it once with `manage.py build_catalog`.
+CONTENT_CATALOG = {
+    'PATH': env('CONTENT_CATALOG_PATH', default=str(BASE_DIR / 'catalog.snapshot')),
+    'CHECK_INTERVAL': env.float('CONTENT_CATALOG_CHECK_INTERVAL', default=2.0),  # Seconds between version checks
+}
+
+# Two-tier application cache: per-process LRU in front of a shared backend
+# (see apps/core/cache.py). For several workers on a node use
+# apps.core.cache.SQLiteCacheBackend; DjangoCacheBackend wraps a CACHES alias.
+# A process-local backend refuses to start with WORKERS > 1, since invalidations
+# would never reach the other workers.
+APP_CACHE = {
+    'BACKEND': env('APP_CACHE_BACKEND', default='apps.core.cache.LocalCacheBackend'),
+    'WORKERS': env.int('WEB_CONCURRENCY', default=1),  # Worker processes per node (as gunicorn/uvicorn read it)
+    'OPTIONS': {'path': env('APP_CACHE_PATH')} if env('APP_CACHE_PATH', default=None) else {},
+    'LOCAL_MAX_ENTRIES': env.int('APP_CACHE_LOCAL_MAX_ENTRIES', default=1000),
+    'LOCAL_TTL': env.float('APP_CACHE_LOCAL_TTL', default=5.0),  # Seconds a worker trusts its local copy
+    'TAG_TTL': env.float('APP_CACHE_TAG_TTL', default=1.0),  # Seconds between tag version checks
+    'DEFAULT_TIMEOUT': env.int('APP_CACHE_DEFAULT_TIMEOUT', default=300),
+    'EARLY_REFRESH_BETA': env.float('APP_CACHE_EARLY_REFRESH_BETA', default=1.0),  # >1 refreshes earlier
+    'LOCK_TIMEOUT': env.float('APP_CACHE_LOCK_TIMEOUT', default=10.0),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -182,3 +256,30 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+
+# Battle session store (write-behind state for active battles)
+# Use 'apps.battles.sessions.SQLiteSessionBackend' to share sessions between workers;
+# it is also required for `manage.py flush_battle_sessions` (and --all crash recovery).
+# With the local backend each worker flushes its own sessions on a background thread.
+BATTLE_SESSION_STORE = {
+    'BACKEND': env('BATTLE_SESSION_BACKEND', default='apps.battles.sessions.LocalSessionBackend'),
+    'OPTIONS': {},
+    'FLUSH_INTERVAL': 5.0,  # Seconds
+    'LOCK_TIMEOUT': 10.0,  # Seconds an action waits for (and may hold) a battle's session lock
+}
+
+# Channel layer used to fan battle messages out to WebSocket clients
+BATTLE_CHANNEL_LAYER = {
+    'BACKEND': 'apps.battles.channel_layer.InMemoryChannelLayer',
+    'OPTIONS': {'capacity': 100},
+}
+
+# PvP matchmaking (ratings are player levels)
+PVP_MATCHMAKING = {
+    'BACKEND': 'apps.battles.matchmaking.LocalMatchmakingBackend',
+    'OPTIONS': {'bucket_size': 1},
+    'BASE_WINDOW': 1,
+    'WIDEN_PER_SECOND': 0.1,  # The window grows by one level every 10 seconds
+    'MAX_WINDOW': 10,
+    'SWEEP_INTERVAL': 1.0,  # Seconds
+}